@@ -0,0 +1,83 @@
+"""
+Parse time per JSON parser backend.
+
+Each fixture is scaled up to a large document by repeating its content
+in an array, then parsed with every installed parser.
+
+Usage: python benchmark.py [-s sizeMB] [-r repeats] [fixture ...]
+   fixture   JSON files to scale, default the chapter fixtures
+"""
+from argparse import ArgumentParser
+from glob import glob
+from time import time
+import json
+import os.path
+from jsonparser import availableParsers, getParser
+
+# chapter fixtures, relative to this file
+ROOT = os.path.join (os.path.dirname (os.path.abspath (__file__)),
+  "..", "..", "..")
+FIXTURES = ["chapter3/*Valid.json", "chapter6/*Valid.json",
+  "chapter9/inventory.json"]
+
+def scale (file, size):
+    """
+    Build a document of about size bytes from a fixture.
+    Args:
+        file Fixture file.
+        size Target size in bytes.
+    Returns:
+        Document as bytes.
+    """
+    content = json.loads (open (file, "rb").read ().decode ("utf8"))
+    items = content if isinstance (content, list) else [content]
+    unit = len (json.dumps (items))
+    copies = max (1, size // max (unit, 1))
+    return json.dumps (items * copies).encode ("utf8")
+
+def measure (parser, data, repeats):
+    """ Best parse time of repeated runs, in seconds. """
+    best = None
+    for repeat in range (repeats):
+        start = time ()
+        parser.loads (data)
+        elapsed = time () - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def main ():
+    """ Parse arguments and run benchmark. """
+    parser = ArgumentParser (prog="benchmark")
+    parser.add_argument ("fixtures", nargs="*",
+      help="JSON files to scale, default the chapter fixtures")
+    parser.add_argument ("-s", "--size", type=float, default=20,
+      help="Scaled document size in MB")
+    parser.add_argument ("-r", "--repeats", type=int, default=3,
+      help="Runs per parser, best time reported")
+    args = parser.parse_args ()
+
+    files = args.fixtures
+    if len (files) == 0:
+        for pattern in FIXTURES:
+            files.extend (sorted (glob (os.path.join (ROOT, pattern))))
+
+    names = availableParsers ()
+    print ("%-28s %8s  %s" % ("fixture", "MB",
+      "  ".join ("%11s" % name for name in names)))
+    totals = dict ((name, 0.0) for name in names)
+    for file in files:
+        data = scale (file, int (args.size * 1024 * 1024))
+        row = []
+        for name in names:
+            elapsed = measure (getParser (name), data, args.repeats)
+            totals[name] += elapsed
+            row.append ("%10.3fs" % elapsed)
+        print ("%-28s %8.1f  %s" % (os.path.basename (file),
+          len (data) / 1048576.0, "  ".join (row)))
+
+    print ("%-28s %8s  %s" % ("total", "",
+      "  ".join ("%10.3fs" % totals[name] for name in names)))
+
+if __name__ == "__main__":
+    main ()
@@ -0,0 +1,135 @@
+"""
+JSON parser selection.
+
+Parses JSON with the fastest installed backend (orjson, ujson or
+simdjson), falling back to the standard library json module. Errors are
+normalized: when a backend rejects content it is parsed again with the
+json module, so error messages always report line and column, and
+content accepted by the json module (such as NaN) is never rejected by
+a stricter backend. Note orjson reads integers beyond 64 bits as floats.
+
+getParser - Get a parser by name, or the fastest available
+availableParsers - List names of installed parsers
+loads - Parse JSON text with a parser
+"""
+import json
+
+# backends in order of preference
+PARSERS = ("orjson", "simdjson", "ujson", "json")
+
+class JsonParseError (ValueError):
+    """
+    Error definition thrown when JSON content is not valid.
+    Args:
+        msg: Error description
+        line: Line number of error
+        column: Column number of error
+        pos: Character position of error
+    """
+    def __init__ (self, msg, line, column, pos):
+        super (JsonParseError, self).__init__ (
+          "%s: line %d column %d (char %d)" % (msg, line, column, pos))
+        self.msg = msg
+        self.line = line
+        self.column = column
+        self.pos = pos
+
+class Parser:
+    """
+    JSON parser backend.
+    Args:
+        name: Backend name
+        backendLoads: Backend function to parse text or bytes
+    """
+    def __init__ (self, name, backendLoads):
+        self.name = name
+        self.backendLoads = backendLoads
+
+    def loads (self, data):
+        """
+        Parse JSON text.
+        Args:
+            data (str or bytes): JSON text.
+        Returns:
+            Parsed content.
+        Raises:
+            JsonParseError
+        """
+        try:
+            return self.backendLoads (data)
+        except JsonParseError:
+            raise
+        except ValueError:
+            # parse with json module for its result or error position
+            return _stdlibLoads (data)
+
+def _stdlibLoads (data):
+    """ Parse with json module, raising JsonParseError. """
+    try:
+        if isinstance (data, bytes) and not isinstance (data, str):
+            data = data.decode ("utf8")
+        return json.loads (data)
+    except UnicodeDecodeError as e:
+        raise JsonParseError ("Invalid UTF-8 content", 1, 1, e.start)
+    except ValueError as e:
+        if hasattr (e, "lineno"):
+            raise JsonParseError (e.msg, e.lineno, e.colno, e.pos)
+        # Python 2 json errors carry position in the message only
+        raise JsonParseError (str (e), 0, 0, 0)
+
+# parsers and backend loads functions, by name, once imported
+_parsers = {}
+_backends = { "json": _stdlibLoads }
+
+def _loadBackend (name):
+    """
+    Import a backend, once only.
+    Returns:
+        Backend loads function, or None if not installed.
+    """
+    if name not in _backends:
+        try:
+            _backends[name] = getattr (__import__ (name), "loads", None)
+        except ImportError:
+            _backends[name] = None
+    return _backends[name]
+
+def availableParsers ():
+    """ List names of installed parsers, fastest first. """
+    return [name for name in PARSERS if _loadBackend (name) is not None]
+
+def getParser (name=None):
+    """
+    Get a parser.
+    Args:
+        name (str): Parser name, or None for the fastest available.
+    Returns:
+        Parser
+    Raises:
+        ValueError if the named parser is unknown or not installed.
+    """
+    if name is None:
+        for name in PARSERS:
+            if _loadBackend (name) is not None:
+                break
+    if name not in _parsers:
+        if name not in PARSERS:
+            raise ValueError ("Unknown JSON parser " + name)
+        backendLoads = _loadBackend (name)
+        if backendLoads is None:
+            raise ValueError ("JSON parser " + name + " is not installed")
+        _parsers[name] = Parser (name, backendLoads)
+    return _parsers[name]
+
+def loads (data, parser=None):
+    """
+    Parse JSON text.
+    Args:
+        data (str or bytes): JSON text.
+        parser (str): Parser name, or None for the fastest available.
+    Returns:
+        Parsed content.
+    Raises:
+        JsonParseError
+    """
+    return getParser (parser).loads (data)
@@ -1,17 +1,35 @@
 """
-Read a file and determine if content is valid JSON syntax.
+Read files and determine if content is valid JSON syntax.
+
+Usage: jsonsyntax [-s] [-m MB] [-j jobs] [-p parser] path [path ...]
+   path   JSON file, or directory of .json files, to check syntax of
+   -s     Syntax only check as strict JSON, files are scanned in
+          chunks without building the content
+   -m     Opt in for -s to parse files up to MB in full, default 0
+   -j     Number of processes used to check multiple files
+   -p     JSON parser (orjson, simdjson, ujson, json), default fastest
 
-Usage: jsonsyntax file
-   file   JSON file to check syntax of
-   
 Exit code
   exit code: 0 for success, 1 for failure.
 """
 
 # import modules
+from argparse import ArgumentParser
+from multiprocessing import Pool
+import codecs
+import json
 import sys
+import os
 import os.path
-import json
+import re
+from jsonparser import getParser, availableParsers, PARSERS
+
+# bytes read per chunk by the syntax only scan. Small chunks keep the
+# regular expression engine state small, and are faster than large ones.
+CHUNK_SIZE = 64 * 1024
+# largest file checked by a full parse in the syntax only check, 0 so
+# all files are scanned in chunks and memory use does not depend on size
+SCAN_THRESHOLD = 0
 
 class CheckSyntaxError (Exception):
     """
@@ -19,22 +37,27 @@ class CheckSyntaxError (Exception):
     - error code 1: Invalid name
     - error code 2: File does not exist
     - error code 3: Error reading file
-    - error code 4: JSON syntax error 
+    - error code 4: JSON syntax error
 
     Args:
         code: Error number
         message: Text message, suitable for display
+        line: Line of syntax error, if known
+        column: Column (in bytes) of syntax error, if known
     """
-    def __init__ (self, code, message):
+    def __init__ (self, code, message, line=None, column=None):
         self.code = code;
         self.message = message;
+        self.line = line;
+        self.column = column;
 
-def checkSyntax (file):
+def checkSyntax (file, parser=None):
     """
     Check syntax of file passed in command line argument.
 
     Args:
         file File to check
+        parser Name of JSON parser, None for fastest available
 
     Raises:
         CheckSyntaxError
@@ -49,36 +72,460 @@ def checkSyntax (file):
 
     # read specified file
     try:
-        data = open (file).read ()
+        data = open (file, "rb").read ()
     except IOError as e:
         raise CheckSyntaxError (3, "Error reading file: " + e.strerror)
 
     # parse the data as JSON
     try:
-        json.loads (data)
+        getParser (parser).loads (data)
     except ValueError as e:
-        raise CheckSyntaxError (4, str (e.args));
+        raise CheckSyntaxError (4, str (e), getattr (e, "line", None),
+          getattr (e, "column", None));
 
-def main ():
+def scanSyntax (file, chunkSize=CHUNK_SIZE, threshold=SCAN_THRESHOLD):
     """
-    Main - parse file name from command and call syntax check.
+    Check syntax of file as strict JSON in UTF-8. The file is read in
+    chunks of bytes and tokenized, tracking only the nesting of arrays
+    and objects, without building the content, so memory use does not
+    depend on file size. Runs of values up to a few levels deep are
+    consumed by one regular expression match each.
+
+    A threshold opts in to parsing files up to that size in full by the
+    fastest strict parser instead, which holds the file and the content
+    built from it. Content the parser rejects is scanned too, for the
+    error position, so results and errors are the same either way.
+
+    Args:
+        file File to check
+        chunkSize Bytes to read at a time
+        threshold Largest file size in bytes parsed in full, 0 for none
+
+    Raises:
+        CheckSyntaxError
     """
-    # if wrong number of arguments, print usage message and exit
-    if (len (sys.argv) != 2):
-        print ("Usage: jsonsyntax fileName")
-        print ("  fileName   JSON file to check syntax of")
-        sys.exit (1)
+    # verify file provided
+    if (file == None):
+        raise CheckSyntaxError (1, "Invalid name")
+
+    # verify file exists
+    if (os.path.isfile (file) == False):
+        raise CheckSyntaxError (2, "File not found")
+
+    # parse specified file if opted in and small enough, else scan it
+    try:
+        if (threshold > 0 and os.path.getsize (file) <= threshold and
+            _parses (file)):
+            return
+        with open (file, "rb") as f:
+            _Scanner (f, chunkSize).scan ()
+    except (IOError, OSError) as e:
+        raise CheckSyntaxError (3, "Error reading file: " + e.strerror)
 
-    # check syntax, displaying result message. Exit with success/fail code.
+def _parses (file):
+    """
+    Parse a file with the fastest strict parser: orjson, or the json
+    module rejecting NaN and Infinity, from UTF-8.
+    Returns:
+        True if valid, False if rejected, for any reason.
+    """
+    with open (file, "rb") as f:
+        data = f.read ()
     try:
-        # assign command line argument to file name
-        file = sys.argv[1]
-        checkSyntax (file);
-        print ("File contains valid JSON content.")
-        sys.exit (0); 
+        if "orjson" in availableParsers ():
+            getParser ("orjson").backendLoads (data)
+        else:
+            json.loads (data.decode ("utf8"), parse_constant=_rejectConstant)
+    except (ValueError, RuntimeError):
+        # includes encoding errors and nesting too deep for the parser
+        return False
+    return True
+
+def _rejectConstant (name):
+    """ Reject NaN and Infinity, not strict JSON. """
+    raise ValueError ("Invalid constant " + name)
+
+# token patterns, as bytes. Strings are written as an unrolled loop so
+# the regular expression engine scans plain characters in one repeat.
+_WS = br"[ \t\n\r]*"
+_CHARS = br'[^"\\\x00-\x1f]*'
+_ESCAPE = br'\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4})'
+_STRING = br'"' + _CHARS + br"(?:" + _ESCAPE + _CHARS + br')*"'
+_STRING_PREFIX = (br'"' + _CHARS + br"(?:" + _ESCAPE + _CHARS + br")*" +
+  br"(?:\\(?:u[0-9a-fA-F]{0,3})?)?")
+_NUMBER = br"-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?"
+# scalar with a lookahead, so a number at a chunk end is never accepted
+_SCALAR = (br"(?:" + _STRING + br"|true|false|null|" + _NUMBER +
+  br"(?=[ \t\n\r,\]}]))")
+
+def _sequence (value):
+    """ Pattern for comma separated values. """
+    return value + br"(?:" + _WS + br"," + _WS + value + br")*"
+
+def _members (value):
+    """ Pattern for comma separated object members. """
+    return _sequence (_STRING + _WS + br":" + _WS + value)
+
+# depth of arrays and objects consumed by one match of a run, deeper
+# values are scanned token by token. Each level doubles the pattern
+# size, and three levels is fastest for both nested and flat documents.
+_RUN_DEPTH = 3
+
+def _nested (depth):
+    """ Pattern for a value of arrays and objects up to a depth. """
+    value = _SCALAR
+    for level in range (depth):
+        array = br"\[" + _WS + br"(?:" + _sequence (value) + _WS + br")?\]"
+        obj = br"\{" + _WS + br"(?:" + _members (value) + _WS + br")?\}"
+        value = br"(?:" + _SCALAR + br"|" + array + br"|" + obj + br")"
+    return value
+
+_wsMatch = re.compile (_WS).match
+_stringMatch = re.compile (_STRING).match
+_stringPrefixMatch = re.compile (_STRING_PREFIX).match
+_numberMatch = re.compile (_NUMBER).match
+_numberCharsMatch = re.compile (br"[-+.eE0-9]*").match
+# runs of array values and object members, consumed in one match,
+# compiled on first scan so importing the module stays fast
+_runMatches = []
+
+def _getRunMatches ():
+    """ Match functions for runs of array values and object members. """
+    if len (_runMatches) == 0:
+        value = _nested (_RUN_DEPTH)
+        _runMatches.append (re.compile (_sequence (value)).match)
+        _runMatches.append (re.compile (_members (value)).match)
+    return _runMatches
+
+_LITERALS = (b"true", b"false", b"null")
+
+# scanner states, the next item expected
+_VALUE = 0
+_ARRAY_FIRST = 1
+_ARRAY_VALUE = 2
+_OBJECT_FIRST = 3
+_OBJECT_KEY = 4
+_AFTER_VALUE = 5
+_END = 6
+
+class _Truncated (Exception):
+    """ Token continues past the end of the buffer. """
+
+class _Scanner:
+    """
+    Streaming syntax scanner, a tokenizer driving a pushdown automaton
+    whose stack holds only the container types.
+    Args:
+        f File opened in binary mode.
+        chunkSize Bytes to read at a time.
+    """
+    def __init__ (self, f, chunkSize):
+        self.f = f
+        self.chunkSize = chunkSize
+        self.buf = b""
+        self.eof = False
+        self.decoder = codecs.getincrementaldecoder ("utf8") ()
+        self.badEncoding = None
+        # position of buffer start, for line and column
+        self.offset = 0
+        self.lines = 0
+        self.lineStart = 0
+        self.arrayRunMatch, self.memberRunMatch = _getRunMatches ()
+
+    def scan (self):
+        """ Scan the file. Raises CheckSyntaxError. """
+        buf = b""
+        pos = 0
+        state = _VALUE
+        stack = bytearray ()
+        while True:
+            try:
+                while state != _END:
+                    state, pos = self.step (buf, pos, state, stack)
+                break
+            except _Truncated:
+                pos = self.refill (pos)
+                buf = self.buf
+
+        if self.badEncoding is not None:
+            self.error (self.badEncoding, "Invalid UTF-8 content")
+
+    def step (self, buf, pos, state, stack):
+        """
+        Consume the next token, or run of tokens, for the state.
+        Returns:
+            Tuple of (state, pos) after the tokens.
+        """
+        pos = _wsMatch (buf, pos).end ()
+
+        if state == _ARRAY_VALUE:
+            run = self.arrayRunMatch (buf, pos)
+            if run is not None:
+                return _AFTER_VALUE, run.end ()
+            state = _VALUE
+        elif state == _OBJECT_KEY:
+            run = self.memberRunMatch (buf, pos)
+            if run is not None:
+                return _AFTER_VALUE, run.end ()
+
+        token, start, end = self.token (buf, pos)
+
+        if state == _VALUE:
+            if token == b"[":
+                stack.append (91)
+                return _ARRAY_FIRST, end
+            if token == b"{":
+                stack.append (123)
+                return _OBJECT_FIRST, end
+            if token == b'"' or token == b"0":
+                return _AFTER_VALUE, end
+            self.error (start, "Expecting value")
+
+        if state == _ARRAY_FIRST:
+            if token == b"]":
+                stack.pop ()
+                return _AFTER_VALUE, end
+            return _ARRAY_VALUE, pos
+
+        if state == _OBJECT_FIRST:
+            if token == b"}":
+                stack.pop ()
+                return _AFTER_VALUE, end
+            state = _OBJECT_KEY
+
+        if state == _OBJECT_KEY:
+            if token != b'"':
+                self.error (start, "Expecting property name enclosed in " +
+                  "double quotes")
+            token, start, end = self.token (buf, end)
+            if token != b":":
+                self.error (start, "Expecting ':' delimiter")
+            return _VALUE, end
+
+        # after value, expect separator or close for the container
+        if len (stack) == 0:
+            if token != b"":
+                self.error (start, "Extra data")
+            return _END, end
+        if stack[-1] == 91:
+            if token == b",":
+                return _ARRAY_VALUE, end
+            if token == b"]":
+                stack.pop ()
+                return _AFTER_VALUE, end
+        else:
+            if token == b",":
+                return _OBJECT_KEY, end
+            if token == b"}":
+                stack.pop ()
+                return _AFTER_VALUE, end
+        self.error (start, "Expecting ',' delimiter")
+
+    def token (self, buf, pos):
+        """
+        Read one token after optional whitespace.
+        Returns:
+            Tuple of (token, start, end). Token is the punctuation
+            character, '"' for strings, "0" for numbers and literals,
+            empty at end of data, or the unexpected character.
+        Raises:
+            _Truncated if more data is needed to complete the token.
+        """
+        pos = _wsMatch (buf, pos).end ()
+        if pos == len (buf):
+            if self.eof:
+                return b"", pos, pos
+            raise _Truncated ()
+
+        c = buf[pos:pos + 1]
+        if c in b"[]{},:":
+            return c, pos, pos + 1
+
+        if c == b'"':
+            match = _stringMatch (buf, pos)
+            if match is not None:
+                return c, pos, match.end ()
+            end = _stringPrefixMatch (buf, pos).end ()
+            if end == len (buf) and not self.eof:
+                raise _Truncated ()
+            if end == len (buf) and self.badEncoding is None:
+                self.error (pos, "Unterminated string")
+            self.error (end, "Invalid string content")
+
+        if c in b"-0123456789":
+            if (_numberCharsMatch (buf, pos).end () == len (buf) and
+                not self.eof):
+                raise _Truncated ()
+            match = _numberMatch (buf, pos)
+            if match is None:
+                self.error (pos, "Invalid number")
+            return b"0", pos, match.end ()
+
+        for literal in _LITERALS:
+            if buf.startswith (literal, pos):
+                return b"0", pos, pos + len (literal)
+            if not self.eof and literal.startswith (buf[pos:]):
+                raise _Truncated ()
+        return c, pos, pos + 1
+
+    def refill (self, pos):
+        """
+        Discard consumed data and read the next chunk.
+        Returns:
+            Position of unconsumed data in the new buffer.
+        Raises:
+            CheckSyntaxError at end of data.
+        """
+        if self.eof:
+            self.error (len (self.buf), "Unexpected end of data")
+
+        # track line of discarded content
+        buf = self.buf
+        newlines = buf.count (b"\n", 0, pos)
+        if newlines > 0:
+            self.lines += newlines
+            self.lineStart = self.offset + buf.rfind (b"\n", 0, pos) + 1
+        self.offset += pos
+        buf = buf[pos:]
+
+        # grow reads for a token longer than a chunk, so it is not
+        # rescanned once per chunk
+        chunk = self.f.read (max (self.chunkSize, len (buf)))
+        if len (chunk) == 0:
+            self.eof = True
+
+        # verify encoding, ending data at the first invalid byte
+        pending = len (self.decoder.getstate ()[0])
+        try:
+            self.decoder.decode (chunk, self.eof)
+        except UnicodeDecodeError as e:
+            bad = len (buf) - pending + e.start
+            chunk = chunk[0:max (0, bad - len (buf))]
+            self.badEncoding = bad
+            self.eof = True
+
+        self.buf = buf + chunk
+        return 0
+
+    def error (self, pos, message):
+        """
+        Raise syntax error for a position in the buffer.
+        Raises:
+            CheckSyntaxError
+        """
+        if self.badEncoding is not None and pos >= self.badEncoding:
+            pos = self.badEncoding
+            message = "Invalid UTF-8 content"
+
+        buf = self.buf
+        newlines = buf.count (b"\n", 0, pos)
+        line = self.lines + newlines + 1
+        if newlines > 0:
+            column = pos - buf.rfind (b"\n", 0, pos)
+        else:
+            column = self.offset + pos - self.lineStart + 1
+        raise CheckSyntaxError (4, "%s: line %d column %d" %
+          (message, line, column), line, column)
+
+def checkFiles (paths, scan=False, jobs=None, parser=None,
+  threshold=SCAN_THRESHOLD):
+    """
+    Check syntax of files, and .json files within directories, using a
+    pool of processes when more than one file is checked.
+
+    Args:
+        paths Files and directories to check
+        scan True for syntax only check, False for full parse
+        jobs Number of processes, defaults to number of CPUs
+        parser Name of JSON parser for full parse
+        threshold Largest file parsed in full by the syntax only
+          check, 0 to scan all files
+
+    Returns:
+        Iterator of (file, error) tuples, error is None when valid
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir (path):
+            for directory, dirs, names in os.walk (path):
+                dirs.sort ()
+                for name in sorted (names):
+                    if name.endswith (".json"):
+                        files.append (os.path.join (directory, name))
+        else:
+            files.append (path)
+
+    work = [(file, scan, parser, threshold) for file in files]
+    if len (work) < 2 or jobs == 1:
+        for item in work:
+            yield _checkFile (item)
+        return
+
+    pool = Pool (jobs)
+    try:
+        for result in pool.imap (_checkFile, work, 8):
+            yield result
+    finally:
+        pool.terminate ()
+
+def _checkFile (item):
+    """ Check one file, for use in a process pool. """
+    file, scan, parser, threshold = item
+    try:
+        if scan:
+            scanSyntax (file, threshold=threshold)
+        else:
+            checkSyntax (file, parser)
+        return file, None
     except CheckSyntaxError as e:
-        print ("Error: " + e.message);
+        return file, e.message
+
+def main ():
+    """
+    Main - parse file names from command and call syntax check.
+    """
+    parser = ArgumentParser (prog="jsonsyntax")
+    parser.add_argument ("paths", nargs="+", metavar="path",
+      help="JSON file, or directory of .json files, to check syntax of")
+    parser.add_argument ("-s", "--scan", action="store_true",
+      help="Syntax only check, scanning files in chunks")
+    parser.add_argument ("-m", "--threshold", type=float, dest="threshold",
+      default=SCAN_THRESHOLD / 1048576.0,
+      help="Opt in for -s to parse files up to MB in full, default 0")
+    parser.add_argument ("-j", "--jobs", type=int, dest="jobs",
+      help="Number of processes used to check multiple files")
+    parser.add_argument ("-p", "--parser", choices=PARSERS,
+      help="JSON parser for full parse, default fastest installed")
+    args = parser.parse_args ()
+    threshold = int (args.threshold * 1048576)
+
+    # verify selected parser is installed
+    try:
+        getParser (args.parser)
+    except ValueError as e:
+        print ("Error: " + str (e))
+        sys.exit (1)
+
+    # check syntax of single file, displaying result message
+    if (len (args.paths) == 1 and not os.path.isdir (args.paths[0])):
+        file, message = _checkFile ((args.paths[0], args.scan, args.parser,
+          threshold))
+        if (message == None):
+            print ("File contains valid JSON content.")
+            sys.exit (0);
+        print ("Error: " + message);
         sys.exit (1);
 
+    # check syntax of each file, displaying a result line per file
+    valid = True
+    for file, message in checkFiles (args.paths, args.scan, args.jobs,
+      args.parser, threshold):
+        if (message == None):
+            print (file + ": valid")
+        else:
+            print (file + ": Error: " + message)
+            valid = False
+    sys.exit (0 if valid else 1);
+
 if (__name__ == "__main__"):
-    main ()
\ No newline at end of file
+    main ()
@@ -0,0 +1,106 @@
+"""
+Throughput benchmark for the chapter servers
+
+Starts a server with an increasing number of worker processes and
+measures requests per second from concurrent client processes.
+
+Usage: python benchmark.py [--program=webserver] [--port=8311]
+         [--workers=1,2,4] [--clients=8] [--seconds=5]
+"""
+try:
+    # Python 3
+    from http.client import HTTPConnection
+except ImportError:
+    # Python 2
+    from httplib import HTTPConnection
+from multiprocessing import Pool
+from subprocess import Popen
+import os
+import socket
+import sys
+from time import sleep, time
+
+def main ():
+    program = "webserver"
+    port = 8311
+    workerCounts = [1, 2, 4]
+    clients = 8
+    seconds = 5.0
+
+    # process arguments
+    for arg in sys.argv[1:]:
+        index = arg.find ("=")
+        if index > -1:
+            key = arg[0:index].upper ()
+            value = arg[index + 1:len (arg)]
+            if key == "--PROGRAM":
+                program = value
+            elif key == "--PORT":
+                port = int (value)
+            elif key == "--WORKERS":
+                workerCounts = [int (count) for count in value.split (",")]
+            elif key == "--CLIENTS":
+                clients = int (value)
+            elif key == "--SECONDS":
+                seconds = float (value)
+
+    print ("%s, %d client processes, %.1fs per run" %
+      (program, clients, seconds))
+    print ("workers  requests  requests/s")
+    base = None
+    for workers in workerCounts:
+        requests = run (program, port, workers, clients, seconds)
+        rate = requests / seconds
+        if base is None:
+            base = rate
+        print ("%7d  %8d  %10.0f  (%.2fx)" %
+          (workers, requests, rate, rate / base))
+
+def run (program, port, workers, clients, seconds):
+    """
+    Start server with worker count and drive it with clients.
+    Returns:
+        Total number of requests completed.
+    """
+    devnull = open (os.devnull, "w")
+    server = Popen ([sys.executable, program + ".py", "--port=" + str (port),
+      "--workers=" + str (workers)], stdout=devnull, stderr=devnull)
+    try:
+        _waitReady (port)
+        pool = Pool (clients)
+        try:
+            counts = pool.map (_client, [(port, seconds)] * clients)
+        finally:
+            pool.close ()
+            pool.join ()
+        return sum (counts)
+    finally:
+        server.terminate ()
+        server.wait ()
+        devnull.close ()
+
+def _client (args):
+    """ Client process, issue GET requests until time expires. """
+    port, seconds = args
+    count = 0
+    end = time () + seconds
+    while time () < end:
+        connection = HTTPConnection ("localhost", port)
+        connection.request ("GET", "/")
+        connection.getresponse ().read ()
+        connection.close ()
+        count += 1
+    return count
+
+def _waitReady (port):
+    """ Poll until the server accepts connections. """
+    for attempt in range (200):
+        try:
+            socket.create_connection (("localhost", port), timeout=1).close ()
+            return
+        except socket.error:
+            sleep (0.05)
+    raise RuntimeError ("Server not ready on port " + str (port))
+
+if __name__ == "__main__":
+    main ()
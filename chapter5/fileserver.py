@@ -0,0 +1,345 @@
+"""
+File serving mode for the chapter servers
+
+Small files under the root directory are loaded at startup into an
+in-memory cache holding the encoded body, a gzip variant and the
+complete response headers, so serving them needs no reading or
+encoding. Each request checks the modification time and size of a
+cached file, and reloads it if changed. Large files are sent with
+os.sendfile (zero copy) where available. Conditional GET
+(If-None-Match) returns 304 when the ETag matches, and a precompressed
+file.gz next to a file is used as its gzip variant. The gzip variant
+has its own ETag, the identity ETag with a -gz suffix, and is not
+served by its own name. Other files with an encoding, such as a .gz
+file with no original next to it, are sent with that Content-Encoding.
+"""
+try:
+    # Python 3
+    from http.server import BaseHTTPRequestHandler
+    from urllib.parse import unquote
+except ImportError:
+    # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from urllib import unquote
+from hashlib import md5
+from mimetypes import guess_type
+import os
+import shutil
+import zlib
+
+# files up to this size are held in memory
+SMALL_LIMIT = 256 * 1024
+# gzip variant is kept only if at most this fraction of the original
+GZIP_RATIO = 0.9
+# content types worth compressing
+COMPRESSIBLE = ("text/", "application/json", "application/javascript",
+  "application/xml", "image/svg+xml")
+# file served for directory requests
+INDEX = "index.html"
+
+class CacheEntry:
+    """
+    Preencoded response for one file.
+    Args:
+        modified Modification time and size of the file and its
+          precompressed variant, when loaded.
+        etag Entity tag, including quotes.
+        body Encoded body.
+        headers Encoded header block for the body.
+        gzipBody Gzip body, or None if not worthwhile.
+        gzipHeaders Encoded header block for the gzip body.
+    """
+    def __init__ (self, modified, etag, body, headers, gzipBody,
+      gzipHeaders):
+        self.modified = modified
+        self.etag = etag
+        self.gzipEtag = _gzipEtag (etag)
+        self.body = body
+        self.headers = headers
+        self.gzipBody = gzipBody
+        self.gzipHeaders = gzipHeaders
+
+class FileCache:
+    """
+    Cache of small files under a root directory.
+    Args:
+        root Directory to serve files from.
+    """
+    def __init__ (self, root):
+        self.root = os.path.realpath (root)
+        self.entries = {}
+        self.load ()
+
+    def load (self):
+        """ Walk the root directory, loading all small files. """
+        for directory, dirs, files in os.walk (self.root):
+            for name in files:
+                path = os.path.join (directory, name)
+                if _isVariant (path):
+                    continue
+                if os.path.getsize (path) <= SMALL_LIMIT:
+                    self.entries[path] = self.loadEntry (path)
+
+    def get (self, path):
+        """
+        Get the cache entry for a file, reloading it if the file changed.
+        Args:
+            path Real path of file.
+        Returns:
+            CacheEntry for the file, or None if the file is not small.
+        """
+        entry = self.entries.get (path)
+        try:
+            modified = _modified (path)
+            if entry is not None and entry.modified == modified:
+                return entry
+            if modified[1] > SMALL_LIMIT:
+                self.entries.pop (path, None)
+                return None
+            entry = self.loadEntry (path)
+        except (IOError, OSError):
+            self.entries.pop (path, None)
+            return None
+        self.entries[path] = entry
+        return entry
+
+    def loadEntry (self, path):
+        """
+        Read a file and build its preencoded responses.
+        Args:
+            path Real path of file.
+        Returns:
+            CacheEntry for the file.
+        """
+        modified = _modified (path)
+        with open (path, "rb") as f:
+            body = f.read ()
+        etag = '"' + md5 (body).hexdigest ()[0:16] + '"'
+        contentType, encoding = _contentType (path)
+        headers = _headers (contentType, len (body), etag, encoding)
+
+        # use precompressed variant if present, else compress if worthwhile
+        gzipBody = None
+        gzipHeaders = None
+        if encoding is None and os.path.isfile (path + ".gz"):
+            with open (path + ".gz", "rb") as f:
+                gzipBody = f.read ()
+        elif encoding is None and contentType.startswith (COMPRESSIBLE):
+            gzipBody = _gzip (body)
+            if len (gzipBody) > len (body) * GZIP_RATIO:
+                gzipBody = None
+        if gzipBody is not None:
+            gzipHeaders = _headers (contentType, len (gzipBody),
+              _gzipEtag (etag), "gzip")
+
+        return CacheEntry (modified, etag, body, headers, gzipBody,
+          gzipHeaders)
+
+    def resolve (self, urlPath):
+        """
+        Map a URL path to a file path inside the root.
+        Args:
+            urlPath Path from the request line.
+        Returns:
+            Real path of file, or None if outside root, not a file, or
+            the gzip variant of a file.
+        """
+        urlPath = unquote (urlPath.split ("?", 1)[0].split ("#", 1)[0])
+        path = os.path.realpath (os.path.join (self.root,
+          urlPath.lstrip ("/")))
+        if os.path.isdir (path):
+            path = os.path.join (path, INDEX)
+        if path != self.root and not path.startswith (self.root + os.sep):
+            return None
+        if not os.path.isfile (path) or _isVariant (path):
+            return None
+        return path
+
+class FileHandler (BaseHTTPRequestHandler):
+    """ HTTP request handler serving files from a FileCache """
+    # class static, set by fileHandler
+    cache = None
+
+    def do_GET (self):
+        """ process GET, send file content """
+        self.sendFile (True)
+
+    def do_HEAD (self):
+        """ process HEAD, send file headers only """
+        self.sendFile (False)
+
+    def sendFile (self, includeBody):
+        """
+        Send the file for the request path.
+        Args:
+            includeBody False to send only headers.
+        """
+        path = self.cache.resolve (self.path)
+        if path is None:
+            self.send_error (404)
+            return
+
+        entry = self.cache.get (path)
+        if entry is None:
+            self.sendLargeFile (path, includeBody)
+            return
+
+        etag = entry.etag
+        body = entry.body
+        headers = entry.headers
+        if entry.gzipBody is not None and self.acceptsGzip ():
+            etag = entry.gzipEtag
+            body = entry.gzipBody
+            headers = entry.gzipHeaders
+        if self.notModified (etag):
+            return
+
+        self.log_request (200, len (body))
+        self.wfile.write (self.statusLine (200) + headers)
+        if includeBody:
+            self.wfile.write (body)
+
+    def sendLargeFile (self, path, includeBody):
+        """
+        Send a file not held in the cache, using sendfile if available.
+        Args:
+            path Real path of file.
+            includeBody False to send only headers.
+        """
+        contentType, encoding = _contentType (path)
+        if (encoding is None and os.path.isfile (path + ".gz") and
+            self.acceptsGzip ()):
+            path = path + ".gz"
+            encoding = "gzip"
+
+        try:
+            f = open (path, "rb")
+        except IOError:
+            self.send_error (404)
+            return
+
+        with f:
+            info = os.fstat (f.fileno ())
+            etag = '"%x-%x"' % (int (info.st_mtime * 1000000), info.st_size)
+            if encoding is not None:
+                etag = _gzipEtag (etag)
+            if self.notModified (etag):
+                return
+
+            headers = _headers (contentType, info.st_size, etag, encoding)
+            self.log_request (200, info.st_size)
+            self.wfile.write (self.statusLine (200) + headers)
+            if includeBody:
+                _sendFile (self.wfile, self.connection, f, info.st_size)
+
+    def notModified (self, etag):
+        """
+        Send 304 response if request If-None-Match matches the ETag.
+        Returns:
+            True if response sent.
+        """
+        match = self.headers.get ("If-None-Match")
+        if match is None:
+            return False
+        tags = [tag.strip () for tag in match.split (",")]
+        if etag not in tags and "*" not in tags:
+            return False
+
+        self.log_request (304)
+        self.wfile.write (self.statusLine (304) +
+          ("ETag: " + etag + "\r\nVary: Accept-Encoding\r\n\r\n").encode (
+          "latin-1"))
+        return True
+
+    def acceptsGzip (self):
+        """ Determine if the client accepts gzip content encoding. """
+        accept = self.headers.get ("Accept-Encoding", "")
+        for coding in accept.split (","):
+            parts = coding.strip ().split (";")
+            if parts[0].strip () == "gzip":
+                return "q=0" not in [p.strip () for p in parts[1:]]
+        return False
+
+    def statusLine (self, code):
+        """ Build status line for the response code. """
+        return ("%s %d %s\r\n" % (self.protocol_version, code,
+          self.responses[code][0])).encode ("latin-1")
+
+def fileHandler (root):
+    """
+    Create a request handler class serving files from a directory.
+    Args:
+        root Directory to serve files from.
+    Returns:
+        FileHandler subclass with the loaded cache.
+    """
+    return type ("FileHandler", (FileHandler, object),
+      { "cache": FileCache (root) })
+
+def _contentType (path):
+    """
+    Get content type and content encoding for a file name, None for the
+    encoding if the file is not encoded.
+    """
+    contentType, encoding = guess_type (path)
+    if contentType is None:
+        contentType = "application/octet-stream"
+    return contentType, encoding
+
+def _isVariant (path):
+    """ Determine if a file is the gzip variant of another file. """
+    return path.endswith (".gz") and os.path.isfile (path[:-3])
+
+def _headers (contentType, length, etag, encoding):
+    """ Build encoded header block, ending with the blank line. """
+    headers = "Content-Type: " + contentType + "\r\n"
+    headers += "Content-Length: " + str (length) + "\r\n"
+    headers += "ETag: " + etag + "\r\n"
+    headers += "Vary: Accept-Encoding\r\n"
+    if encoding is not None:
+        headers += "Content-Encoding: " + encoding + "\r\n"
+    return (headers + "\r\n").encode ("latin-1")
+
+def _gzipEtag (etag):
+    """ Get the ETag of the gzip variant from the identity ETag. """
+    return etag[:-1] + '-gz"'
+
+def _modified (path):
+    """
+    Get modification time and size of a file and its precompressed
+    variant, None for the variant if there is none.
+    """
+    info = os.stat (path)
+    try:
+        gzipInfo = os.stat (path + ".gz")
+        variant = (gzipInfo.st_mtime, gzipInfo.st_size)
+    except OSError:
+        variant = None
+    return (info.st_mtime, info.st_size, variant)
+
+def _gzip (data):
+    """ Compress data in gzip format. """
+    compressor = zlib.compressobj (9, zlib.DEFLATED, 31)
+    return compressor.compress (data) + compressor.flush ()
+
+def _sendFile (wfile, connection, f, size):
+    """
+    Copy a file to the connection, zero copy if os.sendfile available.
+    Args:
+        wfile Buffered connection writer, flushed before sendfile.
+        connection Connection socket.
+        f Open file.
+        size Bytes to send.
+    """
+    if not hasattr (os, "sendfile"):
+        shutil.copyfileobj (f, wfile)
+        return
+
+    wfile.flush ()
+    offset = 0
+    while offset < size:
+        sent = os.sendfile (connection.fileno (), f.fileno (), offset,
+          size - offset)
+        if sent == 0:
+            break
+        offset += sent
@@ -1,48 +1,216 @@
 """
 Server launcher
+
+Starts all servers marked to start in startup.json in parallel, waits
+for each to accept connections on its port (or answer its health URL),
+and supervises them, restarting any server that exits with an
+increasing backoff delay.
 """
+try:
+    # Python 3
+    from urllib.request import urlopen
+except ImportError:
+    # Python 2
+    from urllib2 import urlopen
 from json import loads
+from jsonschema import Draft4Validator
+from signal import signal, SIGTERM
 from subprocess import Popen
+import socket
 import sys
-from time import sleep
+from time import sleep, time
+
+# seconds to wait for a server to become ready
+READY_TIMEOUT = 10.0
+# seconds between readiness and supervision checks
+POLL_INTERVAL = 0.05
+SUPERVISE_INTERVAL = 0.5
+# restart backoff, doubled after each failure up to the maximum
+BACKOFF_INITIAL = 0.5
+BACKOFF_MAXIMUM = 30.0
+# seconds a server must stay up for its backoff to be reset
+BACKOFF_RESET = 30.0
 
 def main ():
     print ("Reading configuration from startup.json.")
 
     # load configuration file, which contains the startup
     # directions for all servers.
+    configuration = loadJson ("startup.json", "configuration file")
+    schema = loadJson ("startup_schema.json", "schema file")
+
+    # validate configuration before starting anything
+    errors = list (Draft4Validator (schema).iter_errors (configuration))
+    if len (errors) > 0:
+        print ("Invalid configuration in startup.json")
+        for error in errors:
+            print ("  " + error.message)
+        sys.exit (1)
+
+    launchServers (configuration["servers"])
+
+def loadJson (file, description):
+    """
+    Read a file and convert it to a JSON object, exiting on error.
+    Args:
+        file File name to read.
+        description Text describing file for error messages.
+    Returns:
+        JSON object read.
+    """
     try:
         # read the file and convert to a JSON object
-        data = open ("startup.json", "rU").read ()
+        data = open (file, "r").read ()
     except IOError as e:
-        print ("Error reading configuration file: " + e.strerror)
+        print ("Error reading " + description + ": " + e.strerror)
         sys.exit (1)
 
     try:
-        configuration = loads (data)
+        return loads (data)
     except Exception as e:
-        print ("Invalid JSON content in startup.json")
+        print ("Invalid JSON content in " + file)
         sys.exit (1)
 
-    launchServers (configuration["servers"])
+class ServerProcess:
+    """
+    Child process for one server in the configuration.
+    Args:
+        server Server entry from the configuration.
+    """
+    def __init__ (self, server):
+        self.server = server
+        self.name = server["name"]
+        self.port = server["port"]
+        self.health = server.get ("health")
+        self.process = None
+        self.started = None
+        self.backoff = BACKOFF_INITIAL
+        self.restartAt = None
+
+    def start (self):
+        """ Set port and worker arguments and start child process. """
+        program = self.server["program"] + ".py"
+        port = "--port=" + str (self.port)
+        workers = "--workers=" + str (self.server.get ("workers", 1))
+        command = [sys.executable, program, port, workers]
+        if "root" in self.server:
+            command.append ("--root=" + self.server["root"])
+        self.process = Popen (command)
+        self.started = time ()
+        self.restartAt = None
+
+    def isRunning (self):
+        """ Determine if child process is still running. """
+        return self.process is not None and self.process.poll () is None
+
+    def isReady (self):
+        """ Determine if server accepts connections or answers health URL. """
+        if self.health is not None:
+            url = "http://localhost:" + str (self.port) + self.health
+            try:
+                urlopen (url, timeout=1).read ()
+                return True
+            except Exception:
+                return False
+
+        try:
+            connection = socket.create_connection (("localhost", self.port),
+              timeout=1)
+            connection.close ()
+            return True
+        except socket.error:
+            return False
+
+    def stop (self):
+        """ Terminate child process and wait for it to exit. """
+        if self.isRunning ():
+            self.process.terminate ()
+            self.process.wait ()
 
 def launchServers (servers):
-    # for each server in configuration
-    processes = []
+    # stop children when terminated, as for an interrupt
+    signal (SIGTERM, _terminate)
+
+    # start every server marked to start without waiting between them
+    children = []
     for server in servers:
-        # if server marked to start
         if server["start"]:
-            # set port number in arguments and start child process
             print ("Starting " + server["name"])
-            program = server["program"] + ".py"
-            port = "--port=" + str (server["port"])
-            process = Popen (["python", program, port])
-            processes.append (process)
-            # allow child process messages to display
-            sleep (0.25)
+            child = ServerProcess (server)
+            child.start ()
+            children.append (child)
+
+    try:
+        start = time ()
+        if not waitReady (children):
+            for child in children:
+                child.stop ()
+            sys.exit (1)
+        print ("All servers ready in %.3fs" % (time () - start))
+
+        supervise (children)
+    except KeyboardInterrupt:
+        for child in children:
+            child.stop ()
+
+def waitReady (children):
+    """
+    Poll all servers until each is ready, reporting per-server startup
+    time. Total wait is that of the slowest server.
+    Args:
+        children List of started ServerProcess.
+    Returns:
+        True if all servers became ready, False otherwise.
+    """
+    pending = list (children)
+    allReady = True
+    while len (pending) > 0:
+        for child in list (pending):
+            elapsed = time () - child.started
+            if not child.isRunning ():
+                print (child.name + " exited during startup")
+                pending.remove (child)
+                allReady = False
+            elif child.isReady ():
+                print ("%s ready on port %d in %.3fs" %
+                  (child.name, child.port, elapsed))
+                pending.remove (child)
+            elif elapsed > READY_TIMEOUT:
+                print (child.name + " not ready after " +
+                  str (READY_TIMEOUT) + "s")
+                pending.remove (child)
+                allReady = False
+        if len (pending) > 0:
+            sleep (POLL_INTERVAL)
+    return allReady
+
+def supervise (children):
+    """
+    Watch all servers, restarting any that exit. Restarts are delayed by
+    a backoff that doubles after each failure, and is reset once the
+    server has stayed up for a while.
+    Args:
+        children List of running ServerProcess.
+    """
+    while True:
+        now = time ()
+        for child in children:
+            if child.isRunning ():
+                if now - child.started > BACKOFF_RESET:
+                    child.backoff = BACKOFF_INITIAL
+            elif child.restartAt is None:
+                print ("%s exited with code %d, restarting in %.1fs" %
+                  (child.name, child.process.returncode, child.backoff))
+                child.restartAt = now + child.backoff
+                child.backoff = min (child.backoff * 2, BACKOFF_MAXIMUM)
+            elif now >= child.restartAt:
+                print ("Restarting " + child.name)
+                child.start ()
+        sleep (SUPERVISE_INTERVAL)
 
-    for process in processes:
-        process.wait ()
+def _terminate (signum, frame):
+    """ Signal handler, raise interrupt to stop all servers. """
+    raise KeyboardInterrupt ()
 
 if __name__ == "__main__":
-    main ()
\ No newline at end of file
+    main ()
@@ -3,17 +3,28 @@ Web Server
 """
 try:
     # Python 3
-    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from http.server import BaseHTTPRequestHandler
 except ImportError:
     # Python 2
-    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from BaseHTTPServer import BaseHTTPRequestHandler
 import sys
+from fileserver import fileHandler
+from workers import serve
+
+# response body, encoded once
+CONTENT = "Web content goes here.".encode ("utf8")
 
 def main ():
     # port number to listen on for requests
     port = 8301
 
-    # process arguments for port number argument
+    # number of worker processes sharing the port
+    workers = 1
+
+    # directory to serve files from, None for fixed content
+    root = None
+
+    # process arguments for port number, worker count and root arguments
     for arg in sys.argv[1:]:
         index = arg.find ("=")
         if index > -1:
@@ -21,15 +32,21 @@ def main ():
             value = arg[index + 1:len (arg)]
             if (key == "-P") or (key == "--PORT"):
                 port = int (value)
+            elif (key == "-W") or (key == "--WORKERS"):
+                workers = int (value)
+            elif (key == "-R") or (key == "--ROOT"):
+                root = value
+
+    # serve files from root if specified
+    handler = Handler
+    if root is not None:
+        handler = fileHandler (root)
+        print ("Serving files from " + root)
 
     # listen for messages on specified port
-    server = HTTPServer (("localhost", port), Handler)
-    print ("Web server listening on port " + str (port))
-    try:
-        server.serve_forever ()
-    except KeyboardInterrupt:
-        server.shutdown ()
-        server.server_close ()
+    print ("Web server listening on port " + str (port) +
+      " with " + str (workers) + " worker(s)")
+    serve (port, handler, workers)
 
 class Handler (BaseHTTPRequestHandler):
     # processing logic goes here
@@ -37,7 +54,7 @@ class Handler (BaseHTTPRequestHandler):
         self.send_response (200)
         self.send_header ("Content-type", "text/html")
         self.end_headers ()
-        self.wfile.write ("Web content goes here.".encode ("utf8"))
+        self.wfile.write (CONTENT)
         return
 
 if __name__ == "__main__":
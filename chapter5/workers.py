@@ -0,0 +1,141 @@
+"""
+Pre-forked worker processes for the chapter servers
+
+The listening socket is bound once in the parent process, then the
+requested number of worker processes are forked and each accepts
+connections from the shared socket, so one logical server uses all
+cores. A worker that exits is replaced by a new one, so the pool keeps
+its size. On SIGTERM or interrupt the parent signals the workers, which
+finish the request in progress before exiting. The parent installs its
+signal handlers, and blocks the signals while forking, before any
+worker exists, so no signal is missed or handled by a new worker.
+"""
+try:
+    # Python 3
+    from http.server import HTTPServer
+except ImportError:
+    # Python 2
+    from BaseHTTPServer import HTTPServer
+from errno import EINTR
+from signal import signal, SIGINT, SIGTERM, SIG_IGN
+try:
+    # Python 3
+    from signal import pthread_sigmask, SIG_BLOCK, SIG_UNBLOCK
+except ImportError:
+    # Python 2, signals cannot be blocked while forking
+    pthread_sigmask = None
+    SIG_BLOCK = SIG_UNBLOCK = None
+import os
+
+# seconds a worker waits for a request before checking for shutdown
+POLL_TIMEOUT = 0.5
+
+def serve (port, handler, workers):
+    """
+    Listen for requests on a port with one or more worker processes.
+    Args:
+        port Port number to listen on.
+        handler Request handler class.
+        workers Number of worker processes.
+    """
+    server = HTTPServer (("localhost", port), handler)
+    if workers <= 1:
+        try:
+            server.serve_forever ()
+        except KeyboardInterrupt:
+            server.shutdown ()
+            server.server_close ()
+        return
+
+    # parent signals workers to stop on terminate, handlers installed
+    # before forking so a signal is never missed
+    children = set ()
+    stopping = []
+    def stop (signum, frame):
+        if len (stopping) == 0:
+            stopping.append (signum)
+            for pid in children:
+                _kill (pid)
+    signal (SIGTERM, stop)
+    signal (SIGINT, stop)
+
+    # fork workers sharing the listening socket
+    for worker in range (workers):
+        _fork (server, children, stopping)
+
+    # parent only waits, replacing workers that exit until stopping
+    while len (children) > 0:
+        pid = _wait ()
+        if pid is None:
+            break
+        children.discard (pid)
+        _fork (server, children, stopping)
+    server.server_close ()
+
+def _fork (server, children, stopping):
+    """
+    Fork a worker unless stopping, with signals blocked so the parent
+    handles none between the check and adding the worker's process id.
+    Args:
+        server HTTPServer with bound listening socket.
+        children Set of worker process ids, added to.
+        stopping List, not empty once the parent is stopping.
+    """
+    _block (SIG_BLOCK)
+    try:
+        if len (stopping) == 0:
+            pid = os.fork ()
+            if pid == 0:
+                _worker (server)
+            children.add (pid)
+    finally:
+        _block (SIG_UNBLOCK)
+
+def _worker (server):
+    """
+    Worker process, handle requests until signalled to stop.
+    Args:
+        server HTTPServer with bound listening socket.
+    """
+    stopping = []
+    def stop (signum, frame):
+        stopping.append (signum)
+
+    # interrupts are delivered by the parent as SIGTERM, unblocked once
+    # the worker's own handler is installed
+    signal (SIGINT, SIG_IGN)
+    signal (SIGTERM, stop)
+    _block (SIG_UNBLOCK)
+
+    server.timeout = POLL_TIMEOUT
+    try:
+        while len (stopping) == 0:
+            server.handle_request ()
+    finally:
+        server.server_close ()
+        os._exit (0)
+
+def _kill (pid):
+    """ Send terminate signal to a worker, ignoring exited workers. """
+    try:
+        os.kill (pid, SIGTERM)
+    except OSError:
+        pass
+
+def _block (how):
+    """ Block or unblock terminate and interrupt signals, if supported. """
+    if pthread_sigmask is not None:
+        pthread_sigmask (how, (SIGTERM, SIGINT))
+
+def _wait ():
+    """
+    Wait for a worker to exit, retrying if interrupted by a signal.
+    Returns:
+        Process id of the worker, None if there are no workers.
+    """
+    while True:
+        try:
+            return os.wait ()[0]
+        except OSError as e:
+            if e.errno != EINTR:
+                return None
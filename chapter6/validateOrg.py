@@ -1,7 +1,12 @@
 """
  * Validate the organization data and employee data
+
+Units and employees are loaded as compact records rather than dicts,
+and the checks look up unit ids in sets, so organizations with
+millions of employees are checked in memory and time proportional to
+their size.
 """
-from jsonValidate import validate
+from jsonvalidate import validate
 import sys
 
 def validateOrg (orgFile, empFile):
@@ -16,20 +21,22 @@ def validateOrg (orgFile, empFile):
 
     # validate organization data
     units = None
-    code, data, message = validate (orgFile, orgSchema, None, None)
+    code, data, message = validate (orgFile, orgSchema, None, None,
+      compact=True)
     if code == 0:
         units = data["units"]
     else:
-        print ("Error processing organization: " + message)
+        print ("Error processing organization: " + str (message))
         sys.exit (code)
 
     # validate employee data
     employees = None
-    code, data, message = validate (empFile, empSchema, None, None)
+    code, data, message = validate (empFile, empSchema, None, None,
+      compact=True)
     if code == 0:
         employees = data["employees"]
     else: 
-        print ("Error processing employees: " + message)
+        print ("Error processing employees: " + str (message))
         sys.exit (code)
 
     verifyTopLevelUnit (units)
@@ -54,24 +61,23 @@ def verifyTopLevelUnit (units):
 
 def verifyUniqueUnitIds (units):
     """ verify unitId is unique across all units """
-    for index1 in range (len (units)):
-        currentUnitId = units[index1]["unitId"]
-        for index2 in range (index1 + 1, len (units)):
-            if currentUnitId == units[index2]["unitId"]:
-                print ("Error: Duplicate unitId " + str (currentUnitId))
-                break
+    # reported for each unit with the same unitId later in the list
+    remaining = {}
+    for unit in units:
+        remaining[unit["unitId"]] = remaining.get (unit["unitId"], 0) + 1
+    for unit in units:
+        currentUnitId = unit["unitId"]
+        remaining[currentUnitId] -= 1
+        if remaining[currentUnitId] > 0:
+            print ("Error: Duplicate unitId " + str (currentUnitId))
 
 def verifyUnitIds (units):
     """ verify org has valid unitId for all unitOf references """
     orgValid = True
+    unitIds = set (unit["unitId"] for unit in units)
     for units1 in units:
         if units1["unitOf"] != 0:
-            validUnitOf = False
-            for units2 in units:
-                if units1["unitOf"] == units2["unitId"]:
-                    validUnitOf = True
-                    break
-
+            validUnitOf = units1["unitOf"] in unitIds
             if not validUnitOf:
                 print ("Error: Invalid unitOf " + str (units1["unitOf"]))
                 orgValid = False
@@ -82,14 +88,10 @@ def verifyUnitIds (units):
 def verifyEmployeeUnits (employees, units):
     """ verify all employee unit references are valid org units """
     allValid = True
+    unitIds = set (unit["unitId"] for unit in units)
     for employee in employees:
-        validUnit = False
         empUnit = employee["unit"]
-        for unit in units:
-            if empUnit == unit["unitId"]:
-                validUnit = True
-                break
-
+        validUnit = empUnit in unitIds
         if not validUnit:
             print ("Error: Invalid employee unit " + str (empUnit))
             allValid = False
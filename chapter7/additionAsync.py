@@ -0,0 +1,310 @@
+"""
+asyncio client for the addition service.
+
+AsyncAdditionClient runs many addition requests concurrently on one
+event loop, at most its concurrency limit at a time, each on an idle
+pooled HTTP/1.1 connection or a new one, and checks the responses with
+the validators compiled once by additionPool. pipeline submits a batch
+of requests over up to the concurrency limit of connections, writing
+up to depth requests on a connection before reading their responses in
+order, so the round trips of a batch overlap. runLoad fires a number
+of requests and times them, for the client's load mode.
+
+Python 3 only, the rest of the client also runs on Python 2.
+"""
+from collections import deque
+from random import Random
+from time import time
+import asyncio
+from additionPool import Result, requestBody, loadValidators
+
+# request head, formatted with host, port and body length
+REQUEST = ("POST / HTTP/1.1\r\nHost: %s:%d\r\n"
+  "Content-Type: application/json\r\nContent-Length: %d\r\n\r\n")
+
+class ResponseError (Exception):
+    """ Response not understood. """
+
+# failures of a connection or request
+ERRORS = (OSError, EOFError, asyncio.TimeoutError, ResponseError)
+
+class AsyncAdditionClient:
+    """
+    Addition service client running requests concurrently.
+    Args:
+        host Service host name.
+        port Service port.
+        concurrency Most requests, or pipelined connections, at a time.
+        timeout Seconds to wait for the service.
+    """
+    def __init__ (self, host="localhost", port=8303, concurrency=16,
+      timeout=10.0):
+        loadValidators ()
+        self.host = host
+        self.port = port
+        self.concurrency = concurrency
+        self.timeout = timeout
+        # created on first use, within the event loop
+        self.limit = None
+        self.idle = []
+        self.created = 0
+        self.reused = 0
+
+    async def add (self, number1, number2):
+        """ Request the sum of two numbers, returning a Result. """
+        return await self.post (requestBody (number1, number2))
+
+    async def post (self, body):
+        """
+        Post a request body, waiting while the limit is reached.
+        Args:
+            body Request body bytes.
+        Returns:
+            Result.
+        """
+        async with self._limit ():
+            return await self._post (body)
+
+    async def addAll (self, pairs):
+        """
+        Request many additions concurrently, up to the limit.
+        Args:
+            pairs List of (number1, number2).
+        Returns:
+            List of Result, in the order of pairs.
+        """
+        return await asyncio.gather (*[self.add (number1, number2)
+          for number1, number2 in pairs])
+
+    async def pipeline (self, pairs, depth=16):
+        """
+        Submit a batch of additions pipelined on up to the concurrency
+        limit of connections. Requests not answered when a connection
+        closes or fails are sent again one at a time.
+        Args:
+            pairs List of (number1, number2).
+            depth Most requests sent on a connection before reading.
+        Returns:
+            List of Result, in the order of pairs.
+        """
+        bodies = [requestBody (number1, number2)
+          for number1, number2 in pairs]
+        results = [None] * len (bodies)
+        indexes = iter (range (len (bodies)))
+        workers = min (self.concurrency, len (bodies))
+        await asyncio.gather (*[self._pipelineWorker (bodies, results,
+          indexes, max (depth, 1)) for worker in range (workers)])
+        return results
+
+    async def close (self):
+        """ Close the idle connections. """
+        idle = self.idle
+        self.idle = []
+        for connection in idle:
+            await connection.close ()
+
+    def stats (self):
+        """ Get connection statistics as a dict. """
+        return {
+            "created": self.created,
+            "reused": self.reused,
+            "idle": len (self.idle)
+        }
+
+    def _limit (self):
+        """ Semaphore limiting requests and connections in use. """
+        if self.limit is None:
+            self.limit = asyncio.Semaphore (self.concurrency)
+        return self.limit
+
+    async def _post (self, body):
+        """ Post a request body, retried once if on a reused connection. """
+        start = time ()
+        while True:
+            try:
+                connection, reused = await self._acquire ()
+            except ERRORS as e:
+                return Result (0, str (e) or e.__class__.__name__,
+                  time () - start)
+            try:
+                connection.send (body)
+                status, data, close = await connection.receive ()
+            except ERRORS as e:
+                await connection.close ()
+                # the service may have closed it while idle
+                if reused:
+                    continue
+                return Result (0, str (e) or e.__class__.__name__,
+                  time () - start)
+            self._release (connection, close)
+            return Result (status, data, time () - start)
+
+    async def _pipelineWorker (self, bodies, results, indexes, depth):
+        """ Send requests from indexes pipelined on one connection. """
+        async with self._limit ():
+            while True:
+                start = time ()
+                try:
+                    connection, reused = await self._acquire ()
+                except ERRORS as e:
+                    # service not reachable, fail one request and retry
+                    index = next (indexes, None)
+                    if index is None:
+                        return
+                    results[index] = Result (0, str (e) or
+                      e.__class__.__name__, time () - start)
+                    continue
+
+                pending = deque ()
+                close = False
+                try:
+                    while not close:
+                        while len (pending) < depth:
+                            index = next (indexes, None)
+                            if index is None:
+                                break
+                            connection.send (bodies[index])
+                            pending.append ((index, time ()))
+                        if len (pending) == 0:
+                            break
+                        status, data, close = await connection.receive ()
+                        index, start = pending.popleft ()
+                        results[index] = Result (status, data,
+                          time () - start)
+                except ERRORS:
+                    close = True
+
+                if not close:
+                    self._release (connection, False)
+                    return
+                await connection.close ()
+                for index, start in pending:
+                    results[index] = await self._post (bodies[index])
+
+    async def _acquire (self):
+        """ Get an idle connection or a new one, and if it was idle. """
+        if len (self.idle) > 0:
+            self.reused += 1
+            return self.idle.pop (), True
+        self.created += 1
+        connection = _Connection (self.host, self.port, self.timeout)
+        await connection.open ()
+        return connection, False
+
+    def _release (self, connection, close):
+        """ Keep a connection for reuse, unless closed or enough idle. """
+        if close or len (self.idle) >= self.concurrency:
+            connection.writer.close ()
+        else:
+            self.idle.append (connection)
+
+class _Connection:
+    """
+    HTTP/1.1 connection to the service, reading responses in order.
+    Args:
+        host Service host name.
+        port Service port.
+        timeout Seconds to wait for the service.
+    """
+    def __init__ (self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+
+    async def open (self):
+        """ Connect to the service. """
+        self.reader, self.writer = await asyncio.wait_for (
+          asyncio.open_connection (self.host, self.port), self.timeout)
+
+    def send (self, body):
+        """ Write a request, sent without waiting for its response. """
+        self.writer.write ((REQUEST % (self.host, self.port,
+          len (body))).encode ("ascii") + body)
+
+    async def receive (self):
+        """
+        Read the next response.
+        Returns:
+            Tuple of (status, body text, flag connection closing).
+        """
+        await self.writer.drain ()
+        return await asyncio.wait_for (self._read (), self.timeout)
+
+    async def _read (self):
+        """ Read a response status line, headers and body. """
+        line = await self.reader.readline ()
+        parts = line.split (None, 2)
+        if len (parts) < 2 or not parts[0].startswith (b"HTTP/"):
+            if len (line) == 0:
+                raise EOFError ("Connection closed")
+            raise ResponseError ("Invalid status line")
+        try:
+            status = int (parts[1])
+        except ValueError:
+            raise ResponseError ("Invalid status line")
+
+        length = None
+        close = parts[0] == b"HTTP/1.0"
+        while True:
+            line = await self.reader.readline ()
+            if len (line) == 0:
+                raise EOFError ("Connection closed")
+            if line in (b"\r\n", b"\n"):
+                break
+            name, separator, value = line.partition (b":")
+            name = name.strip ().lower ()
+            if name == b"content-length":
+                length = int (value)
+            elif name == b"connection":
+                close = value.strip ().lower () == b"close"
+            elif name == b"transfer-encoding":
+                raise ResponseError ("Unsupported transfer encoding")
+
+        if length is None:
+            # body ends when the connection closes
+            data = await self.reader.read ()
+            close = True
+        else:
+            data = await self.reader.readexactly (length)
+        return status, data.decode ("utf8"), close
+
+    async def close (self):
+        """ Close the connection. """
+        self.writer.close ()
+        try:
+            await self.writer.wait_closed ()
+        except ERRORS:
+            pass
+
+def runLoad (host, port, requests, concurrency, depth=0, seed=1):
+    """
+    Fire requests for additions of random numbers, and time them.
+    Args:
+        host Service host name.
+        port Service port.
+        requests Number of requests.
+        concurrency Most requests, or pipelined connections, at a time.
+        depth Pipeline depth, 0 to send each request on its own.
+        seed Seed for the random numbers.
+    Returns:
+        Tuple of (list of Result, seconds, connection statistics).
+    """
+    rand = Random (seed)
+    pairs = [(rand.randint (1, 1000), rand.randint (1, 1000))
+      for request in range (requests)]
+
+    async def run ():
+        client = AsyncAdditionClient (host, port, concurrency)
+        start = time ()
+        if depth > 0:
+            results = await client.pipeline (pairs, depth)
+        else:
+            results = await client.addAll (pairs)
+        seconds = time () - start
+        stats = client.stats ()
+        await client.close ()
+        return results, seconds, stats
+
+    return asyncio.run (run ())
@@ -2,21 +2,18 @@
 Client to the addition service using JSON and JSON Schema.
 
 HTTP client to make requests. Default port is 8303.
+
+Requests are made with the pooled client library (additionPool), on
+persistent connections, with response validators compiled once. With
+a number of requests (-n), the client runs in load mode instead: it
+fires that many requests, at most -c at a time, or pipelined -l deep
+on each of -c connections, with the asyncio client (additionAsync),
+and prints the throughput and latency percentiles.
 """
-try:
-    # Python 3
-    from urllib.request import urlopen
-    from urllib.request import Request
-    from urllib.error import HTTPError
-except ImportError:
-    # Python 2
-    from urllib2 import urlopen
-    from urllib2 import Request
-    from urllib2 import HTTPError
 from argparse import ArgumentParser
-from json import loads, dumps
-from jsonschema import Draft4Validator
+from json import dumps
 import sys
+from additionPool import AdditionPool, percentile
 
 def main ():
     """ Program entry point. """
@@ -26,36 +23,51 @@ class AdditionClient:
     """ Start client for addition service. """
     def __init__ (self):
         """ Set port and start client """
-        # process command line for port number
+        # process command line for port number and load mode
         self.port = 8303
+        self.requests = 0
+        self.concurrency = 16
+        self.depth = 0
         self.processCommand ()
 
-        # Load JSON Schema to validate result against
+        # load and compile JSON Schemas to validate results against
         try:
-            # read the file and convert to a JSON object
-            responseSchema = open ("addResponse_schema.json", "rU").read ()
-            errorSchema = open ("addError_schema.json", "rU").read ()
+            self.client = AdditionPool ("localhost", self.port)
         except IOError as e:
             print ("Error loading schema: " + e.strerror)
             sys.exit (1)
-
-        try:
-            self.responseSchema = loads (responseSchema)
-            self.errorSchema = loads (errorSchema)
         except ValueError as e:
             print ("Invalid JSON content in schema")
             sys.exit (1)
 
-        self.makeRequests ()
+        if self.requests > 0:
+            self.loadTest ()
+        else:
+            self.makeRequests ()
+        self.client.close ()
 
     def processCommand (self):
-        """ Get port from command line arguments. """
+        """ Get port and load mode from command line arguments. """
         parser = ArgumentParser ()
         parser.add_argument ("-p", "--port", type=int, dest="port",
           action="store", help="Port to make requests on")
+        parser.add_argument ("-n", "--requests", type=int, dest="requests",
+          action="store", help="Load mode, number of requests to fire")
+        parser.add_argument ("-c", "--concurrency", type=int,
+          dest="concurrency", action="store",
+          help="Load mode, most requests or connections at a time")
+        parser.add_argument ("-l", "--pipeline", type=int, dest="depth",
+          action="store", help="Load mode, requests pipelined on each "
+          "connection (0 not pipelined)")
         args = parser.parse_args ()
         if args.port is not None:
             self.port = args.port
+        if args.requests is not None:
+            self.requests = args.requests
+        if args.concurrency is not None:
+            self.concurrency = max (args.concurrency, 1)
+        if args.depth is not None:
+            self.depth = args.depth
 
     def makeRequests (self):
         """ Make requests with valid and invalid content. """
@@ -79,32 +91,43 @@ class AdditionClient:
             content JSON object to pass to additionService
         """
         print ("Result for request: " + name)
-        url = "http://localhost:" + str (self.port) + "/"
-        dataIn = content.encode ("utf8")
-        headers = { "Content-type": "application/json" }
-
-        try:
-            req = Request (url, dataIn, headers)
-            response = urlopen (req)
-            dataOut = response.read ().decode ("utf8")
-            result = loads (dataOut)
-            try:
-                validator = Draft4Validator (self.responseSchema)
-                validator.validate (result)
+        result = self.client.post (content.encode ("utf8"))
+        if result.status == 0:
+            print ("  Request failed: " + result.error)
+        elif result.status == 200:
+            if result.valid:
+                print ("  Result = " + str (result.answer))
+            else:
+                print ("  Invalid result received\n" + result.reason)
+        elif result.valid:
+            print ("  Server error: " + str (result.error))
+        else:
+            print ("Invalid error received")
 
-                print ("  Result = " + str (result["answer"]))
-            except Exception as e:
-                print ("  Invalid result received\n" + str (e))
-        except HTTPError as e:
-            data = e.read ().decode ("utf8")
-            result = loads (data)
-            try:
-                validator = Draft4Validator (self.errorSchema)
-                validator.validate (result)
+    def loadTest (self):
+        """ Fire requests concurrently, printing throughput and latency. """
+        # asyncio client, Python 3 only
+        from additionAsync import runLoad
+        results, seconds, stats = runLoad ("localhost", self.port,
+          self.requests, self.concurrency, self.depth)
 
-                print ("  Server error: " + str (result["error"]))
-            except:
-                print ("Invalid error received")
+        failed = sum (1 for result in results if result.status == 0)
+        invalid = sum (1 for result in results
+          if result.status != 0 and not result.valid)
+        errors = sum (1 for result in results
+          if result.valid and result.status != 200)
+        latencies = sorted (result.latency * 1000 for result in results)
+        print ("Load: %d requests, concurrency %d, pipeline depth %d" % (
+          self.requests, self.concurrency, self.depth))
+        print ("  Completed in %.2f s, %.0f requests/s" % (seconds,
+          len (results) / seconds if seconds > 0 else 0))
+        print ("  Failed %d, invalid responses %d, service errors %d" % (
+          failed, invalid, errors))
+        print ("  Latency ms: p50 %.2f  p90 %.2f  p99 %.2f  max %.2f" % (
+          percentile (latencies, 0.5), percentile (latencies, 0.9),
+          percentile (latencies, 0.99), percentile (latencies, 1.0)))
+        print ("  Connections opened %d, reused %d" % (stats["created"],
+          stats["reused"]))
 
 if __name__ == "__main__":
     main ()
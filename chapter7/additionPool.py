@@ -0,0 +1,158 @@
+"""
+Pooled client library for the addition service.
+
+AdditionPool makes addition requests on persistent HTTP/1.1
+connections to the service, kept in a pool shared by threads (the
+gateway's ConnectionPool), and checks each response with validators
+compiled once per process from addResponse_schema.json and
+addError_schema.json. AsyncAdditionClient, in additionAsync.py, runs
+many requests concurrently with asyncio, up to a concurrency limit,
+and can pipeline a batch of requests on each connection.
+
+Each request gives a Result, with the status, the answer or error,
+whether the response matched its schema, and the latency.
+"""
+try:
+    # Python 3
+    from http.client import HTTPException
+except ImportError:
+    # Python 2
+    from httplib import HTTPException
+from json import loads, dumps
+from jsonschema import Draft4Validator
+from os.path import dirname, join
+from threading import Lock
+from time import time
+import socket
+from gateway import ConnectionPool
+
+# schemas, next to this program, and request headers
+SCHEMA_DIR = dirname (__file__) or "."
+RESPONSE_SCHEMA = "addResponse_schema.json"
+ERROR_SCHEMA = "addError_schema.json"
+HEADERS = { "Content-type": "application/json" }
+
+# response and error validators, compiled once
+_validators = None
+_lock = Lock ()
+
+def loadValidators ():
+    """
+    Get the response and error validators, compiled on first use.
+    Returns:
+        Tuple of (response validator, error validator).
+    Raises:
+        IOError if a schema cannot be read, ValueError if not JSON.
+    """
+    global _validators
+    with _lock:
+        if _validators is None:
+            _validators = tuple (Draft4Validator (_loadJson (join (
+              SCHEMA_DIR, name))) for name in (RESPONSE_SCHEMA,
+              ERROR_SCHEMA))
+    return _validators
+
+def requestBody (number1, number2):
+    """ Request body bytes for an addition. """
+    return dumps ({ "number1": number1, "number2": number2 }).encode (
+      "utf8")
+
+def percentile (latencies, fraction):
+    """ Latency at a fraction (0 to 1) of sorted latencies. """
+    if len (latencies) == 0:
+        return 0.0
+    return latencies[min (len (latencies) - 1,
+      int (len (latencies) * fraction))]
+
+class Result:
+    """
+    Result of an addition request, checked against its schema.
+    Args:
+        status HTTP status, 0 if the service could not be reached.
+        body Response body text, or the failure if not reached.
+        latency Seconds from sending the request to the response.
+    Attributes:
+        answer Answer of a valid response, else None.
+        error Error of a valid error response, or the failure if not
+          reached, else None.
+        valid Flag, response matched its schema.
+        reason Why the response is not valid, else None.
+    """
+    def __init__ (self, status, body, latency):
+        self.status = status
+        self.body = body
+        self.latency = latency
+        self.answer = None
+        self.error = None
+        self.valid = False
+        self.reason = None
+        if status == 0:
+            self.error = body
+            return
+
+        responseValidator, errorValidator = loadValidators ()
+        try:
+            content = loads (body)
+            if status == 200:
+                responseValidator.validate (content)
+                self.answer = content["answer"]
+            else:
+                errorValidator.validate (content)
+                self.error = content["error"]
+            self.valid = True
+        except Exception as e:
+            self.reason = str (e)
+
+class AdditionPool:
+    """
+    Addition service client on persistent connections, shared by
+    threads.
+    Args:
+        host Service host name.
+        port Service port.
+        size Idle connections kept, 0 for a connection per request.
+        timeout Seconds to wait for the service.
+    """
+    def __init__ (self, host="localhost", port=8303, size=8, timeout=10.0):
+        loadValidators ()
+        self.pool = ConnectionPool (host, port, size, timeout)
+
+    def add (self, number1, number2):
+        """ Request the sum of two numbers, returning a Result. """
+        return self.post (requestBody (number1, number2))
+
+    def post (self, body):
+        """
+        Post a request body.
+        Args:
+            body Request body bytes.
+        Returns:
+            Result.
+        """
+        start = time ()
+        try:
+            status, data = self.pool.request ("POST", "/", body, HEADERS)
+        except (HTTPException, socket.error) as e:
+            return Result (0, str (e), time () - start)
+        return Result (status, data.decode ("utf8"), time () - start)
+
+    def close (self):
+        """ Close the idle connections. """
+        self.pool.close ()
+
+    def stats (self):
+        """ Get pool statistics as a dict. """
+        return self.pool.stats ()
+
+def _loadJson (file):
+    """
+    Load JSON content from a file.
+    Raises:
+        IOError if not readable, ValueError if not JSON.
+    """
+    with open (file, "r") as f:
+        data = f.read ()
+    try:
+        return loads (data)
+    except ValueError as e:
+        raise ValueError (file + ": " + str (e))
@@ -4,23 +4,63 @@ at the proxy..
 
 Starts an HTTP proxy listening for addition requests.
 Inbound default port is 8303, outbound is 8304.
+
+Requests are validated before being forwarded, and responses from the
+service are validated before being returned. Since addition results are
+deterministic, responses can optionally be cached (-c cache size, -t
+time to live in seconds), so repeated requests never reach the service.
+Cache statistics are available with a GET request to /stats.
+
+Request bodies are read in bounded pieces and rejected early if larger
+than the maximum body size (-m bytes, 413) or nested deeper than the
+maximum depth (-d, 400), before being parsed or forwarded. Bodies may
+be sent with chunked transfer-encoding.
+
+Requests are handled on threads, with admission control and load
+shedding (see admission.py) so the proxy keeps its latency under
+overload. At most -l requests are handled at a time, with up to -q
+more waiting at most -w seconds for a slot; others are rejected at once
+(503). Each client address may make -r requests a second, in bursts of
+up to -b (429 beyond, 0 for no limit). Requests to the service time out
+after -u seconds, and after -f consecutive failures (errors, timeouts
+or 5xx responses) a circuit breaker rejects requests without forwarding
+them (503) for -s seconds, before letting a trial request through.
+Admission, rate limit and breaker counters are included in /stats.
 """
 try:
     # Python 3
     from http.server import BaseHTTPRequestHandler, HTTPServer
+    from http.client import HTTPException
+    from socketserver import ThreadingMixIn
     from urllib.request import urlopen
     from urllib.request import Request
-    from urllib.error import HTTPError
+    from urllib.error import HTTPError, URLError
 except ImportError:
     # Python 2
     from urllib2 import urlopen
     from urllib2 import Request
-    from urllib2 import HTTPError
+    from urllib2 import HTTPError, URLError
     from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from httplib import HTTPException
+    from SocketServer import ThreadingMixIn
 from argparse import ArgumentParser
-from json import loads
+from collections import OrderedDict
+from json import loads, dumps
 from jsonschema import Draft4Validator
+from threading import Lock
+from time import time
+import socket
 import sys
+from admission import AdmissionControl, RateLimiter, CircuitBreaker
+from requestBody import (readJson, discardBody, BodyError, MAX_BODY,
+  MAX_DEPTH)
+
+# error returned when the service response does not match its schema
+INVALID_RESPONSE = """{"error": "Invalid response from service"}"""
+# errors returned when a request is shed or the service is unavailable
+OVERLOADED = """{"error": "Service overloaded"}"""
+RATE_LIMITED = """{"error": "Too many requests"}"""
+UNAVAILABLE = """{"error": "Service unavailable"}"""
 
 def main ():
     """ Program entry point. """
@@ -30,112 +70,433 @@ class AdditionProxy:
     """ Start server for addition service. """
     def __init__ (self):
         """ Set port and start server """
-        # process command line for port number
+        # process command line for port number, cache and load settings
         self.inbound = 8303
         self.outbound = 8304
+        self.cacheSize = 0
+        self.cacheTtl = None
+        self.limit = 16
+        self.queueSize = 16
+        self.queueTimeout = 0.5
+        self.rate = 0.0
+        self.burst = None
+        self.failures = 5
+        self.reset = 5.0
         self.processCommand ()
 
+        # compile request and response validators before accepting requests
+        Handler.loadValidators ()
+
+        # create response cache if enabled
+        cache = None
+        if self.cacheSize > 0:
+            cache = ResponseCache (self.cacheSize, self.cacheTtl)
+
+        # admission control, rate limit and circuit breaker shared by the
+        # request threads
+        admission = AdmissionControl (self.limit, self.queueSize,
+          self.queueTimeout)
+        burst = self.burst
+        if burst is None:
+            burst = int (self.rate)
+        rateLimiter = RateLimiter (self.rate, burst)
+        breaker = CircuitBreaker (self.failures, self.reset)
+
         # listen for messages on specified port
         host = ("localhost", self.inbound)
-        server = ProxyHTTPServer (host, self.outbound, Handler)
+        server = ProxyHTTPServer (host, self.outbound, cache, Handler,
+          admission, rateLimiter, breaker)
         print ("Addition service proxy")
         print ("  Proxy for port " + str (self.outbound))
         print ("  Listening on port " + str (self.inbound))
+        if cache is not None:
+            print ("  Caching up to " + str (self.cacheSize) + " responses")
+        if self.limit > 0:
+            print ("  Handling up to " + str (self.limit) +
+              " requests at a time, " + str (self.queueSize) + " queued")
+        if self.rate > 0:
+            print ("  Limiting clients to " + str (self.rate) +
+              " requests a second")
         try:
             server.serve_forever ()
         except KeyboardInterrupt:
             server.shutdown ()
             server.server_close()
+            if cache is not None:
+                print ("Cache statistics " + dumps (cache.stats ()))
+            print ("Admission statistics " + dumps (admission.stats ()))
+            print ("Breaker statistics " + dumps (breaker.stats ()))
 
     def processCommand (self):
-        """ Get ports from command line arguments. """
+        """ Get ports, cache and load settings from command line arguments. """
         parser = ArgumentParser ()
         parser.add_argument ("-i", "--inbound", type=int, dest="inbound",
           action="store", help="Inbound port")
         parser.add_argument ("-o", "--outbound", type=int, dest="outbound",
           action="store", help="Outbound port")
+        parser.add_argument ("-c", "--cache", type=int, dest="cacheSize",
+          action="store", help="Number of responses to cache (0 disables)")
+        parser.add_argument ("-t", "--ttl", type=float, dest="cacheTtl",
+          action="store", help="Seconds a cached response remains valid")
+        parser.add_argument ("-m", "--max-body", type=int, dest="maxBody",
+          action="store", help="Largest request body in bytes (0 no limit)")
+        parser.add_argument ("-d", "--max-depth", type=int, dest="maxDepth",
+          action="store", help="Deepest request nesting (0 no limit)")
+        parser.add_argument ("-l", "--limit", type=int, dest="limit",
+          action="store", help="Most requests handled at a time (0 no limit)")
+        parser.add_argument ("-q", "--queue", type=int, dest="queueSize",
+          action="store", help="Most requests waiting to be handled")
+        parser.add_argument ("-w", "--queue-wait", type=float,
+          dest="queueTimeout", action="store",
+          help="Seconds a request may wait to be handled")
+        parser.add_argument ("-r", "--rate", type=float, dest="rate",
+          action="store", help="Requests a second per client (0 no limit)")
+        parser.add_argument ("-b", "--burst", type=int, dest="burst",
+          action="store", help="Requests a client may make at once")
+        parser.add_argument ("-u", "--upstream-timeout", type=float,
+          dest="upstreamTimeout", action="store",
+          help="Seconds to wait for the service")
+        parser.add_argument ("-f", "--failures", type=int, dest="failures",
+          action="store",
+          help="Service failures opening the circuit breaker (0 never)")
+        parser.add_argument ("-s", "--reset", type=float, dest="reset",
+          action="store", help="Seconds the circuit breaker stays open")
         args = parser.parse_args ()
         if args.inbound is not None:
             self.inbound = args.inbound
         if args.outbound is not None:
             self.outbound = args.outbound
+        if args.cacheSize is not None:
+            self.cacheSize = args.cacheSize
+        if args.cacheTtl is not None:
+            self.cacheTtl = args.cacheTtl
+        if args.maxBody is not None:
+            Handler.maxBody = args.maxBody
+        if args.maxDepth is not None:
+            Handler.maxDepth = args.maxDepth
+        if args.limit is not None:
+            self.limit = args.limit
+        if args.queueSize is not None:
+            self.queueSize = max (args.queueSize, 0)
+        if args.queueTimeout is not None:
+            self.queueTimeout = args.queueTimeout
+        if args.rate is not None:
+            self.rate = args.rate
+        if args.burst is not None:
+            self.burst = args.burst
+        if args.upstreamTimeout is not None:
+            Handler.upstreamTimeout = args.upstreamTimeout
+        if args.failures is not None:
+            self.failures = args.failures
+        if args.reset is not None:
+            self.reset = args.reset
 
-class ProxyHTTPServer (HTTPServer, object):
+class ProxyHTTPServer (ThreadingMixIn, HTTPServer, object):
     """
-    HTTPServer subclass to hold outbound port
+    Threaded HTTPServer subclass to hold outbound port, response cache,
+    admission control, rate limit and circuit breaker
     """
-    def __init__ (self, host, outbound, handler):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__ (self, host, outbound, cache, handler, admission,
+      rateLimiter, breaker):
         super (ProxyHTTPServer, self).__init__ (host, handler)
         self.outbound = outbound
+        self.cache = cache
+        self.admission = admission
+        self.rateLimiter = rateLimiter
+        self.breaker = breaker
+
+class ResponseCache:
+    """
+    Bounded least recently used cache of service responses, shared by
+    the request threads.
+    Args:
+        size Maximum number of responses held.
+        ttl Seconds an entry remains valid, None for no expiry.
+    """
+    def __init__ (self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict ()
+        self.lock = Lock ()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    @staticmethod
+    def key (request):
+        """
+        Build cache key from a request object. Keys are sorted and
+        whitespace removed so equivalent requests share one entry.
+        """
+        return dumps (request, sort_keys=True, separators=(",", ":"))
+
+    def get (self, key):
+        """
+        Get cached response for key.
+        Returns:
+            Tuple of (status, body), or None if not cached.
+        """
+        with self.lock:
+            entry = self.entries.get (key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires, status, body = entry
+            if expires is not None and expires <= time ():
+                del self.entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+
+            # mark entry as most recently used
+            del self.entries[key]
+            self.entries[key] = entry
+            self.hits += 1
+            return status, body
+
+    def put (self, key, status, body):
+        """ Add a response, evicting the least recently used if full. """
+        expires = None
+        if self.ttl is not None:
+            expires = time () + self.ttl
+
+        with self.lock:
+            if key in self.entries:
+                del self.entries[key]
+            elif len (self.entries) >= self.size:
+                self.entries.popitem (last=False)
+                self.evicted += 1
+            self.entries[key] = (expires, status, body)
+
+    def stats (self):
+        """ Get cache statistics as a dict. """
+        with self.lock:
+            lookups = self.hits + self.misses
+            hitRate = 0.0
+            if lookups > 0:
+                hitRate = float (self.hits) / lookups
+            return {
+                "size": len (self.entries),
+                "capacity": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "hitRate": round (hitRate, 4)
+            }
 
 class Handler (BaseHTTPRequestHandler):
     """ HTTP request handler """
-    # class static, only load once
-    requestSchema = None
+    # class static, only compile once
+    requestValidator = None
+    responseValidator = None
+    errorValidator = None
+    # request body limits, and seconds to wait for a slow client and for
+    # the service
+    maxBody = MAX_BODY
+    maxDepth = MAX_DEPTH
+    timeout = 10
+    upstreamTimeout = 5.0
 
-    def loadRequestSchema (self):
-        """ load request schema from file (once only) """
-        # Load JSON Schema to validate input against
-        try:
-            # read the file and convert to a JSON object
-            data = open ("addRequest_schema.json", "rU").read ()
-        except IOError as e:
-            print ("Error loading input schema: " + e.strerror)
-            sys.exit (1)
+    @staticmethod
+    def loadValidators ():
+        """ load schemas from file and compile validators (once only) """
+        Handler.requestValidator = _loadValidator ("addRequest_schema.json")
+        Handler.responseValidator = _loadValidator ("addResponse_schema.json")
+        Handler.errorValidator = _loadValidator ("addError_schema.json")
 
-        try:
-            Handler.requestSchema = loads (data)
-        except Exception as e:
-            print ("Invalid JSON content in input schema")
-            sys.exit (1)
+    def do_GET (self):
+        """ process GET, return cache, admission and breaker statistics """
+        if self.path != "/stats":
+            self.send_error (404)
+            return
+
+        stats = { "enabled": False }
+        if self.server.cache is not None:
+            stats = self.server.cache.stats ()
+            stats["enabled"] = True
+        stats["admission"] = self.server.admission.stats ()
+        stats["rateLimit"] = self.server.rateLimiter.stats ()
+        stats["breaker"] = self.server.breaker.stats ()
+        self.sendJson (200, dumps (stats))
 
     # web processing logic goes here
     def do_POST (self):
-        """ process POST, generate response """
+        """ process POST, shedding load before generating a response """
         print ("Request received")
 
-        # if inputSchema not loaded, load once
-        if Handler.requestSchema is None:
-            Handler.loadRequestSchema (self)
+        # reject clients over their rate, and requests beyond the limit
+        # and queue, before reading or forwarding them
+        rateLimiter = self.server.rateLimiter
+        if not rateLimiter.allow (self.client_address[0]):
+            print ("Client over rate limit: " + self.client_address[0])
+            self.reject (429, RATE_LIMITED, rateLimiter.retryAfter ())
+            return
+        admission = self.server.admission
+        if not admission.admit ():
+            print ("Overloaded, request rejected")
+            self.reject (503, OVERLOADED, 1)
+            return
+        try:
+            self.proxyRequest ()
+        finally:
+            admission.release ()
+
+    def proxyRequest (self):
+        """ Validate request, generate response from cache or service """
+        # if validators not compiled, compile once
+        if Handler.requestValidator is None:
+            Handler.loadValidators ()
 
         contentType = self.headers["content-type"]
         if contentType != "application/json":
             print ("Invalid content type: " + contentType)
         else:
-            length = int (self.headers["Content-Length"])
-            data = self.rfile.read (length).decode ("utf8")
+            # read body within limits, rejecting before parsing
+            try:
+                data, dataIn = readJson (self, Handler.maxBody,
+                  Handler.maxDepth)
+            except BodyError as e:
+                print ("Request body rejected: " + e.message)
+                self.close_connection = True
+                self.sendJson (e.status, e.body ())
+                return
             print ("addition body = " + data)
-            dataIn = loads (data)
 
             #validate
             try:
                 print ("ready to validate")
-                validator = Draft4Validator (Handler.requestSchema)
-                validator.validate (dataIn)
-
-                # make request on outbound port
-                url = "http://localhost:" + str (self.server.outbound) + "/"
-                headers = { "Content-type": "application/json" }
-                try:
-                    print ("Make request to " + url)
-                    req = Request (url, data.encode ('utf8'), headers)
-                    response = urlopen (req)
-                    dataOut = response.read ().decode ("utf8")
-                    print ("Dataout " + dataOut)
-                    self.send_response (200)
-                except HTTPError as e:
-                    print ("HTTPError " + str (e))
-                    dataOut = ''
-                    self.send_response(e.code)
+                Handler.requestValidator.validate (dataIn)
             except Exception as e:
                 # if validation failed, return error
                 print (e)
-                dataOut = """{"error": "Invalid request"}"""
-                self.send_response (400)
+                self.sendJson (400, """{"error": "Invalid request"}""")
+                return
+
+            # return cached response if available
+            cache = self.server.cache
+            if cache is not None:
+                key = ResponseCache.key (dataIn)
+                cached = cache.get (key)
+                if cached is not None:
+                    print ("Cache hit")
+                    self.sendJson (cached[0], cached[1])
+                    return
+
+            status, dataOut = self.forwardRequest (data)
+
+            # only cache responses that passed validation, from a service
+            # that was available
+            if cache is not None and status < 500:
+                cache.put (key, status, dataOut)
+            self.sendJson (status, dataOut)
+
+    def forwardRequest (self, data):
+        """
+        Make request on outbound port and validate the response, unless
+        the circuit breaker is open.
+        Args:
+            data Request body text.
+        Returns:
+            Tuple of (status, body) to return to the client.
+        """
+        breaker = self.server.breaker
+        if not breaker.allow ():
+            print ("Circuit open, request not forwarded")
+            return 503, UNAVAILABLE
+
+        url = "http://localhost:" + str (self.server.outbound) + "/"
+        headers = { "Content-type": "application/json" }
+        try:
+            print ("Make request to " + url)
+            req = Request (url, data.encode ('utf8'), headers)
+            response = urlopen (req, timeout=Handler.upstreamTimeout)
+            status = 200
+            dataOut = response.read ().decode ("utf8")
+            validator = Handler.responseValidator
+        except HTTPError as e:
+            print ("HTTPError " + str (e))
+            status = e.code
+            try:
+                dataOut = e.read ().decode ("utf8")
+            except (HTTPException, socket.error):
+                status = 0
+            validator = Handler.errorValidator
+        except (URLError, HTTPException, socket.error) as e:
+            status = 0
+            print ("Service unavailable: " + str (e))
+
+        # errors, timeouts and service errors count towards opening the
+        # circuit
+        if status == 0 or status >= 500:
+            breaker.failure ()
+        else:
+            breaker.success ()
+        if status == 0:
+            return 503, UNAVAILABLE
+        print ("Dataout " + dataOut)
+
+        # verify service response matches its schema
+        try:
+            validator.validate (loads (dataOut))
+        except Exception as e:
+            print ("Invalid response from service: " + str (e))
+            return 502, INVALID_RESPONSE
+        return status, dataOut
+
+    def reject (self, status, body, retryAfter):
+        """
+        Send a rejection, dropping the unread request body, and close
+        the connection.
+        Args:
+            status HTTP status.
+            body JSON body.
+            retryAfter Seconds the client should wait before retrying.
+        """
+        discardBody (self, Handler.maxBody)
+        self.close_connection = True
+        self.sendJson (status, body, { "Retry-After": str (retryAfter) })
+
+    def sendJson (self, status, body, headers=None):
+        """ Send response with JSON body, and any extra headers. """
+        content = body.encode ("utf8")
+        self.send_response (status)
+        self.send_header ("Content-type", "application/json")
+        self.send_header ("Content-Length", str (len (content)))
+        for name, value in (headers or {}).items ():
+            self.send_header (name, value)
+        if self.close_connection:
+            self.send_header ("Connection", "close")
+        self.end_headers ()
+        self.wfile.write (content)
+
+def _loadValidator (file):
+    """
+    Load schema from file and compile a validator.
+    Args:
+        file Schema file name.
+    Returns:
+        Draft4Validator for the schema.
+    """
+    try:
+        # read the file and convert to a JSON object
+        data = open (file, "r").read ()
+    except IOError as e:
+        print ("Error loading schema " + file + ": " + e.strerror)
+        sys.exit (1)
+
+    try:
+        schema = loads (data)
+    except Exception as e:
+        print ("Invalid JSON content in schema " + file)
+        sys.exit (1)
 
-            self.send_header ("Content-type", "application/json")
-            self.end_headers ()
-            self.wfile.write (dataOut.encode ("utf8"))
+    return Draft4Validator (schema)
 
 if __name__ == "__main__":
     main ()
@@ -3,16 +3,28 @@ Addition service using JSON and JSON Schema.
 
 Starts an HTTP server listening for addition requests.
 Server default port is 8303.
+
+Request bodies are read in bounded pieces and rejected early if larger
+than the maximum body size (-m bytes, 413) or nested deeper than the
+maximum depth (-d, 400), before being parsed. Bodies may be sent with
+chunked transfer-encoding.
+
+Connections are kept open between requests (HTTP/1.1, each response
+with a Content-Length) and served on their own threads, so pooled
+clients reuse them, and pipelined requests are answered in order.
 """
 try:
     # Python 3
     from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
 except ImportError:
     # Python 2
     from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
 from argparse import ArgumentParser
 from json import loads, dumps
 from jsonschema import Draft4Validator
+from requestBody import readJson, BodyError, MAX_BODY, MAX_DEPTH
 import sys
 
 def main ():
@@ -23,12 +35,16 @@ class AdditionService:
     """ Start server for addition service. """
     def __init__ (self):
         """ Set port and start server """
-        # process command line for port number
+        # process command line for port number and body limits
         self.port = 8303
         self.processCommand ()
 
+        # compile request validator before accepting requests, as the
+        # requests are handled on their own threads
+        Handler.loadRequestSchema ()
+
         # listen for messages on specified port
-        server = HTTPServer (("localhost", self.port), Handler)
+        server = AdditionHTTPServer (("localhost", self.port), Handler)
         print ("Addition service listening on port " + str (self.port))
         try:
             server.serve_forever ()
@@ -37,25 +53,49 @@ class AdditionService:
             server.server_close()
 
     def processCommand (self):
-        """ Get port from command line arguments. """
+        """ Get port and body limits from command line arguments. """
         parser = ArgumentParser ()
         parser.add_argument ("-p", "--port", type=int, dest="port",
           action="store", help="Port to make requests on")
+        parser.add_argument ("-m", "--max-body", type=int, dest="maxBody",
+          action="store", help="Largest request body in bytes (0 no limit)")
+        parser.add_argument ("-d", "--max-depth", type=int, dest="maxDepth",
+          action="store", help="Deepest request nesting (0 no limit)")
         args = parser.parse_args ()
         if args.port is not None:
             self.port = args.port
+        if args.maxBody is not None:
+            Handler.maxBody = args.maxBody
+        if args.maxDepth is not None:
+            Handler.maxDepth = args.maxDepth
+
+class AdditionHTTPServer (ThreadingMixIn, HTTPServer):
+    """ HTTPServer serving each connection on its own thread """
+    daemon_threads = True
+    request_queue_size = 128
 
 class Handler (BaseHTTPRequestHandler):
     """ HTTP request handler """
-    # class static, only load once
+    # class static, only load and compile once
     requestSchema = None
+    requestValidator = None
+    # request body limits, and seconds to wait for a slow client or
+    # the next request on a kept open connection
+    maxBody = MAX_BODY
+    maxDepth = MAX_DEPTH
+    timeout = 10
+    # keep connections open between requests, sending small responses
+    # without waiting for acknowledgements
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
 
-    def loadRequestSchema (self):
+    @staticmethod
+    def loadRequestSchema ():
         """ load request schema from file (once only) """
         # Load JSON Schema to validate input against
         try:
             # read the file and convert to a JSON object
-            data = open ("addRequest_schema.json", "rU").read ()
+            data = open ("addRequest_schema.json", "r").read ()
         except IOError as e:
             print ("Error loading input schema: " + e.strerror)
             sys.exit (1)
@@ -65,30 +105,40 @@ class Handler (BaseHTTPRequestHandler):
         except Exception as e:
             print ("Invalid JSON content in input schema")
             sys.exit (1)
+        Handler.requestValidator = Draft4Validator (Handler.requestSchema)
 
     # web processing logic goes here
     def do_POST (self):
         """ process POST, generate response """
         print ("Request received")
 
-        # if inputSchema not loaded, load once
-        if Handler.requestSchema is None:
-            Handler.loadRequestSchema (self)
-
         contentType = self.headers["content-type"]
         if contentType != "application/json":
-            print ("Invalid content type: " + contentType)
+            print ("Invalid content type: " + str (contentType))
+            # no response, the body is not read
+            self.close_connection = True
         else:
-            length = int (self.headers["Content-Length"])
-            data = self.rfile.read (length).decode ("utf8")
+            # read body within limits, rejecting before parsing
+            try:
+                data, dataIn = readJson (self, Handler.maxBody,
+                  Handler.maxDepth)
+            except BodyError as e:
+                print ("Request body rejected: " + e.message)
+                self.close_connection = True
+                result = e.body ().encode ("utf8")
+                self.send_response (e.status)
+                self.send_header ("Content-type", "application/json")
+                self.send_header ("Content-Length", str (len (result)))
+                self.send_header ("Connection", "close")
+                self.end_headers ()
+                self.wfile.write (result)
+                return
             print ("addition body = " + data)
-            dataIn = loads (data)
 
             #validate
             try:
                 print ("start validate")
-                validator = Draft4Validator (Handler.requestSchema)
-                validator.validate (dataIn)
+                Handler.requestValidator.validate (dataIn)
                 print ("validated")
 
                 answer = dataIn["number1"] + dataIn["number2"]
@@ -101,9 +151,11 @@ class Handler (BaseHTTPRequestHandler):
                 result = """{"error": "Invalid request"}"""
                 self.send_response (400)
 
+            result = result.encode ("utf8")
             self.send_header ("Content-type", "application/json")
+            self.send_header ("Content-Length", str (len (result)))
             self.end_headers ()
-            self.wfile.write (result.encode ("utf8"))
+            self.wfile.write (result)
 
 if __name__ == "__main__":
     main ()
@@ -0,0 +1,238 @@
+"""
+Admission control and load shedding for the addition proxy.
+
+AdmissionControl bounds the requests in flight, with a short queue of
+requests waiting for a slot: when the queue is full, or a request waits
+longer than the queue timeout, it is rejected at once (503), so under
+overload the requests admitted keep their latency, rather than all of
+them waiting in the socket backlog and on the service.
+
+RateLimiter keeps a token bucket per client address, refilled at rate
+tokens per second up to burst, each request taking a token, so one
+client cannot take all the capacity (429).
+
+CircuitBreaker wraps calls to the service: after failures consecutive
+failures (errors, timeouts or 5xx responses) it opens, and calls fail
+at once for reset seconds, rather than each waiting on a slow or failed
+service. It then lets one trial call through (half open), closing again
+if the call succeeds.
+
+Each has stats returning its counters as a dict, and is shared by the
+proxy's request threads.
+"""
+from threading import Condition, Lock
+from time import time
+
+# circuit breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+class AdmissionControl:
+    """
+    Limit of requests in flight, with a short bounded queue.
+    Args:
+        limit Most requests in flight, 0 for no limit.
+        queueSize Most requests waiting for a slot.
+        queueTimeout Seconds a request may wait for a slot.
+    """
+    def __init__ (self, limit, queueSize, queueTimeout):
+        self.limit = limit
+        self.queueSize = queueSize
+        self.queueTimeout = queueTimeout
+        self.available = Condition (Lock ())
+        self.inFlight = 0
+        self.queued = 0
+        self.maxQueued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timedOut = 0
+
+    def admit (self):
+        """
+        Take a slot for a request, waiting in the queue if none is free.
+        Returns:
+            True if admitted, to be followed by release, False if the
+            queue is full or the wait timed out.
+        """
+        with self.available:
+            if self.limit <= 0 or self.inFlight < self.limit:
+                self.inFlight += 1
+                self.admitted += 1
+                return True
+            if self.queued >= self.queueSize:
+                self.rejected += 1
+                return False
+
+            self.queued += 1
+            self.maxQueued = max (self.maxQueued, self.queued)
+            deadline = time () + self.queueTimeout
+            try:
+                while self.inFlight >= self.limit:
+                    remaining = deadline - time ()
+                    if remaining <= 0:
+                        self.timedOut += 1
+                        return False
+                    self.available.wait (remaining)
+            finally:
+                self.queued -= 1
+            self.inFlight += 1
+            self.admitted += 1
+            return True
+
+    def release (self):
+        """ Free the slot of an admitted request. """
+        with self.available:
+            self.inFlight -= 1
+            self.available.notify ()
+
+    def stats (self):
+        """ Get admission counters as a dict. """
+        with self.available:
+            return {
+                "limit": self.limit,
+                "inFlight": self.inFlight,
+                "queueSize": self.queueSize,
+                "queued": self.queued,
+                "maxQueued": self.maxQueued,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timedOut": self.timedOut
+            }
+
+class RateLimiter:
+    """
+    Token bucket per client.
+    Args:
+        rate Tokens added per second, 0 for no limit.
+        burst Most tokens held, the requests allowed at once.
+        maxClients Buckets kept, idle clients' full buckets are dropped
+          beyond this.
+    """
+    def __init__ (self, rate, burst, maxClients=10000):
+        self.rate = rate
+        self.burst = max (burst, 1)
+        self.maxClients = maxClients
+        self.lock = Lock ()
+        # client to (tokens, time of last update)
+        self.buckets = {}
+        self.allowed = 0
+        self.limited = 0
+
+    def allow (self, client):
+        """
+        Take a token for a request from a client.
+        Returns:
+            True if allowed, False if the client is over its rate.
+        """
+        if self.rate <= 0:
+            return True
+        now = time ()
+        with self.lock:
+            tokens, last = self.buckets.get (client, (self.burst, now))
+            tokens = min (self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self.buckets[client] = (tokens, now)
+                self.limited += 1
+                return False
+            self.buckets[client] = (tokens - 1, now)
+            self.allowed += 1
+            if len (self.buckets) > self.maxClients:
+                self._prune (now)
+            return True
+
+    def retryAfter (self):
+        """ Seconds until a limited client has a token again. """
+        return max (1, int (1.0 / self.rate + 0.999)) if self.rate > 0 else 0
+
+    def _prune (self, now):
+        """ Drop buckets that have refilled, as their clients are idle. """
+        full = (self.burst - 1) / float (self.rate)
+        for client, (tokens, last) in list (self.buckets.items ()):
+            if now - last >= full:
+                del self.buckets[client]
+
+    def stats (self):
+        """ Get rate limit counters as a dict. """
+        with self.lock:
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "clients": len (self.buckets),
+                "allowed": self.allowed,
+                "limited": self.limited
+            }
+
+class CircuitBreaker:
+    """
+    Circuit breaker for calls to a service.
+    Args:
+        failures Consecutive failures that open the circuit, 0 to never
+          open.
+        reset Seconds the circuit stays open before a trial call.
+    """
+    def __init__ (self, failures, reset):
+        self.failures = failures
+        self.reset = reset
+        self.lock = Lock ()
+        self.state = CLOSED
+        self.consecutive = 0
+        self.openedAt = 0.0
+        self.trial = False
+        self.opened = 0
+        self.shortCircuited = 0
+        self.succeeded = 0
+        self.failed = 0
+
+    def allow (self):
+        """
+        Check if a call may be made, taking the trial call when half
+        open.
+        Returns:
+            True if the call may be made, to be followed by success or
+            failure, False if the circuit is open.
+        """
+        with self.lock:
+            # a trial call not heard from within reset seconds is replaced
+            if self.state != CLOSED and time () - self.openedAt >= self.reset:
+                self.state = HALF_OPEN
+                self.trial = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self.trial:
+                self.trial = True
+                self.openedAt = time ()
+                return True
+            self.shortCircuited += 1
+            return False
+
+    def success (self):
+        """ Record a successful call, closing the circuit. """
+        with self.lock:
+            self.succeeded += 1
+            self.consecutive = 0
+            self.state = CLOSED
+
+    def failure (self):
+        """ Record a failed call, opening the circuit if enough failed. """
+        with self.lock:
+            self.failed += 1
+            self.consecutive += 1
+            if self.state == HALF_OPEN or (self.failures > 0 and
+              self.consecutive >= self.failures):
+                if self.state != OPEN:
+                    self.opened += 1
+                self.state = OPEN
+                self.openedAt = time ()
+
+    def stats (self):
+        """ Get breaker state and counters as a dict. """
+        with self.lock:
+            return {
+                "state": self.state,
+                "consecutiveFailures": self.consecutive,
+                "opened": self.opened,
+                "shortCircuited": self.shortCircuited,
+                "succeeded": self.succeeded,
+                "failed": self.failed
+            }
@@ -0,0 +1,196 @@
+"""
+Benchmark for admission control and load shedding in the addition proxy.
+
+Runs the proxy (additionProxy.py) in front of a stub service with a
+fixed capacity, a number of requests handled at a time each taking a
+delay, and reports for each proxy setting:
+  - overload: clients offering more requests a second than the service
+    can handle, the requests answered and rejected a second, and the
+    latency of the answered requests, timed from when each request was
+    due to be sent, so time waiting behind earlier requests counts
+  - hung service: the service stops answering, the latency of all the
+    responses, and the requests still unanswered when the clients give
+    up waiting
+
+Usage: python admissionBenchmark.py [-c clients] [-r rate] [-t seconds]
+         [-w workers] [-d delay ms]
+"""
+try:
+    # Python 3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from http.client import HTTPConnection, HTTPException
+    from socketserver import ThreadingMixIn
+except ImportError:
+    # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from httplib import HTTPConnection, HTTPException
+    from SocketServer import ThreadingMixIn
+from argparse import ArgumentParser
+from json import loads, dumps
+from os.path import dirname
+from threading import Thread, Semaphore
+from time import time, sleep
+import os
+import socket
+import subprocess
+import sys
+from additionPool import percentile
+
+# proxy settings compared, as additionProxy.py arguments
+SETTINGS = [
+  ("no limits", ["-l", "0", "-f", "0", "-u", "60"]),
+  ("limit 8, queue 8", ["-l", "8", "-q", "8", "-w", "0.1", "-u", "1"])
+]
+
+class StubHTTPServer (ThreadingMixIn, HTTPServer, object):
+    """ Threaded service handling workers requests at a time. """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__ (self, host, handler, workers, delay):
+        super (StubHTTPServer, self).__init__ (host, handler)
+        self.workers = Semaphore (workers)
+        self.delay = delay
+
+class StubHandler (BaseHTTPRequestHandler):
+    """ Service returning the sum of the numbers after a delay. """
+    def do_POST (self):
+        dataIn = loads (self.rfile.read (int (
+          self.headers["Content-Length"])).decode ("utf8"))
+        with self.server.workers:
+            sleep (self.server.delay)
+        body = dumps ({ "answer": dataIn["number1"] + dataIn["number2"] })
+        body = body.encode ("utf8")
+        try:
+            self.send_response (200)
+            self.send_header ("Content-type", "application/json")
+            self.send_header ("Content-Length", str (len (body)))
+            self.end_headers ()
+            self.wfile.write (body)
+        except socket.error:
+            pass
+
+    def log_message (self, format, *args):
+        pass
+
+def client (port, due, timeout, results):
+    """ Post a request at each due time, recording status and latency. """
+    headers = { "Content-type": "application/json" }
+    body = dumps ({ "number1": 15, "number2": 24 }).encode ("utf8")
+    for start in due:
+        if start > time ():
+            sleep (start - time ())
+        connection = HTTPConnection ("localhost", port, timeout=timeout)
+        try:
+            connection.request ("POST", "/", body, headers)
+            response = connection.getresponse ()
+            response.read ()
+            status = response.status
+        except (HTTPException, socket.error):
+            status = 0
+        connection.close ()
+        results.append ((status, time () - start))
+
+def offer (port, clients, rate, seconds, timeout):
+    """
+    Offer rate requests a second for seconds from client threads.
+    Returns:
+        List of (status, seconds from due time), status 0 if unanswered.
+    """
+    results = []
+    start = time () + 0.1
+    count = int (rate * seconds)
+    threads = [Thread (target=client, args=(port, [start + index /
+      float (rate) for index in range (thread, count, clients)], timeout,
+      results)) for thread in range (clients)]
+    for thread in threads:
+        thread.start ()
+    for thread in threads:
+        thread.join ()
+    return results
+
+def report (name, results, seconds):
+    """ Print answered and rejected rates and latencies. """
+    answered = sorted (latency * 1000 for status, latency in results
+      if status == 200)
+    rejected = sum (1 for status, latency in results
+      if status in (429, 503))
+    unanswered = sum (1 for status, latency in results if status == 0)
+    every = sorted (latency * 1000 for status, latency in results)
+    print ("%-18s %9.0f %9.0f %8d %9.1f %9.1f %9.1f" % (name,
+      len (answered) / seconds, rejected / seconds, unanswered,
+      percentile (answered, 0.5), percentile (answered, 0.99),
+      percentile (every, 0.99)))
+
+def startProxy (port, outbound, arguments):
+    """ Start the proxy, waiting until it accepts connections. """
+    directory = dirname (os.path.abspath (__file__))
+    with open (os.devnull, "w") as devnull:
+        proxy = subprocess.Popen ([sys.executable, "-W", "ignore",
+          "additionProxy.py", "-i", str (port), "-o", str (outbound)] +
+          arguments, cwd=directory, stdout=devnull, stderr=devnull)
+    for attempt in range (100):
+        try:
+            socket.create_connection (("localhost", port), 1).close ()
+            return proxy
+        except socket.error:
+            sleep (0.1)
+    proxy.kill ()
+    raise RuntimeError ("proxy did not start")
+
+def freePort ():
+    """ Get a port free for the proxy to listen on. """
+    listener = socket.socket ()
+    listener.bind (("localhost", 0))
+    port = listener.getsockname ()[1]
+    listener.close ()
+    return port
+
+def main ():
+    """ Run admission benchmark. """
+    parser = ArgumentParser (prog="admissionBenchmark")
+    parser.add_argument ("-c", "--clients", type=int, default=64,
+      help="Client threads")
+    parser.add_argument ("-r", "--rate", type=float, default=400,
+      help="Requests a second offered")
+    parser.add_argument ("-t", "--time", type=float, default=5,
+      help="Seconds to offer requests for")
+    parser.add_argument ("-w", "--workers", type=int, default=4,
+      help="Requests the service handles at a time")
+    parser.add_argument ("-d", "--delay", type=float, default=20,
+      help="Milliseconds the service takes for a request")
+    args = parser.parse_args ()
+
+    service = StubHTTPServer (("localhost", 0), StubHandler, args.workers,
+      args.delay / 1000.0)
+    Thread (target=service.serve_forever).start ()
+    outbound = service.server_address[1]
+    print ("service capacity %.0f requests/s, offered %.0f requests/s" % (
+      args.workers * 1000.0 / args.delay, args.rate))
+
+    try:
+        for scenario in ("overload", "hung service"):
+            print ("%s\n%-18s %9s %9s %8s %9s %9s %9s" % (scenario,
+              "proxy", "answered", "rejected", "no reply", "p50 ms",
+              "p99 ms", "all p99"))
+            for name, arguments in SETTINGS:
+                service.delay = args.delay / 1000.0
+                rate = args.rate
+                if scenario == "hung service":
+                    service.delay = 30.0
+                    rate = args.rate / 10
+                port = freePort ()
+                proxy = startProxy (port, outbound, arguments)
+                try:
+                    results = offer (port, args.clients, rate, args.time,
+                      5.0)
+                finally:
+                    proxy.kill ()
+                    proxy.wait ()
+                report (name, results, args.time)
+    finally:
+        service.shutdown ()
+        service.server_close ()
+
+if __name__ == "__main__":
+    main ()
@@ -0,0 +1,139 @@
+"""
+Oversized request flood benchmark for the addition service.
+
+Starts additionService.py with request body limits, and again without
+(-m 0 -d 0), and measures the latency of a well behaved client sending
+small addition requests, first alone and then while flood clients send
+oversized and deeply nested bodies. With limits, flood requests are
+rejected from their headers or first pieces, so the well behaved
+client's latency stays close to its latency without the flood.
+
+Usage: python bodyBenchmark.py [-p port] [-f flood clients]
+         [-s flood body MB] [-r requests]
+"""
+try:
+    # Python 3
+    from http.client import HTTPConnection
+except ImportError:
+    # Python 2
+    from httplib import HTTPConnection
+from argparse import ArgumentParser
+from json import dumps
+from os.path import dirname, join
+from subprocess import Popen
+from threading import Thread, Event
+from time import sleep, time
+import os
+import socket
+import sys
+
+SERVICE = join (dirname (os.path.abspath (__file__)), "additionService.py")
+
+def startService (port, limits):
+    """ Start the service, waiting until it accepts connections. """
+    args = [sys.executable, SERVICE, "-p", str (port)]
+    if not limits:
+        args += ["-m", "0", "-d", "0"]
+    devnull = open (os.devnull, "w")
+    process = Popen (args, cwd=dirname (SERVICE), stdout=devnull,
+      stderr=devnull)
+    for attempt in range (100):
+        try:
+            socket.create_connection (("localhost", port), 0.1).close ()
+            return process
+        except socket.error:
+            sleep (0.05)
+    process.kill ()
+    raise RuntimeError ("service did not start")
+
+def flood (port, body, stop, counts):
+    """ Send oversized requests until stopped, counting responses. """
+    while not stop.is_set ():
+        connection = None
+        try:
+            connection = socket.create_connection (("localhost", port), 30)
+            connection.sendall ((
+              "POST / HTTP/1.1\r\nHost: localhost\r\n"
+              "Content-Type: application/json\r\n"
+              "Content-Length: %d\r\n\r\n" % len (body)).encode ("ascii"))
+            connection.sendall (body)
+            connection.recv (1024)
+            counts["sent"] += 1
+        except socket.error:
+            # rejected and closed while still sending
+            counts["reset"] += 1
+        finally:
+            if connection is not None:
+                connection.close ()
+
+def measure (port, requests):
+    """ Latencies of small addition requests, one at a time. """
+    body = dumps ({ "number1": 3, "number2": 4 })
+    headers = { "Content-type": "application/json" }
+    latencies = []
+    for request in range (requests):
+        start = time ()
+        connection = HTTPConnection ("localhost", port, timeout=60)
+        connection.request ("POST", "/", body, headers)
+        response = connection.getresponse ()
+        response.read ()
+        connection.close ()
+        if response.status != 200:
+            raise RuntimeError ("status " + str (response.status))
+        latencies.append (time () - start)
+    latencies.sort ()
+    return latencies
+
+def report (name, latencies):
+    """ Print latency percentiles in ms. """
+    def at (fraction):
+        return latencies[min (len (latencies) - 1,
+          int (len (latencies) * fraction))] * 1000
+    print ("%-22s %8.2f %8.2f %8.2f" % (name, at (0.5), at (0.99),
+      latencies[-1] * 1000))
+
+def main ():
+    """ Run benchmark with and without limits. """
+    parser = ArgumentParser (prog="bodyBenchmark")
+    parser.add_argument ("-p", "--port", type=int, default=8313,
+      help="Port for the service")
+    parser.add_argument ("-f", "--flood", type=int, default=4,
+      help="Flood clients")
+    parser.add_argument ("-s", "--size", type=float, default=4.0,
+      help="Flood body size in MB")
+    parser.add_argument ("-r", "--requests", type=int, default=100,
+      help="Well behaved requests per phase")
+    args = parser.parse_args ()
+
+    # half the flood is large arrays, half deeply nested arrays
+    size = int (args.size * 1048576)
+    large = ("[" + ",".join (["1"] * (size // 2)) + "]").encode ("ascii")
+    deep = ("[" * (size // 2) + "]" * (size // 2)).encode ("ascii")
+
+    print ("%-22s %8s %8s %8s" % ("service", "p50 ms", "p99 ms", "max ms"))
+    for limits in (True, False):
+        process = startService (args.port, limits)
+        try:
+            name = "limits" if limits else "no limits"
+            report (name, measure (args.port, args.requests))
+
+            stop = Event ()
+            counts = { "sent": 0, "reset": 0 }
+            threads = [Thread (target=flood, args=(args.port,
+              large if index % 2 == 0 else deep, stop, counts))
+              for index in range (args.flood)]
+            for thread in threads:
+                thread.start ()
+            sleep (0.5)
+            report (name + " + flood", measure (args.port, args.requests))
+            stop.set ()
+            for thread in threads:
+                thread.join ()
+            print ("  flood requests answered %d, reset %d" % (counts["sent"],
+              counts["reset"]))
+        finally:
+            process.terminate ()
+            process.wait ()
+
+if __name__ == "__main__":
+    main ()
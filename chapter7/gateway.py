@@ -0,0 +1,468 @@
+"""
+Validating JSON gateway for many services.
+
+Starts an HTTP gateway listening for JSON requests, default port 8300.
+Routes are read from a route table (-r, default gateway_routes.json)
+mapping each request path to its request schema, response schema,
+optional error schema and upstream service URL, for example
+
+  { "routes": { "/add": { "request": "addRequest_schema.json",
+    "response": "addResponse_schema.json", "error": "addError_schema.json",
+    "upstream": "http://localhost:8304/" } } }
+
+Schema files are relative to the route table. All validators are
+compiled at startup, each schema file once, and requests are dispatched
+with a path index. Requests are validated before being forwarded, and
+responses are validated before being returned, as in the addition
+proxy. Upstream requests use persistent connections pooled per host
+(-s pool size, 0 for a connection per request), so adding a backend
+only needs a route. Request bodies are read within the maximum body
+size (-m bytes, 413) and nesting depth (-d, 400) before being parsed,
+and a missing or invalid Content-Length is rejected (411, 400), as in
+the addition service. Statistics are available with a GET request to
+/stats.
+"""
+try:
+    # Python 3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from http.client import HTTPConnection, HTTPException, RemoteDisconnected
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlsplit
+    from queue import LifoQueue, Empty, Full
+except ImportError:
+    # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from httplib import HTTPConnection, HTTPException
+    from httplib import BadStatusLine as RemoteDisconnected
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlsplit
+    from Queue import LifoQueue, Empty, Full
+from argparse import ArgumentParser
+from json import loads, dumps
+from jsonschema import Draft4Validator
+from os.path import dirname, join
+from requestBody import (readJson, discardBody, BodyError, MAX_BODY,
+  MAX_DEPTH)
+from threading import Lock
+import errno
+import socket
+import sys
+
+# schema for the route table, next to this program
+ROUTES_SCHEMA = join (dirname (__file__) or ".", "gateway_schema.json")
+
+# errors returned by the gateway
+NO_ROUTE = """{"error": "No route for request"}"""
+INVALID_CONTENT = """{"error": "Invalid content type"}"""
+INVALID_REQUEST = """{"error": "Invalid request"}"""
+INVALID_RESPONSE = """{"error": "Invalid response from service"}"""
+UNAVAILABLE = """{"error": "Service unavailable"}"""
+
+def main ():
+    """ Program entry point. """
+    Gateway ()
+
+class Gateway:
+    """ Start gateway server. """
+    def __init__ (self):
+        """ Load routes and start server """
+        # process command line for port number and routes
+        self.port = 8300
+        self.routesFile = "gateway_routes.json"
+        self.poolSize = 8
+        self.verbose = False
+        self.processCommand ()
+
+        # compile all validators before accepting requests
+        try:
+            routes = loadRoutes (self.routesFile, self.poolSize)
+        except (IOError, ValueError) as e:
+            print ("Error loading routes: " + str (e))
+            sys.exit (1)
+
+        # listen for messages on specified port
+        server = GatewayHTTPServer (("localhost", self.port), routes,
+          Handler, self.verbose)
+        print ("JSON gateway listening on port " + str (self.port))
+        print ("  " + str (len (routes)) + " routes to " +
+          str (len (set (route.pool for route in routes.values ()))) +
+          " upstream hosts")
+        try:
+            server.serve_forever ()
+        except KeyboardInterrupt:
+            server.shutdown ()
+            server.server_close()
+
+    def processCommand (self):
+        """ Get port, routes and pool size from command line arguments. """
+        parser = ArgumentParser ()
+        parser.add_argument ("-p", "--port", type=int, dest="port",
+          action="store", help="Port to listen on")
+        parser.add_argument ("-r", "--routes", dest="routesFile",
+          action="store", help="Route table file")
+        parser.add_argument ("-s", "--pool", type=int, dest="poolSize",
+          action="store", help="Idle connections kept per upstream host")
+        parser.add_argument ("-m", "--max-body", type=int, dest="maxBody",
+          action="store", help="Largest request body in bytes (0 no limit)")
+        parser.add_argument ("-d", "--max-depth", type=int, dest="maxDepth",
+          action="store", help="Deepest request nesting (0 no limit)")
+        parser.add_argument ("-v", "--verbose", dest="verbose",
+          action="store_true", help="Log each request")
+        args = parser.parse_args ()
+        if args.port is not None:
+            self.port = args.port
+        if args.routesFile is not None:
+            self.routesFile = args.routesFile
+        if args.poolSize is not None:
+            self.poolSize = args.poolSize
+        if args.maxBody is not None:
+            Handler.maxBody = args.maxBody
+        if args.maxDepth is not None:
+            Handler.maxDepth = args.maxDepth
+        self.verbose = args.verbose
+
+class Route:
+    """
+    Request path with compiled validators and upstream service.
+    Args:
+        path Request path.
+        requestValidator Validator for request bodies.
+        responseValidator Validator for successful responses.
+        errorValidator Validator for error responses, None to return
+          error responses without validation.
+        pool ConnectionPool for the upstream host.
+        target Upstream path, with any query.
+    """
+    def __init__ (self, path, requestValidator, responseValidator,
+      errorValidator, pool, target):
+        self.path = path
+        self.requestValidator = requestValidator
+        self.responseValidator = responseValidator
+        self.errorValidator = errorValidator
+        self.pool = pool
+        self.target = target
+        self.lock = Lock ()
+        self.requests = 0
+        self.rejected = 0
+        self.failed = 0
+
+def loadRoutes (file, poolSize=8, timeout=10.0):
+    """
+    Load a route table and compile its validators.
+    Args:
+        file Route table file name.
+        poolSize Idle connections kept per upstream host.
+        timeout Seconds to wait for upstream services.
+    Returns:
+        Dict of request path to Route.
+    Raises:
+        IOError if a file cannot be read, ValueError if a file is not
+        valid JSON or the route table does not match its schema.
+    """
+    table = _loadJson (file)
+    errors = sorted (Draft4Validator (_loadJson (ROUTES_SCHEMA)).iter_errors (
+      table), key=lambda error: list (error.path))
+    if len (errors) > 0:
+        raise ValueError (file + ": /" + "/".join (str (token)
+          for token in errors[0].path) + ": " + errors[0].message)
+
+    # routes share validators for the same schema file, and pools for
+    # the same host
+    base = dirname (file)
+    validators = {}
+    pools = {}
+    routes = {}
+    for path, config in table["routes"].items ():
+        compiled = []
+        for name in ("request", "response", "error"):
+            schema = config.get (name)
+            if schema is None:
+                compiled.append (None)
+                continue
+            schema = join (base, schema)
+            if schema not in validators:
+                validators[schema] = Draft4Validator (_loadJson (schema))
+            compiled.append (validators[schema])
+
+        url = urlsplit (config["upstream"])
+        host = (url.hostname, url.port or 80)
+        if host not in pools:
+            pools[host] = ConnectionPool (host[0], host[1], poolSize, timeout)
+        target = url.path or "/"
+        if url.query:
+            target += "?" + url.query
+        routes[path] = Route (path, compiled[0], compiled[1], compiled[2],
+          pools[host], target)
+    return routes
+
+class ConnectionPool:
+    """
+    Persistent HTTP connections to one upstream host, shared by threads.
+    Args:
+        host Host name.
+        port Port number.
+        size Idle connections kept, 0 for a connection per request.
+        timeout Seconds to wait for the host.
+    """
+    def __init__ (self, host, port, size, timeout):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.timeout = timeout
+        self.idle = LifoQueue (max (size, 1))
+        self.lock = Lock ()
+        self.created = 0
+        self.reused = 0
+
+    def request (self, method, path, body, headers):
+        """
+        Make a request, on an idle connection if available. A request on
+        a reused connection is retried on a new connection if the host
+        reset or closed the connection before any response, as it may
+        have closed it while idle. Timeouts and failures once a response
+        has started are not retried.
+        Returns:
+            Tuple of (status, body bytes).
+        Raises:
+            HTTPException or socket.error if the host fails.
+        """
+        while True:
+            connection, reused = self.acquire ()
+            try:
+                connection.request (method, path, body, headers)
+            except (HTTPException, socket.error) as e:
+                connection.close ()
+                if reused and _resetByHost (e):
+                    continue
+                raise
+            try:
+                response = connection.getresponse ()
+            except RemoteDisconnected:
+                # closed without a status line, so nothing was received
+                connection.close ()
+                if reused:
+                    continue
+                raise
+            except (HTTPException, socket.error):
+                connection.close ()
+                raise
+            try:
+                data = response.read ()
+            except (HTTPException, socket.error):
+                connection.close ()
+                raise
+            if response.will_close:
+                connection.close ()
+            else:
+                self.release (connection)
+            return response.status, data
+
+    def acquire (self):
+        """ Get an idle connection or a new one, and if it was idle. """
+        try:
+            connection = self.idle.get_nowait ()
+            with self.lock:
+                self.reused += 1
+            return connection, True
+        except Empty:
+            with self.lock:
+                self.created += 1
+            return HTTPConnection (self.host, self.port,
+              timeout=self.timeout), False
+
+    def release (self, connection):
+        """ Return a connection to the pool, closing it if full. """
+        if self.size <= 0:
+            connection.close ()
+            return
+        try:
+            self.idle.put_nowait (connection)
+        except Full:
+            connection.close ()
+
+    def close (self):
+        """ Close the idle connections. """
+        while True:
+            try:
+                self.idle.get_nowait ().close ()
+            except Empty:
+                return
+
+    def stats (self):
+        """ Get pool statistics as a dict. """
+        return {
+            "created": self.created,
+            "reused": self.reused,
+            "idle": self.idle.qsize ()
+        }
+
+class GatewayHTTPServer (ThreadingMixIn, HTTPServer, object):
+    """
+    Threaded HTTPServer subclass to hold the routes
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__ (self, host, routes, handler, verbose=False):
+        super (GatewayHTTPServer, self).__init__ (host, handler)
+        self.routes = routes
+        self.verbose = verbose
+
+class Handler (BaseHTTPRequestHandler):
+    """ HTTP request handler """
+    # request body limits
+    maxBody = MAX_BODY
+    maxDepth = MAX_DEPTH
+    # keep client connections open between requests, sending small
+    # responses without waiting for acknowledgements
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET (self):
+        """ process GET, return route and pool statistics """
+        if self.path != "/stats":
+            self.sendJson (404, NO_ROUTE)
+            return
+
+        routes = self.server.routes.values ()
+        pools = {}
+        for route in routes:
+            pools["%s:%d" % (route.pool.host, route.pool.port)] = \
+              route.pool.stats ()
+        self.sendJson (200, dumps ({
+            "routes": len (self.server.routes),
+            "requests": sum (route.requests for route in routes),
+            "rejected": sum (route.rejected for route in routes),
+            "failed": sum (route.failed for route in routes),
+            "pools": pools
+        }))
+
+    # web processing logic goes here
+    def do_POST (self):
+        """ process POST, dispatch to the route for the path """
+        route = self.server.routes.get (self.path.split ("?", 1)[0])
+        if route is None:
+            self.reject (404, NO_ROUTE)
+            return
+        with route.lock:
+            route.requests += 1
+
+        contentType = self.headers["content-type"]
+        if contentType != "application/json":
+            with route.lock:
+                route.rejected += 1
+            self.reject (415, INVALID_CONTENT)
+            return
+
+        # read body within limits, rejecting before parsing
+        try:
+            data, dataIn = readJson (self, Handler.maxBody, Handler.maxDepth)
+        except BodyError as e:
+            if self.server.verbose:
+                print ("Request body rejected: " + e.message)
+            with route.lock:
+                route.rejected += 1
+            self.close_connection = True
+            self.sendJson (e.status, e.body ())
+            return
+
+        #validate
+        try:
+            route.requestValidator.validate (dataIn)
+        except Exception as e:
+            # if validation failed, return error
+            if self.server.verbose:
+                print (e)
+            with route.lock:
+                route.rejected += 1
+            self.sendJson (400, INVALID_REQUEST)
+            return
+
+        status, dataOut = self.forwardRequest (route, data.encode ("utf8"))
+        self.sendJson (status, dataOut)
+
+    def forwardRequest (self, route, data):
+        """
+        Make request on the route's upstream and validate the response.
+        Args:
+            route Route for the request.
+            data Request body bytes.
+        Returns:
+            Tuple of (status, body) to return to the client.
+        """
+        headers = { "Content-type": "application/json" }
+        try:
+            status, body = route.pool.request ("POST", route.target, data,
+              headers)
+            dataOut = body.decode ("utf8")
+        except (HTTPException, socket.error) as e:
+            print ("Upstream error for " + route.path + ": " + str (e))
+            with route.lock:
+                route.failed += 1
+            return 503, UNAVAILABLE
+
+        # verify service response matches its schema
+        validator = route.responseValidator
+        if status != 200:
+            validator = route.errorValidator
+        try:
+            if validator is not None:
+                validator.validate (loads (dataOut))
+        except Exception as e:
+            print ("Invalid response from service: " + str (e))
+            with route.lock:
+                route.failed += 1
+            return 502, INVALID_RESPONSE
+        return status, dataOut
+
+    def reject (self, status, body):
+        """
+        Send a rejection without reading the request body, dropping the
+        body so the connection can be reused, or closing the connection
+        if the body is too large or not valid.
+        Args:
+            status HTTP status.
+            body JSON body.
+        """
+        if not discardBody (self, Handler.maxBody):
+            self.close_connection = True
+        self.sendJson (status, body)
+
+    def sendJson (self, status, body):
+        """ Send response with JSON body. """
+        data = body.encode ("utf8")
+        self.send_response (status)
+        self.send_header ("Content-type", "application/json")
+        self.send_header ("Content-Length", str (len (data)))
+        if self.close_connection:
+            self.send_header ("Connection", "close")
+        self.end_headers ()
+        self.wfile.write (data)
+
+    def log_message (self, format, *args):
+        """ Log requests only when verbose. """
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message (self, format, *args)
+
+def _resetByHost (e):
+    """
+    Check if sending a request failed as the host reset or closed the
+    connection, rather than by a timeout or other error.
+    """
+    return getattr (e, "errno", None) in (errno.ECONNRESET, errno.EPIPE)
+
+def _loadJson (file):
+    """
+    Load JSON content from a file.
+    Raises:
+        IOError if not readable, ValueError if not JSON.
+    """
+    with open (file, "r") as f:
+        data = f.read ()
+    try:
+        return loads (data)
+    except ValueError as e:
+        raise ValueError (file + ": " + str (e))
+
+if __name__ == "__main__":
+    main ()
@@ -0,0 +1,199 @@
+"""
+Benchmark for the validating JSON gateway.
+
+Generates a route table with a few thousand routes, each with its own
+request and response schemas, spread over several stub upstream
+services, then reports:
+  - startup time to load the table and compile every validator
+  - route lookup time with the path index, compared to a scan of the
+    route list
+  - requests per second and latency through the gateway from
+    concurrent clients on random routes, with and without pooled
+    upstream connections
+
+Usage: python gatewayBenchmark.py [-n routes] [-u upstreams]
+         [-c clients] [-r requests] [-s pool sizes]
+"""
+try:
+    # Python 3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from http.client import HTTPConnection
+    from socketserver import ThreadingMixIn
+except ImportError:
+    # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from httplib import HTTPConnection
+    from SocketServer import ThreadingMixIn
+from argparse import ArgumentParser
+from json import loads, dumps
+from os.path import join
+from shutil import rmtree
+from threading import Thread
+from time import time
+import random
+import tempfile
+from gateway import GatewayHTTPServer, Handler, loadRoutes
+
+class StubHTTPServer (ThreadingMixIn, HTTPServer, object):
+    """ Threaded upstream service for the benchmark. """
+    daemon_threads = True
+    request_queue_size = 128
+
+class StubHandler (BaseHTTPRequestHandler):
+    """ Upstream returning the sum of the numbers, keeping connections. """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST (self):
+        dataIn = loads (self.rfile.read (int (
+          self.headers["Content-Length"])).decode ("utf8"))
+        body = dumps ({ "answer": dataIn["number1"] + dataIn["number2"] })
+        body = body.encode ("utf8")
+        self.send_response (200)
+        self.send_header ("Content-type", "application/json")
+        self.send_header ("Content-Length", str (len (body)))
+        self.end_headers ()
+        self.wfile.write (body)
+
+    def log_message (self, format, *args):
+        pass
+
+def writeRoutes (directory, count, ports):
+    """ Write a route table and schemas, returning the table file. """
+    routes = {}
+    for index in range (count):
+        request = "route%05d_request.json" % index
+        response = "route%05d_response.json" % index
+        with open (join (directory, request), "w") as f:
+            f.write (dumps ({
+              "$schema": "http://json-schema.org/draft-04/schema#",
+              "title": "Route %d request" % index,
+              "type": "object",
+              "properties": {
+                "number1": { "type": "integer", "maximum": 1000000 + index },
+                "number2": { "type": "integer" }
+              },
+              "additionalProperties": False,
+              "required": ["number1", "number2"] }))
+        with open (join (directory, response), "w") as f:
+            f.write (dumps ({
+              "$schema": "http://json-schema.org/draft-04/schema#",
+              "title": "Route %d response" % index,
+              "type": "object",
+              "properties": { "answer": { "type": "integer" } },
+              "required": ["answer"] }))
+        routes["/service%05d/add" % index] = {
+          "request": request,
+          "response": response,
+          "upstream": "http://localhost:%d/add%d" % (
+            ports[index % len (ports)], index) }
+
+    file = join (directory, "routes.json")
+    with open (file, "w") as f:
+        f.write (dumps ({ "routes": routes }))
+    return file
+
+def client (port, paths, requests, seed, latencies):
+    """ Post requests on random routes over one kept connection. """
+    generator = random.Random (seed)
+    connection = HTTPConnection ("localhost", port)
+    headers = { "Content-type": "application/json" }
+    for request in range (requests):
+        body = dumps ({ "number1": generator.randint (0, 999),
+          "number2": generator.randint (0, 999) }).encode ("utf8")
+        start = time ()
+        connection.request ("POST", generator.choice (paths), body, headers)
+        response = connection.getresponse ()
+        response.read ()
+        if response.status != 200:
+            raise ValueError ("status " + str (response.status))
+        latencies.append (time () - start)
+    connection.close ()
+
+def percentile (values, fraction):
+    """ Value at a fraction of sorted values. """
+    return values[min (len (values) - 1, int (len (values) * fraction))]
+
+def main ():
+    """ Run gateway benchmark. """
+    parser = ArgumentParser (prog="gatewayBenchmark")
+    parser.add_argument ("-n", "--routes", type=int, default=3000,
+      help="Number of routes")
+    parser.add_argument ("-u", "--upstreams", type=int, default=4,
+      help="Number of upstream services")
+    parser.add_argument ("-c", "--clients", type=int, default=8,
+      help="Concurrent client threads")
+    parser.add_argument ("-r", "--requests", type=int, default=500,
+      help="Requests per client")
+    parser.add_argument ("-s", "--pools", default="0,8",
+      help="Comma separated pool sizes to compare")
+    args = parser.parse_args ()
+
+    # stub upstream services
+    upstreams = []
+    for index in range (args.upstreams):
+        server = StubHTTPServer (("localhost", 0), StubHandler)
+        Thread (target=server.serve_forever).start ()
+        upstreams.append (server)
+    ports = [server.server_address[1] for server in upstreams]
+
+    directory = tempfile.mkdtemp ()
+    try:
+        file = writeRoutes (directory, args.routes, ports)
+        start = time ()
+        routes = loadRoutes (file)
+        print ("%d routes, %d upstreams, loaded and compiled in %.0f ms" %
+          (len (routes), len (ports), (time () - start) * 1000))
+
+        # route lookup, index against a scan of the route list
+        generator = random.Random (1)
+        paths = sorted (routes)
+        lookups = [generator.choice (paths) for index in range (20000)]
+        table = list (routes.values ())
+        start = time ()
+        for path in lookups:
+            routes.get (path)
+        indexed = (time () - start) / len (lookups)
+        start = time ()
+        for path in lookups[:2000]:
+            next (route for route in table if route.path == path)
+        scanned = (time () - start) / 2000
+        print ("lookup %.2f us indexed, %.1f us scanned" % (indexed * 1e6,
+          scanned * 1e6))
+
+        print ("%5s %10s %9s %9s %9s %8s" % ("pool", "requests/s",
+          "p50 ms", "p99 ms", "max ms", "opened"))
+        for size in [int (value) for value in args.pools.split (",")]:
+            routes = loadRoutes (file, size)
+            server = GatewayHTTPServer (("localhost", 0), routes, Handler)
+            Thread (target=server.serve_forever).start ()
+            port = server.server_address[1]
+
+            latencies = []
+            threads = [Thread (target=client, args=(port, paths,
+              args.requests, seed, latencies))
+              for seed in range (args.clients)]
+            start = time ()
+            for thread in threads:
+                thread.start ()
+            for thread in threads:
+                thread.join ()
+            elapsed = time () - start
+            server.shutdown ()
+            server.server_close ()
+
+            latencies.sort ()
+            opened = sum (pool.created for pool in set (route.pool
+              for route in routes.values ()))
+            print ("%5d %10.0f %9.2f %9.2f %9.2f %8d" % (size,
+              len (latencies) / elapsed, percentile (latencies, 0.5) * 1000,
+              percentile (latencies, 0.99) * 1000, latencies[-1] * 1000,
+              opened))
+    finally:
+        rmtree (directory)
+        for server in upstreams:
+            server.shutdown ()
+            server.server_close ()
+
+if __name__ == "__main__":
+    main ()
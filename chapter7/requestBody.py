@@ -0,0 +1,191 @@
+"""
+Bounded reading of JSON request bodies for the addition handlers.
+
+The body is read in pieces of at most CHUNK_SIZE bytes, from a
+Content-Length or chunked transfer-encoding body, and rejected as soon
+as it is known to be too large (413) or nested too deeply (400):
+a Content-Length over the limit is rejected before any of the body is
+read, and the nesting depth is tracked as each piece arrives, so JSON
+is only parsed once the whole body is known to be within both limits.
+A limit of 0 disables the check. discardBody reads and drops the body
+of a request rejected without reading it, within the same limits.
+"""
+from json import loads
+import re
+import socket
+
+# default limits, and largest piece read at a time
+MAX_BODY = 65536
+MAX_DEPTH = 32
+CHUNK_SIZE = 16384
+MAX_LINE = 1024
+
+# characters changing nesting or string state
+STRUCTURE = re.compile (b'[\\[\\]{}"\\\\]')
+
+class BodyError (Exception):
+    """
+    Request body rejected.
+    Args:
+        status HTTP status to return.
+        message Reason, returned as the error message.
+    """
+    def __init__ (self, status, message):
+        super (BodyError, self).__init__ (message)
+        self.status = status
+        self.message = message
+
+    def body (self):
+        """ Error response body. """
+        return """{"error": "%s"}""" % self.message
+
+def readJson (handler, maxBody=MAX_BODY, maxDepth=MAX_DEPTH):
+    """
+    Read and parse the JSON body of a request.
+    Args:
+        handler BaseHTTPRequestHandler of the request.
+        maxBody Largest body in bytes, 0 for no limit.
+        maxDepth Deepest nesting of arrays and objects, 0 for no limit.
+    Returns:
+        Tuple of (body text, parsed value).
+    Raises:
+        BodyError if the body is too large, too deep or not JSON. The
+        rest of the body is not read, so the connection must be closed.
+    """
+    scanner = _DepthScanner (maxDepth)
+    body = bytearray ()
+    try:
+        for piece in _pieces (handler, maxBody):
+            scanner.feed (piece)
+            body += piece
+    except socket.timeout:
+        raise BodyError (408, "Request body timeout")
+
+    try:
+        data = body.decode ("utf8")
+        return data, loads (data)
+    except ValueError:
+        raise BodyError (400, "Invalid JSON")
+    except RuntimeError:
+        # recursion limit, when depth is not limited
+        raise BodyError (400, "Request body nested too deeply")
+
+def discardBody (handler, maxBody=MAX_BODY):
+    """
+    Read and drop the body of a request rejected before reading it, so
+    closing the connection with the body unread does not reset it and
+    lose the response.
+    Args:
+        handler BaseHTTPRequestHandler of the request.
+        maxBody Largest body in bytes read, 0 for no limit.
+    Returns:
+        True if the body was read, False if it was too large or not
+        valid, and was left unread.
+    """
+    try:
+        for piece in _pieces (handler, maxBody):
+            pass
+    except (BodyError, socket.timeout):
+        return False
+    return True
+
+def _pieces (handler, maxBody):
+    """ Generate pieces of the body, within the size limit. """
+    encoding = handler.headers["Transfer-Encoding"]
+    if encoding is not None:
+        if encoding.strip ().lower () != "chunked":
+            raise BodyError (501, "Unsupported transfer encoding")
+        for piece in _chunkedPieces (handler.rfile, maxBody):
+            yield piece
+        return
+
+    try:
+        length = int (handler.headers["Content-Length"])
+    except (TypeError, ValueError):
+        raise BodyError (411, "Content length required")
+    if length < 0:
+        raise BodyError (400, "Invalid content length")
+    # rejected before reading, the client may still be sending
+    if maxBody > 0 and length > maxBody:
+        raise BodyError (413, "Request body too large")
+    for piece in _readPieces (handler.rfile, length):
+        yield piece
+
+def _chunkedPieces (rfile, maxBody):
+    """ Generate pieces of a chunked body, within the size limit. """
+    total = 0
+    while True:
+        line = rfile.readline (MAX_LINE + 1)
+        if len (line) > MAX_LINE or not line.endswith (b"\n"):
+            raise BodyError (400, "Invalid chunk")
+        try:
+            size = int (line.split (b";", 1)[0].strip (), 16)
+        except ValueError:
+            raise BodyError (400, "Invalid chunk")
+        if size < 0:
+            raise BodyError (400, "Invalid chunk")
+        if size == 0:
+            break
+        total += size
+        if maxBody > 0 and total > maxBody:
+            raise BodyError (413, "Request body too large")
+        for piece in _readPieces (rfile, size):
+            yield piece
+        if rfile.readline (MAX_LINE + 1).strip () != b"":
+            raise BodyError (400, "Invalid chunk")
+
+    # trailer fields, ending with an empty line
+    for count in range (100):
+        line = rfile.readline (MAX_LINE + 1)
+        if line.strip () == b"":
+            return
+    raise BodyError (400, "Invalid chunk trailer")
+
+def _readPieces (rfile, length):
+    """ Generate pieces of length bytes, at most CHUNK_SIZE at a time. """
+    while length > 0:
+        piece = rfile.read (min (length, CHUNK_SIZE))
+        if len (piece) == 0:
+            raise BodyError (400, "Incomplete request body")
+        length -= len (piece)
+        yield piece
+
+class _DepthScanner:
+    """
+    Track the nesting depth of JSON text fed in pieces, outside strings.
+    Args:
+        maxDepth Deepest nesting allowed, 0 for no limit.
+    """
+    def __init__ (self, maxDepth):
+        self.maxDepth = maxDepth
+        self.depth = 0
+        self.inString = False
+        # an escape at the end of a piece skips the next piece's first byte
+        self.escape = False
+
+    def feed (self, piece):
+        """ Scan a piece of text, raising BodyError if too deep. """
+        if self.maxDepth <= 0:
+            return
+        skip = 0 if not self.escape else 1
+        self.escape = False
+        for match in STRUCTURE.finditer (piece, skip):
+            position = match.start ()
+            if position < skip:
+                continue
+            char = piece[position:position + 1]
+            if self.inString:
+                if char == b'"':
+                    self.inString = False
+                elif char == b"\\":
+                    skip = position + 2
+                    if skip > len (piece):
+                        self.escape = True
+            elif char == b'"':
+                self.inString = True
+            elif char in (b"[", b"{"):
+                self.depth += 1
+                if self.depth > self.maxDepth:
+                    raise BodyError (400, "Request body nested too deeply")
+            elif char in (b"]", b"}"):
+                self.depth -= 1
@@ -0,0 +1,33 @@
+"""
+Validate JSON content against a JSON Schema.
+
+jsonschema is imported when the first validator is created, and
+JsdbResolver is loaded on first reference, so importing the package
+for the command line or read errors stays fast.
+"""
+from jsonvalidate.validate import (validate, createValidator, validateData,
+  itemsValidator, VALID, INVALID_JSON, MISSING_ID, FETCH_ERROR,
+  VALIDATION_ERROR)
+
+def __getattr__ (name):
+    """ Load JsdbResolver, with jsonschema, SchemaRegistry,
+    ChangeTracker, BatchValidator or loadRecords on first reference. """
+    if name == "JsdbResolver":
+        from jsonvalidate.resolver import JsdbResolver
+        return JsdbResolver
+    if name == "SchemaRegistry":
+        from jsonvalidate.registry import SchemaRegistry
+        return SchemaRegistry
+    if name == "ChangeTracker":
+        from jsonvalidate.tracking import ChangeTracker
+        return ChangeTracker
+    if name == "BatchValidator":
+        from jsonvalidate.columnar import BatchValidator
+        return BatchValidator
+    if name == "loadRecords":
+        from jsonvalidate.records import loadRecords
+        return loadRecords
+    if name == "toJson":
+        from jsonvalidate.records import toJson
+        return toJson
+    raise AttributeError ("module " + __name__ + " has no attribute " + name)
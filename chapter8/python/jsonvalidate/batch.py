@@ -0,0 +1,157 @@
+"""
+Validate many JSON files against a JSON Schema
+
+Usage: python -m jsonvalidate.batch [-options] schemaFile [dataFiles ...]
+Options:
+  -r    Referenced schema file (repeat for more files)
+  -j    JSDB file containing ref schemas
+  -d    Directory of schemas, indexed by id (repeat for more)
+  -l    File listing data files, one per line, - for standard input
+  -p    JSON parser (orjson, simdjson, ujson, json), default fastest
+  -c    Result cache database, unchanged files are not revalidated
+  --stats            Print result cache statistics
+  --purge            Remove all cached results
+  --compact DAYS     Remove cached results not used for DAYS days
+
+The validator is created once, and only when a file is not cached, so
+a run where nothing changed never parses a document or loads jsonschema.
+Each file that is not valid is printed with its message, followed by a
+summary. Exits with 0 if all files are valid, 1 otherwise. Large arrays
+of objects are validated in columns when NumPy is installed.
+"""
+from argparse import ArgumentParser
+import sys
+import time
+from jsonparser import PARSERS
+from jsonvalidate.validate import (createValidator, validateData,
+  _readJsonFile, VALID, MSG_READ_ERROR)
+from jsonvalidate.columnar import BatchValidator
+
+def main ():
+    """ Validate files per command line arguments. """
+    args = processCommand ()
+
+    cache = None
+    if args.cacheFile is not None:
+        from jsonvalidate.resultcache import ResultCache
+        cache = ResultCache (args.cacheFile)
+        if args.purge:
+            cache.purge ()
+            print ("Result cache purged")
+        if args.compact is not None:
+            print ("Removed %d results not used for %d days" % (
+              cache.compact (args.compact), args.compact))
+
+    passed = True
+    if args.schemaFile is not None:
+        passed = validateFiles (args, cache)
+    if cache is not None:
+        if args.stats:
+            stats = cache.stats ()
+            print ("Cache entries %d, hit rate %.1f%% (%d hits, %d misses), "
+              "lifetime hit rate %.1f%%" % (stats["entries"],
+              stats["hitRate"] * 100, stats["hits"], stats["misses"],
+              stats["totalHitRate"] * 100))
+        cache.close ()
+    sys.exit (0 if passed else 1)
+
+def validateFiles (args, cache):
+    """
+    Validate each data file, using cached results when available.
+    Returns:
+        True if all files are valid.
+    """
+    registry = None
+    if len (args.schemaDirs) > 0:
+        from jsonvalidate.registry import SchemaRegistry
+        registry = SchemaRegistry (args.schemaDirs, parser=args.parser)
+
+    start = time.time ()
+    validator = None
+    valid = invalid = 0
+    for dataFile in dataFiles (args):
+        key = result = None
+        if cache is not None:
+            key = cache.key (dataFile, args.schemaFile, args.refFiles,
+              args.jsdbFile, registry)
+            if key is not None:
+                result = cache.get (key, dataFile)
+
+        if result is None:
+            # create the validator on the first file not cached
+            if validator is None:
+                code, validator, message = createValidator (args.schemaFile,
+                  args.refFiles, args.jsdbFile, args.parser, registry)
+                if code != VALID:
+                    print (message)
+                    return False
+                validator = BatchValidator (validator)
+            code, data, message = _readJsonFile (dataFile, args.parser)
+            if code != VALID:
+                message = MSG_READ_ERROR.format (dataFile, message)
+            else:
+                code, data, message = validateData (dataFile, data,
+                  validator)
+                if key is not None:
+                    cache.put (key, code, message)
+            result = code, message
+
+        if result[0] == VALID:
+            valid += 1
+        else:
+            invalid += 1
+            print ("%s: %s" % (dataFile, result[1]))
+
+    print ("%d valid, %d not valid in %.2f seconds" % (valid, invalid,
+      time.time () - start))
+    return invalid == 0
+
+def dataFiles (args):
+    """ Generate data file names from the command line and list file. """
+    for dataFile in args.dataFiles:
+        yield dataFile
+    if args.listFile is not None:
+        listFile = sys.stdin if args.listFile == "-" else open (args.listFile)
+        try:
+            for line in listFile:
+                line = line.strip ()
+                if line:
+                    yield line
+        finally:
+            if listFile is not sys.stdin:
+                listFile.close ()
+
+def processCommand ():
+    """ Process the command provided. """
+    parser = ArgumentParser (prog="jsonvalidate.batch")
+    parser.add_argument ("schemaFile", nargs="?",
+      help="JSON Schema file to validate against")
+    parser.add_argument ("dataFiles", nargs="*",
+      help="JSON files to be validated")
+    parser.add_argument ("-r", "--ref", dest="refFiles", action="append",
+      default=[], help="JSON Schema file with referenced elements")
+    parser.add_argument ("-j", "--jsdb", dest="jsdbFile",
+      help="JSDB file containing ref schemas")
+    parser.add_argument ("-d", "--schema-dir", dest="schemaDirs",
+      action="append", default=[],
+      help="Directory of schemas read when referenced, may be repeated")
+    parser.add_argument ("-l", "--list", dest="listFile",
+      help="File listing data files, - for standard input")
+    parser.add_argument ("-p", "--parser", dest="parser", choices=PARSERS,
+      help="JSON parser, default fastest installed")
+    parser.add_argument ("-c", "--cache", dest="cacheFile",
+      help="Result cache database")
+    parser.add_argument ("--stats", action="store_true",
+      help="Print result cache statistics")
+    parser.add_argument ("--purge", action="store_true",
+      help="Remove all cached results")
+    parser.add_argument ("--compact", type=int, metavar="DAYS",
+      help="Remove cached results not used for DAYS days")
+    args = parser.parse_args ()
+    if args.cacheFile is None and (args.stats or args.purge or
+      args.compact is not None):
+        parser.error ("--stats, --purge and --compact require --cache")
+    return args
+
+if __name__ == "__main__":
+    main ()
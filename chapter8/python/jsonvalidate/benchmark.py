@@ -0,0 +1,124 @@
+"""
+Cold start benchmark for the jsonvalidate command line.
+
+Runs the command with python -X importtime for each scenario, and checks
+the time spent importing modules (above the interpreter's own imports)
+against a budget. Scenarios that do not validate must not import
+jsonschema. Exits with 1 if any budget is exceeded, so it can run as a
+regression check.
+
+Usage: python -m jsonvalidate.benchmark [-r repeats] [-s scale]
+"""
+from argparse import ArgumentParser
+from shutil import rmtree
+from subprocess import Popen, PIPE
+import os
+import sys
+import tempfile
+import time
+
+# fixture files, relative to this file
+ROOT = os.path.join (os.path.dirname (os.path.abspath (__file__)),
+  "..", "..", "..")
+DATA = os.path.join (ROOT, "chapter3", "contactValid.json")
+SCHEMA = os.path.join (ROOT, "chapter3", "contact_schema.json")
+
+# scenario name, command arguments, import budget in ms (None for no
+# budget), and whether jsonschema may be imported
+SCENARIOS = [
+    ("help", ["--help"], 35, False),
+    ("read error", ["-n", "missing.json", SCHEMA], 40, False),
+    ("daemon client", [DATA, SCHEMA], 40, False),
+    ("in process", ["-n", DATA, SCHEMA], None, True)
+]
+
+def importTime (args, env):
+    """
+    Run python -X importtime with arguments.
+    Returns:
+        Tuple of (import ms, wall ms, set of modules imported).
+    """
+    start = time.time ()
+    process = Popen ([sys.executable, "-X", "importtime"] + args,
+      stdout=PIPE, stderr=PIPE, env=env)
+    stderr = process.communicate ()[1].decode ("utf8")
+    wall = (time.time () - start) * 1000
+
+    total = 0
+    modules = set ()
+    for line in stderr.splitlines ():
+        if not line.startswith ("import time:"):
+            continue
+        fields = line[len ("import time:"):].split ("|")
+        try:
+            total += int (fields[0])
+        except ValueError:
+            continue
+        modules.add (fields[2].strip ())
+    return total / 1000.0, wall, modules
+
+def median (values):
+    """ Median of a list of numbers. """
+    values = sorted (values)
+    return values[len (values) // 2]
+
+def main ():
+    """ Run scenarios and check budgets. """
+    parser = ArgumentParser (prog="jsonvalidate.benchmark")
+    parser.add_argument ("-r", "--repeats", type=int, default=5,
+      help="Runs per scenario, median reported")
+    parser.add_argument ("-s", "--scale", type=float, default=1.0,
+      help="Budget multiplier for slower machines")
+    args = parser.parse_args ()
+
+    # subprocesses use this module search path, and a private daemon
+    env = dict (os.environ)
+    env["PYTHONPATH"] = os.pathsep.join (os.path.abspath (entry)
+      for entry in sys.path if entry != "")
+    socketDir = tempfile.mkdtemp ()
+    env["JSONVALIDATE_SOCKET"] = os.path.join (socketDir, "daemon.sock")
+    daemon = Popen ([sys.executable, "-m", "jsonvalidate.daemon",
+      "--socket", env["JSONVALIDATE_SOCKET"], "--idle", "60"], env=env)
+
+    try:
+        # interpreter imports, subtracted from each scenario
+        base = median ([importTime (["-c", "pass"], env)[0]
+          for repeat in range (args.repeats)])
+
+        passed = True
+        print ("%-14s %10s %10s %10s  %s" % ("scenario", "import ms",
+          "budget", "wall ms", "result"))
+        for name, command, budget, allowSchema in SCENARIOS:
+            imports = []
+            walls = []
+            modules = set ()
+            for repeat in range (args.repeats + 1):
+                ms, wall, loaded = importTime (
+                  ["-m", "jsonvalidate.main"] + command, env)
+                # first run starts daemon and warms file caches
+                if repeat > 0:
+                    imports.append (ms - base)
+                    walls.append (wall)
+                    modules |= loaded
+
+            ms = median (imports)
+            result = "ok"
+            if budget is not None and ms > budget * args.scale:
+                result = "over budget"
+            if not allowSchema and "jsonschema" in modules:
+                result = "imports jsonschema"
+            if result != "ok":
+                passed = False
+            budgetText = "-" if budget is None else "%.1f" % (budget *
+              args.scale)
+            print ("%-14s %10.1f %10s %10.1f  %s" % (name, ms, budgetText,
+              median (walls), result))
+    finally:
+        daemon.terminate ()
+        daemon.wait ()
+        rmtree (socketDir)
+
+    sys.exit (0 if passed else 1)
+
+if __name__ == "__main__":
+    main ()
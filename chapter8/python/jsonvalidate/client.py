@@ -0,0 +1,164 @@
+"""
+Client for the validation daemon.
+
+The client sends the validation arguments over a Unix domain socket to
+a resident daemon, which holds compiled validators in memory. If no
+daemon is running, one is started in the background. Only standard
+library modules are imported, so a request costs milliseconds.
+
+The socket is in a directory only the user can use, XDG_RUNTIME_DIR or
+one created in the temporary directory, and is only used if owned by
+the user and not writable by others, so another user cannot answer in
+place of the daemon.
+
+request - Send a validation request to the daemon
+socketPath - Get the daemon socket path
+"""
+import json
+import os
+import socket
+import stat
+import sys
+import time
+
+# seconds to wait for a started daemon to accept connections
+START_TIMEOUT = 10.0
+
+def socketPath ():
+    """
+    Get the daemon socket path, from JSONVALIDATE_SOCKET if set, else in
+    a private per user directory: XDG_RUNTIME_DIR, or a directory made
+    in the temporary directory.
+    Returns:
+        Socket path, or None if no private directory is available.
+    """
+    path = os.environ.get ("JSONVALIDATE_SOCKET")
+    if path is not None:
+        return path
+    directory = os.environ.get ("XDG_RUNTIME_DIR")
+    if directory is None or not _private (directory):
+        directory = os.path.join (os.environ.get ("TMPDIR", "/tmp"),
+          "jsonvalidate-" + str (os.getuid ()))
+        try:
+            os.mkdir (directory, 0o700)
+        except OSError:
+            # already made, checked below
+            pass
+        if not _private (directory):
+            return None
+    return os.path.join (directory, "jsonvalidate.sock")
+
+def request (jsonFile, schemaFile, refFiles, jsdbFile, parser=None,
+  path=None, schemaDirs=None):
+    """
+    Validate a file with the daemon, starting the daemon if needed.
+
+    Args:
+      jsonFile (str): File with JSON content to validate.
+      schemaFile (str): File containing JSON Schema.
+      refFiles (list of str): List of files for schemas referenced.
+      jsdbFile (str): File containing JSDB schemas referenced.
+      parser (str): JSON parser name, None for fastest available.
+      path (str): Daemon socket path, None for default.
+      schemaDirs (list of str): Schema registry directories, or None.
+    Returns:
+      Tuple of (code, message), or None if the daemon is not available.
+    """
+    if path is None:
+        path = socketPath ()
+        if path is None:
+            return None
+    message = {
+        "cwd": os.getcwd (),
+        "jsonFile": jsonFile,
+        "schemaFile": schemaFile,
+        "refFiles": refFiles,
+        "jsdbFile": jsdbFile,
+        "parser": parser,
+        "schemaDirs": schemaDirs
+    }
+
+    connection = _connect (path)
+    if connection is None:
+        # a socket of another user is never replaced or used
+        if os.path.lexists (path) and not _trusted (path):
+            return None
+        _startDaemon (path)
+        connection = _waitConnect (path)
+        if connection is None:
+            return None
+
+    try:
+        connection.sendall (json.dumps (message).encode ("utf8") + b"\n")
+        connection.shutdown (socket.SHUT_WR)
+        chunks = []
+        while True:
+            chunk = connection.recv (65536)
+            if not chunk:
+                break
+            chunks.append (chunk)
+        response = json.loads (b"".join (chunks).decode ("utf8"))
+        return response["code"], response["message"]
+    except (socket.error, ValueError, KeyError):
+        return None
+    finally:
+        connection.close ()
+
+def _private (directory):
+    """ Check a directory is this user's, not a link, and closed to others. """
+    try:
+        info = os.lstat (directory)
+    except OSError:
+        return False
+    return stat.S_ISDIR (info.st_mode) and info.st_uid == os.getuid () and \
+      info.st_mode & 0o077 == 0
+
+def _trusted (path):
+    """ Check a socket is this user's and not writable by others. """
+    try:
+        info = os.lstat (path)
+    except OSError:
+        return False
+    return stat.S_ISSOCK (info.st_mode) and info.st_uid == os.getuid () and \
+      info.st_mode & 0o022 == 0
+
+def _connect (path):
+    """
+    Connect to the daemon socket, returning None if not listening or not
+    trusted.
+    """
+    if not _trusted (path):
+        return None
+    connection = socket.socket (socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect (path)
+        return connection
+    except socket.error:
+        connection.close ()
+        return None
+
+def _waitConnect (path):
+    """ Connect to a starting daemon, returning None on timeout. """
+    end = time.time () + START_TIMEOUT
+    while time.time () < end:
+        connection = _connect (path)
+        if connection is not None:
+            return connection
+        time.sleep (0.02)
+    return None
+
+def _startDaemon (path):
+    """ Start the daemon in the background, detached from the terminal. """
+    from subprocess import Popen
+
+    # pass the module search path so the daemon loads the same modules
+    env = dict (os.environ)
+    env["PYTHONPATH"] = os.pathsep.join (os.path.abspath (entry)
+      for entry in sys.path if entry != "")
+    devnull = open (os.devnull, "r+")
+    try:
+        Popen ([sys.executable, "-m", "jsonvalidate.daemon", "--socket", path],
+          stdin=devnull, stdout=devnull, stderr=devnull, cwd="/", env=env,
+          close_fds=True, preexec_fn=os.setsid)
+    finally:
+        devnull.close ()
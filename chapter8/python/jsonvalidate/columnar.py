@@ -0,0 +1,450 @@
+"""
+Columnar batch validation for large arrays of objects.
+
+BatchValidator validates a document as its validator does, but checks
+arrays of same shaped objects a property at a time: each property is
+pulled into a column once, and the simple constraints of its subschema
+(type, minimum, maximum, exclusiveMinimum, exclusiveMaximum, enum of
+strings, minLength, maxLength), required and additionalProperties are
+checked with NumPy operations over the whole column.
+
+The column checks only select rows which may not be valid. Those rows
+are validated with the items validator, so the errors are the same as
+validating the whole document. Properties with other keywords are
+validated with their own subschema per row, and schemas that cannot be
+split into columns are validated as usual.
+
+NumPy is optional, without it BatchValidator validates as its
+validator does. Rows other than dicts are objects if the validator's
+type checker takes them as objects, so validators extended to accept
+other mappings can check them in columns.
+"""
+from jsonvalidate.tracking import CHILD_SAFE
+
+# smallest array checked in columns
+BATCH_MINIMUM = 64
+
+# keywords of an array schema that can be checked without its items,
+# of an items schema that can be checked in columns, and of a property
+# subschema that can be checked as a column
+ARRAY_KEYWORDS = frozenset (["type", "items", "minItems", "maxItems",
+  "uniqueItems", "title", "description", "default", "$schema",
+  "definitions"])
+OBJECT_KEYWORDS = frozenset (["type", "properties", "required",
+  "additionalProperties", "title", "description", "default", "$schema",
+  "definitions"])
+COLUMN_KEYWORDS = frozenset (["type", "minimum", "maximum",
+  "exclusiveMinimum", "exclusiveMaximum", "enum", "minLength", "maxLength",
+  "title", "description", "default"])
+
+# Python types of JSON Schema types, exact types as created by parsers
+TYPES = {
+    "integer": (int,),
+    "number": (int, float),
+    "string": (str,),
+    "boolean": (bool,),
+    "null": (type (None),),
+    "object": (dict,),
+    "array": (list,)
+}
+
+class _Missing:
+    """ Column value of a property not in a row. """
+    def __len__ (self):
+        return 0
+
+_MISSING = _Missing ()
+
+class BatchValidator:
+    """
+    Validator checking large arrays of objects in columns.
+    Args:
+        validator Validator for the document, from createValidator.
+        minimum Smallest array checked in columns.
+    """
+    def __init__ (self, validator, minimum=BATCH_MINIMUM):
+        self.validator = validator
+        self.schema = validator.schema
+        self.minimum = minimum
+        self.numpy = _numpy ()
+        # validators and column plans by schema id, holding the schema so
+        # its id is not reused
+        self.validators = {}
+        self.plans = {}
+        self.splits = {}
+
+    def validate (self, document):
+        """
+        Validate a document, as the validator's validate.
+        Raises:
+            ValidationError for the best matching error.
+        """
+        from jsonschema.exceptions import best_match
+        error = best_match (self.iter_errors (document))
+        if error is not None:
+            raise error
+
+    def is_valid (self, document):
+        """ Check if a document is valid. """
+        return next (iter (self.iter_errors (document)), None) is None
+
+    def iter_errors (self, document):
+        """ Get the validation errors of a document. """
+        if self.numpy is None:
+            return self.validator.iter_errors (document)
+        return self._errors (self.schema, document, (), ())
+
+    def _errors (self, schema, value, path, schemaPath):
+        """
+        Get errors of a value against a schema, prefixed by path and the
+        path of the schema.
+        """
+        schema = self._resolve (schema)
+        if isinstance (value, list) and isinstance (schema, dict):
+            plan = self._plan (schema.get ("items"))
+            if plan is not None and len (value) >= self.minimum and \
+              ARRAY_KEYWORDS.issuperset (schema):
+                # array keywords without items, then items in columns
+                rest = self._split (schema, "items", ())
+                for error in self._prefixed (rest, value, path,
+                  schemaPath):
+                    yield error
+                for error in plan.errors (value, path,
+                  schemaPath + ("items",)):
+                    yield error
+                return
+
+        if isinstance (value, dict) and isinstance (schema, dict) and \
+          "properties" in schema and "patternProperties" not in schema \
+          and CHILD_SAFE.issuperset (key for key in schema
+          if key != "id" or len (path) == 0):
+            # object properties holding large arrays are checked alone
+            batched = tuple (name for name in schema["properties"]
+              if isinstance (value.get (name), list) and
+              len (value[name]) >= self.minimum)
+            if len (batched) > 0:
+                rest = self._split (schema, "properties", batched)
+                for error in self._prefixed (rest, value, path,
+                  schemaPath):
+                    yield error
+                for name in batched:
+                    for error in self._errors (schema["properties"][name],
+                      value[name], path + (name,),
+                      schemaPath + ("properties", name)):
+                        yield error
+                return
+
+        for error in self._prefixed (schema, value, path, schemaPath):
+            yield error
+
+    def _split (self, schema, keyword, names):
+        """
+        Get a schema without a keyword, or with properties names
+        unconstrained, the same schema for the same split.
+        """
+        key = (id (schema), keyword, names)
+        entry = self.splits.get (key)
+        if entry is None:
+            rest = dict ((name, schema[name]) for name in schema
+              if name != keyword)
+            if len (names) > 0:
+                rest[keyword] = dict (schema[keyword])
+                for name in names:
+                    rest[keyword][name] = {}
+            entry = (schema, rest)
+            self.splits[key] = entry
+        return entry[1]
+
+    def _prefixed (self, schema, value, path, schemaPath):
+        """ Validate with a subschema, prefixing error and schema paths. """
+        for error in self.subValidator (schema).iter_errors (value):
+            error.path.extendleft (reversed (path))
+            error.schema_path.extendleft (reversed (schemaPath))
+            yield error
+
+    def subValidator (self, schema):
+        """ Validator for a subschema, sharing the root resolver. """
+        entry = self.validators.get (id (schema))
+        if entry is None:
+            entry = (schema, self.validator.__class__ (schema,
+              resolver=self.validator.resolver))
+            self.validators[id (schema)] = entry
+        return entry[1]
+
+    def _resolve (self, schema):
+        """ Follow local $ref, leaving references to other documents. """
+        seen = 0
+        while isinstance (schema, dict) and "$ref" in schema:
+            ref = schema["$ref"]
+            if not ref.startswith ("#") or seen > 32:
+                return schema
+            schema = self.validator.resolver.resolve_fragment (self.schema,
+              ref[1:])
+            seen += 1
+        return schema
+
+    def _plan (self, schema):
+        """ Get the column plan for an items schema, None if not possible. """
+        schema = self._resolve (schema)
+        if not isinstance (schema, dict):
+            return None
+        entry = self.plans.get (id (schema))
+        if entry is None:
+            plan = None
+            if OBJECT_KEYWORDS.issuperset (schema) and \
+              schema.get ("type", "object") == "object":
+                plan = _ItemsPlan (self, schema)
+            entry = (schema, plan)
+            self.plans[id (schema)] = entry
+        return entry[1]
+
+class _ItemsPlan:
+    """
+    Column checks for an items schema of objects.
+    Args:
+        batch BatchValidator.
+        schema Items schema.
+    """
+    def __init__ (self, batch, schema):
+        self.batch = batch
+        self.schema = schema
+        self.numpy = batch.numpy
+        required = set (schema.get ("required", []))
+        properties = schema.get ("properties", {})
+        self.columns = []
+        self.fallback = []
+        for name, subschema in properties.items ():
+            subschema = batch._resolve (subschema)
+            column = _Column.create (name, subschema, name in required)
+            if column is None:
+                self.fallback.append ((name, subschema))
+                column = _Column (name, None, name in required)
+            self.columns.append (column)
+        # required but not declared, only presence checked
+        self.presence = [_Column (name, None, True)
+          for name in sorted (required - set (properties))]
+        self.closed = schema.get ("additionalProperties", {}) not in (True, {})
+
+    def errors (self, rows, path, schemaPath):
+        """ Get errors of array items, prefixed by path and schema path. """
+        suspect = self.suspect (rows)
+        validator = self.batch.subValidator (self.schema)
+        for index in self.numpy.flatnonzero (suspect):
+            index = int (index)
+            for error in validator.iter_errors (rows[index]):
+                error.path.extendleft (reversed (path + (index,)))
+                error.schema_path.extendleft (reversed (schemaPath))
+                yield error
+
+    def suspect (self, rows):
+        """ Get a mask of rows which may not be valid. """
+        numpy = self.numpy
+        count = len (rows)
+        suspect = numpy.zeros (count, dtype=bool)
+        objects = rows
+        if set (map (type, rows)) != set ([dict]):
+            isObject = self._isObject
+            suspect |= numpy.fromiter ((not isObject (row)
+              for row in rows), dtype=bool, count=count)
+            objects = [row if isObject (row) else {} for row in rows]
+
+        known = numpy.zeros (count, dtype=numpy.int64)
+        for column in self.columns:
+            present = column.check (numpy, [row.get (column.name, _MISSING)
+              for row in objects], suspect)
+            known += 1 if present is None else present
+        for column in self.presence:
+            column.check (numpy, [row.get (column.name, _MISSING)
+              for row in objects], suspect)
+
+        # rows with properties not declared
+        if self.closed:
+            sizes = numpy.fromiter (map (len, objects), dtype=numpy.int64,
+              count=count)
+            suspect |= sizes > known
+
+        # properties with other keywords, validated per row
+        for name, subschema in self.fallback:
+            validator = self.batch.subValidator (subschema)
+            for index, row in enumerate (objects):
+                if not suspect[index] and name in row and \
+                  not validator.is_valid (row[name]):
+                    suspect[index] = True
+        return suspect
+
+    def _isObject (self, row):
+        """ Check a row is a dict, or taken as an object by the validator. """
+        return type (row) is dict or self.batch.validator.is_type (row,
+          "object")
+
+class _Column:
+    """
+    Checks of one property, setting rows which may not be valid.
+    Args:
+        name Property name.
+        schema Property subschema, None to check presence only.
+        required Flag, property required.
+    """
+    def __init__ (self, name, schema, required):
+        self.name = name
+        self.required = required
+        schema = {} if schema is None else schema
+        types = schema.get ("type")
+        if isinstance (types, str):
+            types = [types]
+        self.types = None
+        if types is not None:
+            self.types = frozenset (kind for name in types
+              for kind in TYPES[name])
+        self.minimum = schema.get ("minimum")
+        self.maximum = schema.get ("maximum")
+        self.exclusiveMinimum = schema.get ("exclusiveMinimum", False)
+        self.exclusiveMaximum = schema.get ("exclusiveMaximum", False)
+        self.minLength = schema.get ("minLength")
+        self.maxLength = schema.get ("maxLength")
+        self.enum = None
+        if "enum" in schema:
+            self.enum = frozenset (schema["enum"])
+
+    @staticmethod
+    def create (name, schema, required):
+        """ Create column checks, None if the schema has other keywords. """
+        if not isinstance (schema, dict) or \
+          not COLUMN_KEYWORDS.issuperset (schema):
+            return None
+        types = schema.get ("type", [])
+        if isinstance (types, str):
+            types = [types]
+        if not isinstance (types, list) or not all (kind in TYPES
+          for kind in types):
+            return None
+        # strings compare as JSON values, 1, 1.0 and true would not
+        if "enum" in schema and not all (isinstance (value, str)
+          for value in schema["enum"]):
+            return None
+        for bound in ("minimum", "maximum"):
+            if bound in schema and (type (schema[bound]) not in (int, float)):
+                return None
+        return _Column (name, schema, required)
+
+    def check (self, numpy, values, suspect):
+        """
+        Check a column, setting suspect rows.
+        Returns:
+            Mask of rows with the property, None if all have it.
+        """
+        count = len (values)
+        kinds = set (map (type, values))
+        missing = _Missing in kinds
+        kinds.discard (_Missing)
+        present = None
+        if missing:
+            present = numpy.fromiter ((value is not _MISSING
+              for value in values), dtype=bool, count=count)
+            if self.required:
+                suspect |= ~present
+
+        if self.types is not None and not kinds.issubset (self.types):
+            # mixed column, rows checked one at a time
+            suspect |= numpy.fromiter ((value is not _MISSING and
+              not self.valid (value) for value in values), dtype=bool,
+              count=count)
+            return present
+
+        numbers = kinds & set ([int, float])
+        if (self.minimum is not None or self.maximum is not None) and \
+          numbers:
+            if kinds != numbers:
+                suspect |= numpy.fromiter ((type (value) in (int, float) and
+                  not self.valid (value) for value in values), dtype=bool,
+                  count=count)
+            else:
+                suspect |= _masked (self.bounds (numpy, values, missing,
+                  kinds), present)
+
+        if (self.minLength is not None or self.maxLength is not None) and \
+          str in kinds:
+            lengths = numpy.fromiter ((len (value) if type (value) is str
+              else 0 for value in values) if kinds != set ([str]) else
+              map (len, values), dtype=numpy.int64, count=count)
+            isString = present
+            if kinds != set ([str]):
+                isString = numpy.fromiter ((type (value) is str
+                  for value in values), dtype=bool, count=count)
+            if self.minLength is not None:
+                suspect |= _masked (lengths < self.minLength, isString)
+            if self.maxLength is not None:
+                suspect |= _masked (lengths > self.maxLength, isString)
+
+        if self.enum is not None:
+            try:
+                member = numpy.fromiter (map (self.enum.__contains__, values),
+                  dtype=bool, count=count)
+            except TypeError:
+                # unhashable values, never strings
+                member = numpy.fromiter ((type (value) is str and
+                  value in self.enum for value in values), dtype=bool,
+                  count=count)
+            suspect |= _masked (~member, present)
+        return present
+
+    def bounds (self, numpy, values, missing, kinds):
+        """ Mask of numbers outside the bounds, exact for integers. """
+        if missing:
+            values = [0 if value is _MISSING else value for value in values]
+        exact = kinds == set ([int])
+        try:
+            if exact:
+                column = numpy.array (values, dtype=numpy.int64)
+            else:
+                column = numpy.array (values, dtype=numpy.float64)
+        except OverflowError:
+            return numpy.fromiter ((not self.valid (value)
+              for value in values), dtype=bool, count=len (values))
+
+        outside = numpy.zeros (len (values), dtype=bool)
+        for bound, exclusive, below in (
+          (self.minimum, self.exclusiveMinimum, True),
+          (self.maximum, self.exclusiveMaximum, False)):
+            if bound is None:
+                continue
+            # rounded to float, values at the bound are checked again
+            strict = exclusive or not (exact and type (bound) is int and
+              -2 ** 63 <= bound < 2 ** 63)
+            if below:
+                outside |= column <= bound if strict else column < bound
+            else:
+                outside |= column >= bound if strict else column > bound
+        return outside
+
+    def valid (self, value):
+        """ Check one value of a mixed column. """
+        if self.types is not None and type (value) not in self.types:
+            return False
+        if type (value) in (int, float):
+            if self.minimum is not None and (value < self.minimum or
+              self.exclusiveMinimum and value == self.minimum):
+                return False
+            if self.maximum is not None and (value > self.maximum or
+              self.exclusiveMaximum and value == self.maximum):
+                return False
+        if type (value) is str:
+            if self.minLength is not None and len (value) < self.minLength:
+                return False
+            if self.maxLength is not None and len (value) > self.maxLength:
+                return False
+        if self.enum is not None:
+            return type (value) is str and value in self.enum
+        return True
+
+def _masked (mask, present):
+    """ Mask limited to rows present, None for all rows. """
+    return mask if present is None else mask & present
+
+def _numpy ():
+    """ Import numpy, optional as validation works without it. """
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
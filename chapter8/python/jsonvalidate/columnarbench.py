@@ -0,0 +1,89 @@
+"""
+Columnar validation benchmark.
+
+Validates a generated array of inventory like objects with the
+validator, and with BatchValidator, reporting the times and checking
+both report the same errors, exiting with 1 if not. A fraction of items
+can be made invalid, to show the cost of the rows validated again per
+element.
+
+Usage: python -m jsonvalidate.columnarbench [-i items] [-f fraction]
+"""
+from argparse import ArgumentParser
+import random
+import sys
+import time
+from jsonschema import Draft4Validator
+from jsonvalidate.columnar import BatchValidator
+
+SCHEMA = {
+    "$schema": "http://json-schema.org/draft-04/schema#",
+    "title": "Inventory",
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "id": { "type": "string", "maxLength": 12 },
+            "count": { "type": "integer", "minimum": 0, "maximum": 100000 },
+            "price": { "type": "number", "minimum": 0 },
+            "location": { "enum": ["north", "south", "east", "west"] },
+            "active": { "type": "boolean" }
+        },
+        "required": ["id", "count", "location"],
+        "additionalProperties": False
+    }
+}
+
+# invalid values, by property
+INVALID = [("count", -1), ("count", "12"), ("id", "x" * 20),
+  ("location", "up"), ("price", None), ("extra", 1)]
+
+def inventory (items, fraction, seed=1):
+    """ Generate items, a fraction of them with an invalid value. """
+    generator = random.Random (seed)
+    locations = SCHEMA["items"]["properties"]["location"]["enum"]
+    data = [{ "id": "%09d" % index, "count": index % 500,
+      "price": index % 1000 / 4.0, "location": locations[index % 4],
+      "active": index % 3 == 0 } for index in range (items)]
+    for index in generator.sample (range (items), int (items * fraction)):
+        name, value = generator.choice (INVALID)
+        data[index][name] = value
+    return data
+
+def errors (validator, data):
+    """ Time validation, returning (seconds, sorted paths and messages). """
+    start = time.time ()
+    found = list (validator.iter_errors (data))
+    elapsed = time.time () - start
+    return elapsed, sorted ((list (error.path), error.message)
+      for error in found)
+
+def main ():
+    """ Run benchmark. """
+    parser = ArgumentParser (prog="jsonvalidate.columnarbench")
+    parser.add_argument ("-i", "--items", type=int, default=1000000,
+      help="Number of array items")
+    parser.add_argument ("-f", "--fraction", type=float, default=0.001,
+      help="Fraction of items not valid")
+    args = parser.parse_args ()
+
+    data = inventory (args.items, args.fraction)
+    validator = Draft4Validator (SCHEMA)
+    batch = BatchValidator (validator)
+    if batch.numpy is None:
+        print ("NumPy not installed, BatchValidator validates per element")
+
+    base, expected = errors (validator, data)
+    elapsed, found = errors (batch, data)
+    print ("%d items, %d errors" % (args.items, len (expected)))
+    print ("%-16s %10s" % ("validator", "seconds"))
+    print ("%-16s %10.2f" % ("Draft4Validator", base))
+    print ("%-16s %10.2f  (%.1fx)" % ("BatchValidator", elapsed,
+      base / elapsed))
+    if found != expected:
+        print ("Errors differ")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit (main ())
@@ -0,0 +1,243 @@
+"""
+Validation daemon.
+
+Listens on a Unix domain socket for requests from jsonvalidate clients,
+holding compiled validators in memory so each request only reads and
+validates its data file. A validator is rebuilt when its schema,
+reference or JSDB files change, or any schema in its registry
+directories, and the daemon exits when no request has been received
+for the idle timeout.
+
+Usage: python -m jsonvalidate.daemon [--socket path] [--idle seconds]
+
+Each connection is handled on its own thread, so a slow client only
+delays itself: a request is a JSON object on one line with the
+jsonvalidate arguments, answered with a JSON object holding the result
+code and message. Validation runs one request at a time, as it changes
+to the client's directory. A client that fails or stalls past the
+request timeout only loses its own connection. The socket and its lock
+file are only readable and writable by the user.
+"""
+from argparse import ArgumentParser
+from collections import OrderedDict
+from signal import signal, SIGTERM
+from threading import Lock, Thread
+import fcntl
+import json
+import os
+import select
+import socket
+import time
+from jsonvalidate.client import socketPath
+from jsonvalidate.validate import (createValidator, validateData,
+  _readJsonFile, VALID, MSG_READ_ERROR)
+
+# seconds without a request before the daemon exits
+IDLE_TIMEOUT = 600.0
+# maximum number of validators held
+CACHE_SIZE = 64
+# seconds to wait for a client to send its request
+REQUEST_TIMEOUT = 10.0
+
+class ValidationDaemon:
+    """
+    Daemon holding compiled validators.
+    Args:
+        path Socket path to listen on.
+        idle Seconds without a request before exiting.
+    """
+    def __init__ (self, path, idle):
+        self.path = path
+        self.idle = idle
+        self.validators = OrderedDict ()
+        self.registries = {}
+        self.running = True
+        # validation, with its directory change and caches, one at a time
+        self.lock = Lock ()
+        self.threads = []
+        self.lastRequest = time.time ()
+
+    def run (self):
+        """ Listen and process requests until idle or terminated. """
+        # socket and lock file only for this user
+        os.umask (0o077)
+        # only one daemon per socket, exit if another holds the lock
+        try:
+            lock = os.fdopen (os.open (self.path + ".lock", os.O_WRONLY |
+              os.O_CREAT | getattr (os, "O_NOFOLLOW", 0), 0o600), "w")
+            fcntl.flock (lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            return
+
+        if os.path.lexists (self.path):
+            os.unlink (self.path)
+        listener = socket.socket (socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind (self.path)
+        listener.listen (128)
+        signal (SIGTERM, self.stop)
+
+        try:
+            while self.running and (self.busy () or
+              time.time () - self.lastRequest < self.idle):
+                try:
+                    ready = select.select ([listener], [], [], 1.0)[0]
+                    if len (ready) == 0:
+                        continue
+                    connection = listener.accept ()[0]
+                except (select.error, socket.error, OSError):
+                    continue
+                self.lastRequest = time.time ()
+                thread = Thread (target=self.handle, args=(connection,))
+                thread.daemon = True
+                thread.start ()
+                self.threads.append (thread)
+        finally:
+            listener.close ()
+            os.unlink (self.path)
+            # let requests in progress finish
+            for thread in self.threads:
+                thread.join (REQUEST_TIMEOUT)
+            lock.close ()
+
+    def busy (self):
+        """ Check for connections in progress, forgetting finished ones. """
+        self.threads = [thread for thread in self.threads
+          if thread.is_alive ()]
+        return len (self.threads) > 0
+
+    def stop (self, signum, frame):
+        """ Signal handler, stop after the requests in progress. """
+        self.running = False
+
+    def handle (self, connection):
+        """ Serve a connection, closing it on any socket error. """
+        try:
+            self.serve (connection)
+        except (socket.error, socket.timeout, OSError):
+            # client gone or stalled, only its connection is lost
+            pass
+        finally:
+            connection.close ()
+            self.lastRequest = time.time ()
+
+    def serve (self, connection):
+        """ Read a request from a connection and send the response. """
+        connection.settimeout (REQUEST_TIMEOUT)
+        chunks = []
+        while True:
+            chunk = connection.recv (65536)
+            if not chunk:
+                break
+            chunks.append (chunk)
+        try:
+            request = json.loads (b"".join (chunks).decode ("utf8"))
+            with self.lock:
+                code, message = self.validate (request)
+        except Exception as e:
+            code, message = 1, "Daemon error: " + str (e)
+        response = { "code": code, "message": str (message) }
+        connection.sendall (json.dumps (response).encode ("utf8"))
+
+    def validate (self, request):
+        """
+        Validate the data file of a request with a cached validator.
+        Returns:
+            Tuple of (code, message).
+        """
+        # paths are relative to the client directory
+        os.chdir (request["cwd"])
+        dataFile = request["jsonFile"]
+        parser = request.get ("parser")
+
+        code, data, message = _readJsonFile (dataFile, parser)
+        if code != VALID:
+            return code, MSG_READ_ERROR.format (dataFile, message)
+
+        code, validator, message = self.getValidator (request["schemaFile"],
+          request.get ("refFiles"), request.get ("jsdbFile"), parser,
+          self.getRegistry (request.get ("schemaDirs"), parser))
+        if code != VALID:
+            return code, message
+
+        code, data, message = validateData (dataFile, data, validator)
+        return code, message
+
+    def getRegistry (self, schemaDirs, parser):
+        """
+        Get the registry for schema directories, refreshed so changed
+        schemas are indexed, None if no directories.
+        """
+        if not schemaDirs:
+            return None
+        key = (tuple (os.path.abspath (d) for d in schemaDirs), parser)
+        registry = self.registries.get (key)
+        if registry is None:
+            from jsonvalidate.registry import SchemaRegistry
+            registry = SchemaRegistry (key[0], parser=parser)
+            self.registries[key] = registry
+        else:
+            registry.refresh ()
+        return registry
+
+    def getValidator (self, schemaFile, refFiles, jsdbFile, parser,
+      registry=None):
+        """
+        Get the validator for schema files, creating it if not cached or
+        if any of the files, or registry schemas, changed since it was
+        created.
+        Returns:
+            Tuple of (code, validator, message).
+        """
+        files = [schemaFile] + list (refFiles or [])
+        if jsdbFile is not None:
+            files.append (jsdbFile)
+        key = (tuple (os.path.abspath (file) for file in files),
+          jsdbFile is not None, parser,
+          None if registry is None else tuple (registry.directories))
+        signature = _signature (key[0])
+        if registry is not None:
+            signature += (registry.generation,)
+
+        entry = self.validators.pop (key, None)
+        if entry is None or entry[0] != signature:
+            code, validator, message = createValidator (schemaFile, refFiles,
+              jsdbFile, parser, registry)
+            if code != VALID:
+                return code, None, message
+            # reference files newly added to the registry count as seen
+            if registry is not None:
+                signature = signature[:-1] + (registry.generation,)
+            entry = (signature, validator)
+
+        # hold most recently used validators
+        self.validators[key] = entry
+        if len (self.validators) > CACHE_SIZE:
+            self.validators.popitem (last=False)
+        return VALID, entry[1], None
+
+def _signature (files):
+    """ Inode, modification time and size of files, None if missing. """
+    signature = []
+    for file in files:
+        try:
+            info = os.stat (file)
+            signature.append ((info.st_ino,
+              getattr (info, "st_mtime_ns", info.st_mtime), info.st_size))
+        except OSError:
+            signature.append (None)
+    return tuple (signature)
+
+def main ():
+    """ Parse command line and run daemon. """
+    parser = ArgumentParser (prog="jsonvalidate.daemon")
+    parser.add_argument ("--socket", dest="path", default=socketPath (),
+      help="Unix domain socket path")
+    parser.add_argument ("--idle", type=float, default=IDLE_TIMEOUT,
+      help="Seconds without a request before exiting")
+    args = parser.parse_args ()
+    if args.path is None:
+        parser.error ("no private directory for the socket, use --socket")
+    ValidationDaemon (args.path, args.idle).run ()
+
+if __name__ == "__main__":
+    main ()
@@ -0,0 +1,226 @@
+"""
+Discriminator dispatch for oneOf and anyOf.
+
+Draft 4 validation of oneOf and anyOf tries each alternative, collecting
+the errors of those that fail, although alternatives are often selected
+by the value of one property or the type of the instance. Each oneOf or
+anyOf is analysed once, the first time it is used, for conditions an
+instance must meet to be valid against each alternative:
+ - a type, when the alternative has one
+ - required properties, for objects
+ - a required property whose schema is an enum, for objects
+
+A property that every alternative requires with distinct enum values is
+a discriminator, indexed by value, and distinct types are indexed by
+type, so an instance goes straight to the alternatives it can match.
+Only those are validated. When they do not give a clear answer (no
+alternative valid, or for oneOf more than one), the standard keyword
+runs, so results and errors are the same as trying every alternative.
+DispatchValidator also takes any mapping, not only a dict, as an object.
+"""
+try:
+    # Python 3
+    from collections.abc import Mapping
+except ImportError:
+    # Python 2
+    from collections import Mapping
+from threading import Lock
+from jsonschema import Draft4Validator
+from jsonschema.validators import extend
+
+# analysed oneOf and anyOf lists, by id, holding the list so its id is
+# not reused, cleared when full, shared by threads under the lock
+CACHE_SIZE = 1024
+_dispatches = {}
+_dispatchesLock = Lock ()
+
+# JSON Schema types in the order checked, and of parsed values
+TYPES = ["null", "boolean", "integer", "number", "string", "array", "object"]
+PARSED_TYPES = { type (None): "null", bool: "boolean", int: "integer",
+  float: "number", str: "string", list: "array", dict: "object" }
+
+# standard keywords, run when dispatch does not give a clear answer
+_oneOf = Draft4Validator.VALIDATORS["oneOf"]
+_anyOf = Draft4Validator.VALIDATORS["anyOf"]
+
+class _Dispatch:
+    """
+    Conditions of each alternative, and indexes to select candidates.
+    Args:
+        validator Validator, to resolve references and check types.
+        alternatives List of oneOf or anyOf subschemas.
+    """
+    def __init__ (self, validator, alternatives):
+        self.alternatives = alternatives
+        self.types = []
+        self.required = []
+        self.enums = []
+        for alternative in alternatives:
+            alternative = _resolve (validator, alternative)
+            if not isinstance (alternative, dict):
+                alternative = {}
+            types = alternative.get ("type")
+            if isinstance (types, str):
+                types = [types]
+            self.types.append (None if not isinstance (types, list) else
+              frozenset (types))
+            required = alternative.get ("required", [])
+            self.required.append (required)
+            # required properties limited to an enum of simple values
+            enums = {}
+            properties = alternative.get ("properties", {})
+            for name in required:
+                property = _resolve (validator, properties.get (name))
+                if isinstance (property, dict) and "enum" in property:
+                    keys = [_key (value) for value in property["enum"]]
+                    if None not in keys:
+                        enums[name] = frozenset (keys)
+            self.enums.append (enums)
+        self.discriminator, self.index = self.valueIndex ()
+        self.typeIndex = self.typesIndex ()
+
+    def valueIndex (self):
+        """ Find a discriminator property, indexing alternatives by value. """
+        if len (self.enums) < 2:
+            return None, None
+        for name in sorted (self.enums[0]):
+            if not all (name in enums for enums in self.enums):
+                continue
+            index = {}
+            for position, enums in enumerate (self.enums):
+                for key in enums[name]:
+                    index.setdefault (key, []).append (position)
+            # distinct values select one alternative each
+            if all (len (positions) == 1 for positions in index.values ()):
+                return name, index
+        return None, None
+
+    def typesIndex (self):
+        """ Index alternatives by the types they allow, if all have types. """
+        if len (self.types) < 2 or None in self.types:
+            return None
+        index = dict ((name, []) for name in TYPES)
+        for position, types in enumerate (self.types):
+            for name in types:
+                index.setdefault (name, []).append (position)
+                # integers are numbers
+                if name == "number":
+                    index["integer"].append (position)
+        return index
+
+    def candidates (self, validator, instance):
+        """ Positions of alternatives an instance may be valid against. """
+        kind = _typeName (validator, instance)
+        if self.discriminator is not None and kind == "object":
+            key = _key (instance.get (self.discriminator))
+            if self.discriminator not in instance or key is None:
+                return []
+            positions = self.index.get (key, [])
+        elif self.typeIndex is not None:
+            positions = self.typeIndex.get (kind, [])
+        else:
+            positions = range (len (self.alternatives))
+        return [position for position in positions
+          if self.possible (validator, position, instance, kind)]
+
+    def possible (self, validator, position, instance, kind):
+        """ Check the conditions of an alternative. """
+        types = self.types[position]
+        if types is not None and kind not in types and \
+          not (kind == "integer" and "number" in types):
+            return False
+        if kind == "object":
+            for name in self.required[position]:
+                if name not in instance:
+                    return False
+            for name, keys in self.enums[position].items ():
+                if _key (instance[name]) not in keys:
+                    return False
+        return True
+
+def oneOf (validator, oneOf, instance, schema):
+    """ oneOf validating only the alternatives the instance can match. """
+    valid = _validCount (validator, oneOf, instance, 2)
+    if valid != 1:
+        for error in _oneOf (validator, oneOf, instance, schema):
+            yield error
+
+def anyOf (validator, anyOf, instance, schema):
+    """ anyOf validating only the alternatives the instance can match. """
+    if _validCount (validator, anyOf, instance, 1) == 0:
+        for error in _anyOf (validator, anyOf, instance, schema):
+            yield error
+
+def _validCount (validator, alternatives, instance, limit):
+    """ Count candidate alternatives valid for an instance, up to limit. """
+    dispatch = _getDispatch (validator, alternatives)
+    valid = 0
+    for position in dispatch.candidates (validator, instance):
+        for error in validator.descend (instance, alternatives[position],
+          schema_path=position):
+            break
+        else:
+            valid += 1
+            if valid >= limit:
+                break
+    return valid
+
+def _getDispatch (validator, alternatives):
+    """ Get the analysis of a oneOf or anyOf list, made once. """
+    with _dispatchesLock:
+        entry = _dispatches.get (id (alternatives))
+    if entry is not None and entry[0] is alternatives:
+        return entry[1]
+
+    # analysed outside the lock, as references may load other documents
+    dispatch = _Dispatch (validator, alternatives)
+    with _dispatchesLock:
+        if len (_dispatches) >= CACHE_SIZE:
+            _dispatches.clear ()
+        _dispatches[id (alternatives)] = (alternatives, dispatch)
+    return dispatch
+
+def _resolve (validator, schema):
+    """ Follow references of a subschema, None if not resolved. """
+    seen = 0
+    while isinstance (schema, dict) and "$ref" in schema and seen < 32:
+        try:
+            url, schema = validator.resolver.resolve (schema["$ref"])
+        except Exception:
+            return None
+        seen += 1
+    return schema
+
+def _key (value):
+    """ Index key of a simple JSON value, equal as JSON values are. """
+    if isinstance (value, bool):
+        return ("boolean", value)
+    if isinstance (value, (int, float)):
+        return ("number", value)
+    if isinstance (value, str):
+        return ("string", value)
+    if value is None:
+        return ("null", None)
+    return None
+
+def _typeName (validator, instance):
+    """ Most specific JSON Schema type of an instance. """
+    name = PARSED_TYPES.get (type (instance))
+    if name == "number" and instance.is_integer ():
+        # 1.0 is an integer for some drafts, decided by the validator
+        name = None
+    if name is not None:
+        return name
+    for name in TYPES:
+        if validator.is_type (instance, name):
+            return name
+    return None
+
+def _isObject (checker, instance):
+    """ Objects are dicts, or other mappings such as loaded records. """
+    return isinstance (instance, Mapping)
+
+# Draft 4 validator with discriminator dispatch, accepting mappings
+DispatchValidator = extend (Draft4Validator, { "oneOf": oneOf,
+  "anyOf": anyOf }, type_checker=Draft4Validator.TYPE_CHECKER.redefine (
+  "object", _isObject))
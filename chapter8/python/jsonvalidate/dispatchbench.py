@@ -0,0 +1,100 @@
+"""
+Discriminator dispatch equivalence check and benchmark.
+
+For each schema using oneOf or anyOf in the chapter fixtures, validates
+the fixture files and documents from jsonvalidate.generate, half of
+them made not valid, with Draft4Validator and with DispatchValidator,
+checking both give the same errors, including the errors of each
+alternative, then reports the time of each validator. Exits with 1 if
+any result differs.
+
+Usage: python -m jsonvalidate.dispatchbench [-n documents] [-s seed]
+"""
+from argparse import ArgumentParser
+import glob
+import json
+import os
+import sys
+import time
+from jsonschema import Draft4Validator
+from jsonvalidate.validate import createValidator, VALID
+from jsonvalidate.generate import DocumentGenerator
+
+# fixture files, relative to this file
+ROOT = os.path.join (os.path.dirname (os.path.abspath (__file__)),
+  "..", "..", "..")
+
+# schema, fixture file patterns
+FIXTURES = [
+    ("chapter3/choiceOneOf_schema.json", ["chapter3/choiceOneOf*.json"]),
+    ("chapter3/choiceAnyOf_schema.json", ["chapter3/choiceAnyOf*.json"]),
+    ("chapter4/postNorthAmerica_schema.json", ["chapter4/postCanada*.json",
+      "chapter3/postCanada*.json", "chapter3/postUSA*.json"]),
+    ("chapter4/taxEntity_schema.json", ["chapter4/taxEntity*.json"])
+]
+
+def describe (errors):
+    """ Comparable form of errors, with the errors of alternatives. """
+    return sorted ((list (error.path), list (error.schema_path),
+      error.validator, error.message, describe (error.context))
+      for error in errors)
+
+def main ():
+    """ Run check and benchmark. """
+    parser = ArgumentParser (prog="jsonvalidate.dispatchbench")
+    parser.add_argument ("-n", "--documents", type=int, default=5000,
+      help="Generated documents per schema")
+    parser.add_argument ("-s", "--seed", type=int, default=1,
+      help="Seed for generated documents")
+    args = parser.parse_args ()
+
+    differences = 0
+    print ("%-30s %-7s %6s %10s %10s" % ("schema", "", "docs", "draft4 ms",
+      "dispatch ms"))
+    for schemaFile, patterns in FIXTURES:
+        code, dispatch, message = createValidator (os.path.join (ROOT,
+          schemaFile), None, None)
+        if code != VALID:
+            print (message)
+            return 1
+        standard = Draft4Validator (dispatch.schema,
+          resolver=dispatch.resolver)
+
+        documents = []
+        for pattern in patterns:
+            for file in sorted (glob.glob (os.path.join (ROOT, pattern))):
+                if not file.endswith ("_schema.json"):
+                    with open (file) as f:
+                        documents.append (json.load (f))
+        generator = DocumentGenerator (dispatch, args.seed)
+        documents += [generator.document (index % 2 == 1)
+          for index in range (args.documents)]
+
+        valid = []
+        invalid = []
+        for document in documents:
+            expected = describe (standard.iter_errors (document))
+            if describe (dispatch.iter_errors (document)) != expected:
+                differences += 1
+                print ("Results differ for " + json.dumps (document))
+            (invalid if len (expected) > 0 else valid).append (document)
+
+        # valid documents take the dispatch path, others the standard one
+        for name, group in (("valid", valid), ("invalid", invalid)):
+            times = []
+            for validator in (standard, dispatch):
+                start = time.time ()
+                for document in group:
+                    list (validator.iter_errors (document))
+                times.append ((time.time () - start) * 1000)
+            print ("%-30s %-7s %6d %10.1f %10.1f" % (os.path.basename (
+              schemaFile), name, len (group), times[0], times[1]))
+
+    if differences > 0:
+        print ("%d documents with different results" % differences)
+        return 1
+    print ("All results identical")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit (main ())
@@ -0,0 +1,510 @@
+"""
+Generate JSON documents from a JSON Schema
+
+Usage: python -m jsonvalidate.generate [-options] schemaFile
+Options:
+  -r    Referenced schema file (repeat for more files)
+  -j    JSDB file containing ref schemas
+  -d    Directory of schemas, indexed by id (repeat for more)
+  -n    Number of documents, default 10
+  -i    Fraction of documents made not valid, default 0
+  -s    Seed, the same seed and options generate the same documents
+  -a    Longest array when the schema has no maxItems, default 5
+  -f    Output format, ndjson (one document per line) or array
+  -o    Output file, written with safefile, default standard output
+
+Documents are generated from the Draft 4 schema, following $ref and
+jsdb: references through the same resolver as validation, and checked
+with the validator: a document is generated again if not valid, as
+choices such as oneOf are not always met the first time. Documents made
+not valid have a random value replaced by a value of another type,
+a property removed or a property added, until the validator rejects
+them, and are left valid if no change does. Documents are written as
+they are generated, so memory holds one document. A summary is printed
+to standard error.
+"""
+from argparse import ArgumentParser
+import json
+import random
+import sys
+from jsonvalidate.validate import createValidator, VALID
+from safefile import safeWriteFile, SafeFileError
+try:
+    # Python 3.11
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+# attempts to generate a valid document, or make one not valid
+ATTEMPTS = 50
+
+# deepest nesting generated, beyond which optional content is left out
+DEPTH = 12
+
+# values for string formats
+FORMATS = {
+    "date-time": lambda generator: "%04d-%02d-%02dT%02d:%02d:%02dZ" % (
+      generator.randint (1970, 2037), generator.randint (1, 12),
+      generator.randint (1, 28), generator.randint (0, 23),
+      generator.randint (0, 59), generator.randint (0, 59)),
+    "email": lambda generator: "%s@%s.com" % (_word (generator, 3, 10),
+      _word (generator, 3, 10)),
+    "hostname": lambda generator: "%s.%s.com" % (_word (generator, 2, 8),
+      _word (generator, 3, 10)),
+    "ipv4": lambda generator: ".".join (str (generator.randint (0, 255))
+      for index in range (4)),
+    "ipv6": lambda generator: ":".join ("%x" % generator.randint (0, 65535)
+      for index in range (8)),
+    "uri": lambda generator: "http://%s.com/%s" % (_word (generator, 3, 10),
+      _word (generator, 1, 12))
+}
+
+# values of each type used to make documents not valid
+MUTATIONS = {
+    "string": ["", "x", "not valid"],
+    "integer": [-1, 0, 123456789],
+    "number": [-0.5, 3.25],
+    "boolean": [True, False],
+    "null": [None],
+    "object": [{}],
+    "array": [[]]
+}
+
+def main ():
+    """ Generate documents per command line arguments. """
+    args = processCommand ()
+    registry = None
+    if len (args.schemaDirs) > 0:
+        from jsonvalidate.registry import SchemaRegistry
+        registry = SchemaRegistry (args.schemaDirs)
+    code, validator, message = createValidator (args.schemaFile,
+      args.refFiles, args.jsdbFile, registry=registry)
+    if code != VALID:
+        print (message)
+        sys.exit (1)
+
+    generator = DocumentGenerator (validator, args.seed, args.arrayLength)
+    chunks = generator.chunks (args.count, args.invalid, args.format)
+    try:
+        if args.output is None:
+            for chunk in chunks:
+                sys.stdout.write (chunk)
+        else:
+            safeWriteFile (args.output, chunks)
+    except SafeFileError as e:
+        print (e.message)
+        sys.exit (1)
+    except ValueError as e:
+        print (str (e))
+        sys.exit (1)
+    sys.stderr.write ("%d documents, %d not valid, %d generated again\n" % (
+      generator.valid + generator.invalid, generator.invalid,
+      generator.retries))
+    if generator.unchanged > 0:
+        sys.stderr.write ("%d documents could not be made not valid\n" %
+          generator.unchanged)
+
+def processCommand ():
+    """ Get options from command line arguments. """
+    parser = ArgumentParser (prog="jsonvalidate.generate")
+    parser.add_argument ("schemaFile",
+      help="JSON Schema file to generate documents for")
+    parser.add_argument ("-r", "--ref", dest="refFiles", action="append",
+      help="Referenced schema file")
+    parser.add_argument ("-j", "--jsdb", dest="jsdbFile",
+      help="JSDB file containing ref schemas")
+    parser.add_argument ("-d", "--schema-dir", dest="schemaDirs",
+      action="append", default=[], help="Directory of schemas indexed by id")
+    parser.add_argument ("-n", "--count", type=int, default=10,
+      help="Number of documents")
+    parser.add_argument ("-i", "--invalid", type=float, default=0.0,
+      help="Fraction of documents made not valid")
+    parser.add_argument ("-s", "--seed", type=int, default=None,
+      help="Random seed")
+    parser.add_argument ("-a", "--array-length", dest="arrayLength",
+      type=int, default=5, help="Longest array without maxItems")
+    parser.add_argument ("-f", "--format", choices=["ndjson", "array"],
+      default="ndjson", help="Output format")
+    parser.add_argument ("-o", "--output", help="Output file")
+    return parser.parse_args ()
+
+class DocumentGenerator:
+    """
+    Generate documents for the schema of a validator.
+    Args:
+        validator Validator from createValidator, whose resolver is used
+          for $ref and jsdb: references.
+        seed Random seed, None for a different sequence each run.
+        arrayLength Longest array when the schema has no maxItems.
+    Attributes:
+        valid, invalid Number of documents generated of each kind.
+        retries Number of documents generated again.
+        unchanged Number of documents no change made not valid.
+    """
+    def __init__ (self, validator, seed=None, arrayLength=5):
+        self.validator = validator
+        self.resolver = validator.resolver
+        self.random = random.Random (seed)
+        self.arrayLength = arrayLength
+        self.valid = 0
+        self.invalid = 0
+        self.retries = 0
+        self.unchanged = 0
+
+    def chunks (self, count, invalid=0.0, format="ndjson"):
+        """
+        Generate documents as text chunks.
+        Args:
+            count Number of documents.
+            invalid Fraction of documents made not valid.
+            format "ndjson" for a document per line, "array" for a JSON
+              array of the documents.
+        """
+        if format == "array":
+            yield "["
+        for index in range (count):
+            document = self.document (self.random.random () < invalid)
+            text = json.dumps (document, sort_keys=True)
+            if format == "array":
+                yield ("\n  " if index == 0 else ",\n  ") + text
+            else:
+                yield text + "\n"
+        if format == "array":
+            yield "\n]\n"
+
+    def document (self, invalid=False):
+        """
+        Generate a document.
+        Args:
+            invalid Flag, make the document not valid.
+        Raises:
+            ValueError if no document could be generated.
+        """
+        for attempt in range (ATTEMPTS):
+            document = self.value (self.validator.schema, 0)
+            if self.validator.is_valid (document):
+                break
+            self.retries += 1
+        else:
+            raise ValueError ("No valid document generated in %d attempts"
+              % ATTEMPTS)
+
+        if invalid:
+            for attempt in range (ATTEMPTS):
+                mutated = self.mutate (document)
+                if not self.validator.is_valid (mutated):
+                    self.invalid += 1
+                    return mutated
+            # schemas accepting any value
+            self.unchanged += 1
+        self.valid += 1
+        return document
+
+    def value (self, schema, depth):
+        """ Generate a value for a schema. """
+        if not isinstance (schema, dict):
+            return None
+        if "$ref" in schema:
+            with self.resolver.resolving (schema["$ref"]) as resolved:
+                return self.value (resolved, depth)
+
+        generator = self.random
+        if "allOf" in schema:
+            schema = self.merge (schema)
+        if "enum" in schema:
+            return generator.choice (schema["enum"])
+        for keyword in ("oneOf", "anyOf"):
+            if keyword in schema:
+                rest = dict ((key, schema[key]) for key in schema
+                  if key != keyword)
+                return self.value (self.merge ({ "allOf": [rest,
+                  generator.choice (schema[keyword])] }), depth)
+
+        kind = schema.get ("type")
+        if isinstance (kind, list):
+            kind = generator.choice (kind)
+        if kind is None:
+            kind = _impliedType (schema)
+        if kind is None:
+            kind = generator.choice (["string", "integer", "boolean"])
+
+        if kind == "object":
+            return self.object (schema, depth)
+        if kind == "array":
+            return self.array (schema, depth)
+        if kind == "string":
+            return self.string (schema)
+        if kind in ("integer", "number"):
+            return self.number (schema, kind == "integer")
+        if kind == "boolean":
+            return generator.random () < 0.5
+        return None
+
+    def merge (self, schema):
+        """ Merge the allOf schemas into one, resolving references. """
+        merged = dict ((key, schema[key]) for key in schema if key != "allOf")
+        for part in schema["allOf"]:
+            while isinstance (part, dict) and "$ref" in part:
+                url, part = self.resolver.resolve (part["$ref"])
+            if isinstance (part, dict) and "allOf" in part:
+                part = self.merge (part)
+            if not isinstance (part, dict):
+                continue
+            for key, value in part.items ():
+                if key == "properties" and key in merged:
+                    properties = dict (merged[key])
+                    properties.update (value)
+                    merged[key] = properties
+                elif key == "required" and key in merged:
+                    merged[key] = merged[key] + [name for name in value
+                      if name not in merged[key]]
+                else:
+                    merged[key] = value
+        return merged
+
+    def object (self, schema, depth):
+        """ Generate an object, with its required and some optional
+        properties. """
+        generator = self.random
+        properties = schema.get ("properties", {})
+        required = schema.get ("required", [])
+        names = [name for name in properties if name not in required]
+        generator.shuffle (names)
+        if depth >= DEPTH:
+            names = []
+        else:
+            names = names[:generator.randint (0, len (names))]
+        minimum = schema.get ("minProperties", 0)
+
+        result = {}
+        for name in required + names:
+            result[name] = self.value (properties.get (name, {}), depth + 1)
+        # dependencies of properties included
+        for name, dependency in schema.get ("dependencies", {}).items ():
+            if name in result and isinstance (dependency, list):
+                for other in dependency:
+                    if other not in result:
+                        result[other] = self.value (properties.get (other,
+                          {}), depth + 1)
+        while len (result) < minimum:
+            extra = [name for name in properties if name not in result]
+            if len (extra) == 0:
+                break
+            name = generator.choice (extra)
+            result[name] = self.value (properties[name], depth + 1)
+
+        # pattern properties, as names generated from their patterns
+        for pattern, subschema in schema.get ("patternProperties",
+          {}).items ():
+            if depth < DEPTH and generator.random () < 0.5:
+                result[_pattern (generator, pattern)] = self.value (subschema,
+                  depth + 1)
+        return result
+
+    def array (self, schema, depth):
+        """ Generate an array within minItems and maxItems. """
+        generator = self.random
+        minimum = schema.get ("minItems", 0)
+        maximum = schema.get ("maxItems", max (minimum, self.arrayLength))
+        if depth >= DEPTH:
+            maximum = minimum
+        items = schema.get ("items", {})
+        result = []
+        for index in range (generator.randint (minimum, maximum)):
+            if isinstance (items, list):
+                if index < len (items):
+                    subschema = items[index]
+                else:
+                    subschema = schema.get ("additionalItems", {})
+                    if subschema is False:
+                        break
+            else:
+                subschema = items
+            value = self.value (subschema, depth + 1)
+            if schema.get ("uniqueItems") and value in result:
+                continue
+            result.append (value)
+        return result
+
+    def string (self, schema):
+        """ Generate a string for format, pattern or length. """
+        generator = self.random
+        format = FORMATS.get (schema.get ("format"))
+        if format is not None:
+            return format (generator)
+        if "pattern" in schema:
+            return _pattern (generator, schema["pattern"])
+        minimum = schema.get ("minLength", 1)
+        maximum = schema.get ("maxLength", max (minimum, 12))
+        return _word (generator, minimum, maximum)
+
+    def number (self, schema, integer):
+        """ Generate a number within minimum, maximum and multipleOf. """
+        generator = self.random
+        minimum = schema.get ("minimum", 0 if "maximum" not in schema
+          else schema["maximum"] - 1000)
+        maximum = schema.get ("maximum", minimum + 1000)
+        multiple = schema.get ("multipleOf")
+        if integer or multiple is not None:
+            step = multiple if multiple is not None else 1
+            low = int (-(-minimum // step))
+            high = int (maximum // step)
+            if schema.get ("exclusiveMinimum") and low * step == minimum:
+                low += 1
+            if schema.get ("exclusiveMaximum") and high * step == maximum:
+                high -= 1
+            value = generator.randint (low, max (low, high)) * step
+            return int (value) if integer else value
+        value = round (generator.uniform (minimum, maximum), 2)
+        if value <= minimum and schema.get ("exclusiveMinimum") or \
+          value >= maximum and schema.get ("exclusiveMaximum"):
+            value = (minimum + maximum) / 2.0
+        return value
+
+    def mutate (self, document):
+        """ Copy of a document with one random change. """
+        document = json.loads (json.dumps (document))
+        generator = self.random
+        containers = []
+        _containers (document, containers)
+        kinds = sorted (MUTATIONS)
+        if len (containers) == 0 or generator.random () < 0.1:
+            return generator.choice (MUTATIONS[generator.choice (kinds)])
+
+        container = generator.choice (containers)
+        if isinstance (container, dict):
+            choice = generator.random ()
+            if choice < 0.2 or len (container) == 0:
+                container["x" + _word (generator, 4, 8)] = 1
+                return document
+            key = generator.choice (sorted (container))
+            if choice < 0.4:
+                del container[key]
+                return document
+        else:
+            if len (container) == 0:
+                container.append (None)
+                return document
+            key = generator.randrange (len (container))
+        kind = _typeName (container[key])
+        container[key] = generator.choice (MUTATIONS[generator.choice (
+          [name for name in kinds if name != kind and
+          not (kind == "integer" and name == "number")])])
+        return document
+
+def _impliedType (schema):
+    """ Type implied by the keywords of a schema without type. """
+    if "properties" in schema or "required" in schema:
+        return "object"
+    if "items" in schema:
+        return "array"
+    if "pattern" in schema or "format" in schema or "maxLength" in schema:
+        return "string"
+    if "minimum" in schema or "maximum" in schema or "multipleOf" in schema:
+        return "number"
+    return None
+
+def _typeName (value):
+    """ JSON Schema type name of a value. """
+    if isinstance (value, bool):
+        return "boolean"
+    if isinstance (value, int):
+        return "integer"
+    if isinstance (value, float):
+        return "number"
+    if isinstance (value, dict):
+        return "object"
+    if isinstance (value, list):
+        return "array"
+    if value is None:
+        return "null"
+    return "string"
+
+def _containers (value, found):
+    """ Collect objects and arrays within a value. """
+    if isinstance (value, dict):
+        found.append (value)
+        for child in value.values ():
+            _containers (child, found)
+    elif isinstance (value, list):
+        found.append (value)
+        for child in value:
+            _containers (child, found)
+
+def _word (generator, minimum, maximum):
+    """ Random lower case word with a length in range. """
+    return "".join (generator.choice ("abcdefghijklmnopqrstuvwxyz")
+      for index in range (generator.randint (minimum, max (minimum, maximum))))
+
+# characters for regular expression categories and any character
+_CATEGORIES = {
+    sre_constants.CATEGORY_DIGIT: "0123456789",
+    sre_constants.CATEGORY_SPACE: " ",
+    sre_constants.CATEGORY_WORD: "abcdefghijklmnopqrstuvwxyz0123456789_",
+}
+_ANY = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 "
+
+def _pattern (generator, pattern):
+    """ Generate a string matching a regular expression. """
+    return "".join (_tokens (generator, sre_parse.parse (pattern)))
+
+def _tokens (generator, tokens):
+    """ Generate parts of a string for parsed expression tokens. """
+    parts = []
+    for opcode, argument in tokens:
+        if opcode == sre_constants.LITERAL:
+            parts.append (chr (argument))
+        elif opcode == sre_constants.NOT_LITERAL:
+            parts.append (generator.choice ([char for char in _ANY
+              if ord (char) != argument]))
+        elif opcode == sre_constants.ANY:
+            parts.append (generator.choice (_ANY))
+        elif opcode == sre_constants.IN:
+            parts.append (_choose (generator, argument))
+        elif opcode in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            low, high, subpattern = argument
+            high = min (high, low + 5)
+            for index in range (generator.randint (low, high)):
+                parts.extend (_tokens (generator, subpattern))
+        elif opcode == sre_constants.SUBPATTERN:
+            parts.extend (_tokens (generator, argument[-1]))
+        elif opcode == sre_constants.BRANCH:
+            parts.extend (_tokens (generator, generator.choice (argument[1])))
+        elif opcode == sre_constants.CATEGORY:
+            parts.append (generator.choice (_CATEGORIES.get (argument, "a")))
+        # anchors and other assertions generate nothing
+    return parts
+
+def _choose (generator, items):
+    """ Choose a character from a parsed character set. """
+    if len (items) > 0 and items[0][0] == sre_constants.NEGATE:
+        return generator.choice ([char for char in _ANY
+          if not _inSet (char, items[1:])])
+    choices = []
+    for opcode, argument in items:
+        if opcode == sre_constants.LITERAL:
+            choices.append (chr (argument))
+        elif opcode == sre_constants.RANGE:
+            choices.extend (chr (code) for code in range (argument[0],
+              argument[1] + 1))
+        elif opcode == sre_constants.CATEGORY:
+            choices.extend (_CATEGORIES.get (argument, "a"))
+    return generator.choice (choices)
+
+def _inSet (char, items):
+    """ Check if a character is in a parsed character set. """
+    for opcode, argument in items:
+        if opcode == sre_constants.LITERAL and ord (char) == argument:
+            return True
+        if opcode == sre_constants.RANGE and \
+          argument[0] <= ord (char) <= argument[1]:
+            return True
+        if opcode == sre_constants.CATEGORY and \
+          char in _CATEGORIES.get (argument, ""):
+            return True
+    return False
+
+if __name__ == "__main__":
+    main ()
@@ -4,28 +4,100 @@ Validate JSON file against a JSON Schema
 Usage: jsonvalidate [-options] jsonFile schemaFile [refFiles ...]
 Options:
   -j    JSDB file containing ref schemas
+  -p    JSON parser (orjson, simdjson, ujson, json), default fastest
+  -n    Validate in this process, without the validation daemon
+  -d    Directory of schemas, indexed by id, read when referenced
+        (repeat for more directories)
+  -c    Result cache database, the cached result is returned if the
+        data and schema files are unchanged
+
+  -w    Watch mode, jsonFile may be a directory of data files, which
+        are revalidated as they or the schemas they use change
+  --poll  Poll for changes in watch mode, instead of inotify
+
+To validate many files, see jsonvalidate.batch.
+
+Validation is performed by a resident daemon holding compiled validators
+(see jsonvalidate.daemon), started on first use. Modules are imported
+only when needed, see jsonvalidate.benchmark for the start up budget.
 
 The result will be indicated with the sys.exit (n) where,
   0 indicates successful validation
   1 indicates validation failed
 """
 from argparse import ArgumentParser
-from os.path import isfile
+from os.path import isdir, isfile
 import sys
-from jsonvalidate.validate import validate
+from jsonparser import getParser, PARSERS
 
 def main ():
     """ Validate JSON per command line arguments. """
     # process command line arguments
-    jsonFile, schemaFile, refFiles, jsdbFile = processCommand ()
+    (jsonFile, schemaFile, refFiles, jsdbFile, parser, noDaemon,
+      schemaDirs, cacheFile, watch, poll) = processCommand ()
+
+    # verify selected parser is installed
+    if parser is not None:
+        try:
+            getParser (parser)
+        except ValueError as e:
+            print (e)
+            sys.exit (1)
 
     if jsdbFile is not None:
         if not isfile (jsdbFile):
             print ("JSDB file specified does not exist")
             sys.exit (1)
 
-    # validate content with schema
-    code, data, message = validate (jsonFile, schemaFile, refFiles, jsdbFile)
+    for schemaDir in schemaDirs:
+        if not isdir (schemaDir):
+            print ("Schema directory " + schemaDir + " does not exist")
+            sys.exit (1)
+
+    registry = None
+    if len (schemaDirs) > 0 and (noDaemon or cacheFile is not None or
+      watch):
+        from jsonvalidate.registry import SchemaRegistry
+        registry = SchemaRegistry (schemaDirs, parser=parser)
+
+    # keep validating as files change, until interrupted
+    if watch:
+        from jsonvalidate.watch import Watcher
+        try:
+            Watcher ([jsonFile], schemaFile, refFiles, jsdbFile, parser,
+              registry, poll=poll).run ()
+        except KeyboardInterrupt:
+            pass
+        sys.exit (0)
+
+    # return the cached result if data and schemas are unchanged
+    cache = key = result = None
+    if cacheFile is not None:
+        from jsonvalidate.resultcache import ResultCache
+        cache = ResultCache (cacheFile)
+        key = cache.key (jsonFile, schemaFile, refFiles, jsdbFile, registry)
+        if key is not None:
+            result = cache.get (key, jsonFile)
+            if result is not None:
+                key = None
+
+    # validate content with schema by the daemon, or in this process if
+    # the daemon is disabled or not available
+    if result is None and not noDaemon:
+        from jsonvalidate.client import request
+        result = request (jsonFile, schemaFile, refFiles, jsdbFile, parser,
+          schemaDirs=schemaDirs)
+    if result is not None:
+        code, message = result
+    else:
+        from jsonvalidate.validate import validate
+        code, data, message = validate (jsonFile, schemaFile, refFiles,
+          jsdbFile, parser, registry)
+
+    if cache is not None:
+        if key is not None:
+            cache.put (key, code, message)
+        cache.close ()
     # display message and exit with result code
     print (message)
     sys.exit (code)
@@ -40,6 +112,19 @@ def processCommand ():
       help="JSON Schema file to jsonvalidate against")
     parser.add_argument ("-j", "--jsdb", dest="jsdbFile", action="store",
       help="JSDB file containing ref schemas")
+    parser.add_argument ("-p", "--parser", dest="parser", choices=PARSERS,
+      help="JSON parser, default fastest installed")
+    parser.add_argument ("-n", "--no-daemon", dest="noDaemon",
+      action="store_true", help="Validate without the validation daemon")
+    parser.add_argument ("-d", "--schema-dir", dest="schemaDirs",
+      action="append", default=[],
+      help="Directory of schemas read when referenced, may be repeated")
+    parser.add_argument ("-c", "--cache", dest="cacheFile",
+      help="Result cache database")
+    parser.add_argument ("-w", "--watch", dest="watch", action="store_true",
+      help="Revalidate as data or schema files change")
+    parser.add_argument ("--poll", dest="poll", action="store_true",
+      help="Poll for changes in watch mode, instead of inotify")
     parser.add_argument ("refFiles", nargs="*",
       help="JSON Schema files with referenced elements")
     args = parser.parse_args ()
@@ -47,7 +132,9 @@ def processCommand ():
     # return command line parse results
     if "jsdbFile" not in args:
         args["jsdbFile"] = None
-    return args.jsonFile, args.schemaFile, args.refFiles, args.jsdbFile
+    return (args.jsonFile, args.schemaFile, args.refFiles, args.jsdbFile,
+      args.parser, args.noDaemon, args.schemaDirs, args.cacheFile,
+      args.watch, args.poll)
 
 if __name__ == "__main__":
     main ()
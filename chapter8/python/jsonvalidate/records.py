@@ -0,0 +1,202 @@
+"""
+Compact records for large arrays of objects.
+
+json.loads makes a dict for each object, and with millions of objects
+of the same properties, as the employees of an organization or the
+items of an inventory, most of the memory of a document is in these
+dicts. loadRecords parses JSON text making each object whose values
+are all simple (strings, numbers, booleans and null) a record instead:
+an instance of a __slots__ class made once for its list of property
+names, storing only the values. String values of a property are shared
+between records, as interned, until the property has SHARE_LIMIT
+distinct values, so repeated names and titles are stored once. Objects
+with other values, and property name lists beyond MAX_SHAPES, stay
+dicts. No dict is made for a record, so the peak memory of loading is
+also that of the records.
+
+Records are mutable mappings, so code reading the dicts works on them
+unchanged, and the validators from createValidator, ChangeTracker and
+BatchValidator accept them as objects, with the same results. The
+properties of a record are fixed: values can be changed, and removed
+and added back, but adding another property raises KeyError. toJson is
+a JSONEncoder default function encoding records as objects.
+"""
+import json
+try:
+    # Python 3
+    from collections.abc import MutableMapping
+except ImportError:
+    # Python 2
+    from collections import MutableMapping
+
+# most property name lists made records in a load, most properties in a
+# record, and most distinct strings of a property shared
+MAX_SHAPES = 256
+MAX_FIELDS = 64
+SHARE_LIMIT = 4096
+
+# types of simple values, as created by the JSON parser
+TEXT = type (u"")
+SIMPLE = frozenset ([TEXT, str, int, float, bool, type (None)])
+
+# record classes, by property names
+_classes = {}
+
+class Record (MutableMapping):
+    """
+    Base of record classes, a mapping with a fixed list of properties,
+    each stored in a slot.
+    """
+    __slots__ = ()
+    # property names, slot names, and slot of each property
+    fields = ()
+    _slotNames = ()
+    _slots = {}
+
+    def __getitem__ (self, name):
+        try:
+            return getattr (self, self._slots[name])
+        except AttributeError:
+            # removed
+            raise KeyError (name)
+
+    def __setitem__ (self, name, value):
+        slot = self._slots.get (name)
+        if slot is None:
+            raise KeyError (name)
+        setattr (self, slot, value)
+
+    def __delitem__ (self, name):
+        try:
+            delattr (self, self._slots[name])
+        except AttributeError:
+            raise KeyError (name)
+
+    def __contains__ (self, name):
+        slot = self._slots.get (name)
+        return slot is not None and hasattr (self, slot)
+
+    def __iter__ (self):
+        for name, slot in zip (self.fields, self._slotNames):
+            if hasattr (self, slot):
+                yield name
+
+    def __len__ (self):
+        count = 0
+        for slot in self._slotNames:
+            if hasattr (self, slot):
+                count += 1
+        return count
+
+    def get (self, name, default=None):
+        slot = self._slots.get (name)
+        if slot is None:
+            return default
+        return getattr (self, slot, default)
+
+    def toDict (self):
+        """ Properties as a dict. """
+        return dict ((name, getattr (self, slot))
+          for name, slot in zip (self.fields, self._slotNames)
+          if hasattr (self, slot))
+
+    def __repr__ (self):
+        return repr (self.toDict ())
+
+    def __reduce__ (self):
+        # rebuilt from properties, as classes are made when loading
+        return (_fromDict, (self.toDict (),))
+
+def recordClass (fields):
+    """
+    Get the record class for a list of property names, made once.
+    Args:
+        fields Tuple of property names.
+    Returns:
+        Record subclass.
+    """
+    cls = _classes.get (fields)
+    if cls is None:
+        slots = tuple ("_%d" % position for position in range (len (fields)))
+        cls = type ("Record", (Record,), { "__module__": __name__,
+          "__slots__": slots, "fields": fields, "_slotNames": slots,
+          "_slots": dict (zip (fields, slots)) })
+        _classes[fields] = cls
+    return cls
+
+class RecordLoader:
+    """
+    JSON object_pairs_hook making records of objects of simple values.
+    Args:
+        maxShapes Most property name lists made records.
+    """
+    def __init__ (self, maxShapes=MAX_SHAPES):
+        self.maxShapes = maxShapes
+        # record class and shared strings of each property, or None if
+        # the property names cannot be a record, by property names
+        self.shapes = {}
+
+    def __call__ (self, pairs):
+        names = tuple ([name for name, value in pairs])
+        shape = self.shapes.get (names)
+        if shape is None:
+            shape = self.shape (names)
+            if shape is None:
+                return dict (pairs)
+
+        cls, shared = shape
+        if cls is None:
+            return dict (pairs)
+        record = cls.__new__ (cls)
+        for position, (name, value) in enumerate (pairs):
+            kind = type (value)
+            if kind not in SIMPLE:
+                return dict (pairs)
+            if kind is TEXT:
+                strings = shared[position]
+                if strings is not None:
+                    value = strings.setdefault (value, value)
+                    if len (strings) > SHARE_LIMIT:
+                        # mostly distinct, as ids, so no longer shared
+                        shared[position] = None
+            setattr (record, cls._slotNames[position], value)
+        return record
+
+    def shape (self, names):
+        """ Record class and shared strings for property names. """
+        if len (self.shapes) >= self.maxShapes:
+            return None
+        if len (names) == 0 or len (names) > MAX_FIELDS or \
+          len (set (names)) != len (names):
+            shape = (None, None)
+        else:
+            shape = (recordClass (names), [{} for name in names])
+        self.shapes[names] = shape
+        return shape
+
+def loadRecords (data):
+    """
+    Parse JSON text, making objects of simple values records.
+    Args:
+        data JSON text, str or bytes, or a text stream to read it from.
+    Returns:
+        Parsed value.
+    Raises:
+        ValueError if the text is not JSON.
+    """
+    if hasattr (data, "read"):
+        return json.load (data, object_pairs_hook=RecordLoader ())
+    return json.loads (data, object_pairs_hook=RecordLoader ())
+
+def toJson (value):
+    """ JSONEncoder default function, encoding records as objects. """
+    if isinstance (value, Record):
+        return value.toDict ()
+    raise TypeError (repr (value) + " is not JSON serializable")
+
+def _fromDict (value):
+    """ Record with the properties of a dict. """
+    record = recordClass (tuple (value)) ()
+    for name in value:
+        record[name] = value[name]
+    return record
@@ -0,0 +1,130 @@
+"""
+Compact record memory benchmark.
+
+Writes a generated employee file, as chapter6, and inventory file, as
+chapter9, and for each loads and validates it in a new process with
+dicts and with records (validate with compact=True), then updates it:
+employee units are checked against a set of unit ids, and inventory
+counts are incremented through a ChangeTracker and revalidated. Reports
+the peak RSS before loading (base), and the time and peak RSS after
+loading and after updating, measured with the resource module, so Unix
+only.
+
+Usage: python -m jsonvalidate.recordsbench [-n records]
+"""
+from argparse import ArgumentParser, SUPPRESS
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# schema files, relative to this file
+ROOT = os.path.join (os.path.dirname (os.path.abspath (__file__)),
+  "..", "..", "..")
+SCHEMAS = { "employees": "chapter6/employee_schema.json",
+  "inventory": "chapter9/inventory_schema.json" }
+
+FIRST = ["Ann", "Bob", "Carrie", "Dan", "Eve", "Frank", "Gail", "Hal",
+  "Iris", "Jon", "Kate", "Lee", "Mia", "Ned", "Olga", "Pat"]
+LAST = ["Allen", "Baker", "Conner", "Dunn", "Evans", "Fox", "Grant",
+  "Hill", "Irwin", "James", "King", "Lane", "Moore", "Nash", "Owens"]
+TITLES = ["Analyst", "Accountant", "Auditor", "Clerk", "Director",
+  "Engineer", "Manager", "Recruiter", "Technician", "Vice President"]
+
+def generate (kind, count, file):
+    """ Write a generated employee or inventory file. """
+    rand = random.Random (1)
+    if kind == "employees":
+        document = { "employees": [{ "name": rand.choice (FIRST) + " " +
+          rand.choice (LAST), "unit": rand.randint (1, 9999),
+          "title": rand.choice (TITLES) } for index in range (count)] }
+    else:
+        document = [{ "id": "%09d" % rand.randint (0, 999999999),
+          "count": rand.randint (0, 5000) } for index in range (count)]
+    with open (file, "w") as f:
+        json.dump (document, f, indent=2)
+
+def peak ():
+    """ Peak RSS of this process in MB. """
+    import resource
+    used = resource.getrusage (resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KB elsewhere
+    return used / (1048576.0 if sys.platform == "darwin" else 1024.0)
+
+def child (kind, mode, file):
+    """ Load, validate and update a file, printing times and peaks. """
+    from jsonvalidate import validate, createValidator, ChangeTracker
+    result = { "base": peak () }
+    start = time.time ()
+    code, data, message = validate (file, os.path.join (ROOT,
+      SCHEMAS[kind]), None, None, parser="json", compact=mode == "records")
+    if code != 0:
+        raise RuntimeError (str (message))
+    result["load"] = time.time () - start
+    result["loadPeak"] = peak ()
+
+    start = time.time ()
+    if kind == "employees":
+        unitIds = set (range (1, 10000))
+        if not all (employee["unit"] in unitIds
+          for employee in data["employees"]):
+            raise RuntimeError ("employee unit not valid")
+    else:
+        code, validator, message = createValidator (os.path.join (ROOT,
+          SCHEMAS[kind]), None, None)
+        tracker = ChangeTracker (data, validator)
+        data = tracker.document
+        for item in data:
+            item["count"] = item["count"] + 1
+        if len (tracker.revalidateChanges ()) > 0:
+            raise RuntimeError ("inventory update not valid")
+    result["update"] = time.time () - start
+    result["updatePeak"] = peak ()
+    print (json.dumps (result))
+
+def main ():
+    """ Run benchmark. """
+    parser = ArgumentParser (prog="jsonvalidate.recordsbench")
+    parser.add_argument ("-n", "--records", type=int, default=1000000,
+      help="Employees and inventory items")
+    parser.add_argument ("--generate", nargs=3, help=SUPPRESS)
+    parser.add_argument ("--child", nargs=3, help=SUPPRESS)
+    args = parser.parse_args ()
+    if args.generate is not None:
+        generate (args.generate[0], int (args.generate[1]),
+          args.generate[2])
+        return 0
+    if args.child is not None:
+        child (*args.child)
+        return 0
+
+    directory = tempfile.mkdtemp ()
+    try:
+        print ("%-10s %-8s %8s %8s %8s %8s %8s %9s" % ("file", "form",
+          "file MB", "base MB", "load s", "load MB", "update s",
+          "update MB"))
+        for kind in ("employees", "inventory"):
+            file = os.path.join (directory, kind + ".json")
+            # in new processes, as the peak RSS is kept across exec
+            subprocess.check_call ([sys.executable, "-m",
+              "jsonvalidate.recordsbench", "--generate", kind,
+              str (args.records), file])
+            size = os.path.getsize (file) / 1048576.0
+            for mode in ("dict", "records"):
+                output = subprocess.check_output ([sys.executable, "-m",
+                  "jsonvalidate.recordsbench", "--child", kind, mode, file])
+                result = json.loads (output.decode ("utf8"))
+                print ("%-10s %-8s %8.1f %8.1f %8.2f %8.1f %8.2f %9.1f" % (
+                  kind, mode, size, result["base"], result["load"],
+                  result["loadPeak"], result["update"],
+                  result["updatePeak"]))
+    finally:
+        shutil.rmtree (directory)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit (main ())
@@ -0,0 +1,170 @@
+"""
+Schema registry.
+
+Indexes the JSON Schemas in one or more directories by id, so schemas
+referenced with $ref are found without listing them as refFiles, and
+only the schemas actually referenced are read. The index is saved to a
+file and kept current by comparing modification times and sizes, so
+only new or changed files are parsed when the registry is refreshed.
+Files that are not valid JSON are indexed with the parse error, so they
+are not parsed again until they change.
+"""
+from safefile import readFile, SafeFileError
+from jsonparser import getParser
+import json
+import os
+
+# index file name, saved in the first schema directory
+INDEX_FILE = ".schema_index.json"
+INDEX_VERSION = 2
+
+class SchemaRegistry:
+    """
+    Index of schema id to file.
+    Args:
+        directories (list of str): Directories to scan for .json files.
+        indexFile (str): Index file, None for INDEX_FILE in the first
+          directory.
+        parser (str): JSON parser name, None for fastest available.
+    """
+    def __init__ (self, directories, indexFile=None, parser=None):
+        self.directories = [os.path.abspath (d) for d in directories]
+        if indexFile is None and len (self.directories) > 0:
+            indexFile = os.path.join (self.directories[0], INDEX_FILE)
+        self.indexFile = indexFile
+        self.parser = parser
+        # path to [modified, size, id, parse error], and id to path
+        self.files = {}
+        self.ids = {}
+        # incremented when any indexed file changes
+        self.generation = 0
+        self.changed = False
+        self.loadIndex ()
+        self.refresh ()
+
+    def loadIndex (self):
+        """ Load saved index, ignoring a missing or unreadable index. """
+        if self.indexFile is None:
+            return
+        try:
+            index = json.loads (open (self.indexFile).read ())
+            if index.get ("version") == INDEX_VERSION:
+                self.files = index["files"]
+        except (IOError, ValueError, KeyError, AttributeError):
+            self.files = {}
+
+    def saveIndex (self):
+        """ Save index if changed, ignoring directories not writable. """
+        if self.indexFile is None or not self.changed:
+            return
+        index = { "version": INDEX_VERSION, "files": self.files }
+        temporary = self.indexFile + ".tmp"
+        try:
+            with open (temporary, "w") as f:
+                json.dump (index, f)
+            os.rename (temporary, self.indexFile)
+            self.changed = False
+        except (IOError, OSError):
+            pass
+
+    def refresh (self):
+        """
+        Scan the directories, parsing only new or changed files, and
+        save the index.
+        """
+        found = set ()
+        for directory in self.directories:
+            for path, dirs, names in os.walk (directory):
+                for name in names:
+                    if name.endswith (".json") and name != INDEX_FILE:
+                        file = os.path.join (path, name)
+                        found.add (file)
+                        try:
+                            self.addFile (file)
+                        except (SafeFileError, ValueError):
+                            pass
+
+        # forget files removed from the directories
+        for file in list (self.files):
+            inDirectory = any (file.startswith (d + os.sep)
+              for d in self.directories)
+            if inDirectory and file not in found:
+                del self.files[file]
+                self.changed = True
+                self.generation += 1
+
+        self.ids = {}
+        for file, entry in self.files.items ():
+            if entry[2] is not None:
+                self.ids[entry[2]] = file
+        self.saveIndex ()
+
+    def addFile (self, file):
+        """
+        Add a schema file to the index, parsing it only if new or
+        changed since indexed.
+        Args:
+            file (str): Schema file.
+        Returns:
+            Schema id, None if the schema has no id.
+        Raises:
+            SafeFileError if not readable, ValueError if not JSON.
+        """
+        path = os.path.abspath (file)
+        try:
+            info = os.stat (path)
+            modified = getattr (info, "st_mtime_ns", info.st_mtime)
+            size = info.st_size
+        except OSError:
+            modified = size = None
+
+        entry = self.files.get (path)
+        if (modified is None or entry is None or entry[0] != modified or
+            entry[1] != size):
+            schemaId = None
+            error = None
+            try:
+                schema = self.read (path)
+                if isinstance (schema, dict) and isinstance (
+                  schema.get ("id"), type (u"")):
+                    schemaId = _normalize (schema["id"])
+            except ValueError as e:
+                # indexed as not valid, unless it may have changed unseen
+                if modified is None:
+                    raise
+                error = str (e)
+            entry = [modified, size, schemaId, error]
+            self.files[path] = entry
+            self.changed = True
+            self.generation += 1
+
+        if entry[3] is not None:
+            raise ValueError (entry[3])
+        if entry[2] is not None:
+            self.ids[entry[2]] = path
+        return entry[2]
+
+    def lookup (self, uri):
+        """ Get the file for a schema id, None if not indexed. """
+        return self.ids.get (_normalize (uri))
+
+    def load (self, uri):
+        """
+        Read the schema for an id.
+        Returns:
+            Schema, None if not indexed.
+        Raises:
+            SafeFileError if not readable, ValueError if not JSON.
+        """
+        path = self.lookup (uri)
+        if path is None:
+            return None
+        return self.read (path)
+
+    def read (self, path):
+        """ Read and parse a schema file. """
+        return getParser (self.parser).loads (readFile (path))
+
+def _normalize (uri):
+    """ Schema id without fragment. """
+    return uri.split ("#", 1)[0]
@@ -0,0 +1,63 @@
+"""
+JSON Schema reference resolver.
+ - resolve local file references
+ - resolve database references (jsdb)
+ - load registry schemas on first reference
+
+Kept apart from jsonvalidate.validate, so jsonschema is only imported
+when a validator is created.
+"""
+from jsonschema import RefResolver
+
+class JsdbResolver (RefResolver):
+    """
+    Extends jsonschema resolver with the following:
+    - addSchema to add statically defined schemas
+    - support for jsdb: URI for database schemas
+    - schemas from a SchemaRegistry, read on first reference
+    """
+    def __init__ (self, baseURI, referer, jsdb, registry=None):
+        """ Initialize jsdb and registry and call superclass init """
+        super (JsdbResolver, self).__init__ (baseURI, referer)
+
+        # Store JSDB content in memory
+        self.jsdb = jsdb
+        self.registry = registry
+
+    def add_schema (self, uri, schema):
+        """ Add a schema to the stored list of schemas """
+        self.store[uri] = schema
+
+    def resolve_jsdb (self, uri):
+        """ Fetch a schema from the JSDB database. """
+        result = None
+        # if database available
+        if self.jsdb is not None:
+            # find schema matching id in database and add schema
+            for schema in self.jsdb:
+                if schema["id"] == uri:
+                    result = schema
+                    break
+        return result
+
+    def resolve_remote (self, uri):
+        """
+        Overrides superclass resolve_remote, processing "jsdb:" URI,
+        then schemas in the registry, otherwise calls superclass to
+        fetch the schema.
+        """
+        if uri[0:5] == "jsdb:":
+            document = self.resolve_jsdb (uri)
+
+            # duplicate caching logic from superclass
+            if self.cache_remote:
+                self.store[uri] = document
+            return document
+
+        if self.registry is not None:
+            document = self.registry.load (uri)
+            if document is not None:
+                # cached, so each schema is read once per validator
+                self.store[uri] = document
+                return document
+        return RefResolver.resolve_remote (self, uri)
@@ -0,0 +1,217 @@
+"""
+Persistent validation result cache.
+
+Results are stored in a SQLite database keyed by a hash of the data
+file content and a hash of the schema bundle (schema, reference and
+JSDB files, and the schema registry index). An unchanged data file
+validated against unchanged schemas gets its previous verdict without
+being parsed: files are hashed in chunks, and the bundle hash is only
+recomputed when a schema file's modification time or size changes.
+
+Only verdicts that depend on the data content alone are cached, valid
+and validation failed, so read and schema errors are always reported.
+Schemas fetched from the network by $ref are not part of the bundle.
+"""
+import hashlib
+import os
+import sqlite3
+import time
+from jsonvalidate.validate import VALID, VALIDATION_ERROR, MSG_VALID_JSON
+
+# bytes read per chunk when hashing
+CHUNK_SIZE = 1024 * 1024
+# stored results written per transaction
+COMMIT_INTERVAL = 1000
+# seconds per day, entry use is recorded by day
+DAY = 86400
+
+class ResultCache:
+    """
+    Cache of validation results.
+    Args:
+        path (str): SQLite database file, created if it does not exist.
+    """
+    def __init__ (self, path):
+        self.path = path
+        self.connection = sqlite3.connect (path)
+        self.connection.execute ("PRAGMA journal_mode=WAL")
+        self.connection.execute ("PRAGMA synchronous=NORMAL")
+        self.connection.execute ("CREATE TABLE IF NOT EXISTS results ("
+          "data TEXT, bundle TEXT, code INTEGER, message TEXT, "
+          "used INTEGER, PRIMARY KEY (data, bundle))")
+        self.connection.execute ("CREATE TABLE IF NOT EXISTS counters ("
+          "name TEXT PRIMARY KEY, value INTEGER)")
+        self.connection.commit ()
+        self.hits = 0
+        self.misses = 0
+        self.pending = 0
+        # bundle file signatures to bundle hash
+        self.bundles = {}
+
+    def key (self, dataFile, schemaFile, refFiles, jsdbFile, registry=None):
+        """
+        Get the cache key for validating a data file.
+        Returns:
+            Tuple of (data hash, bundle hash), None if a file can not be
+            read.
+        """
+        files = [schemaFile] + list (refFiles or [])
+        if jsdbFile is not None:
+            files.append (jsdbFile)
+        try:
+            signature = tuple (_signature (file) for file in files)
+            if registry is not None:
+                signature += (tuple (registry.directories),
+                  registry.generation)
+            bundle = self.bundles.get (signature)
+            if bundle is None:
+                bundle = _bundleHash (files, registry)
+                self.bundles[signature] = bundle
+            return hashFile (dataFile), bundle
+        except (IOError, OSError):
+            return None
+
+    def get (self, key, dataFile):
+        """
+        Get a cached result, counting the hit or miss.
+        Args:
+            key (tuple): Key from key ().
+            dataFile (str): Data file name, for the message.
+        Returns:
+            Tuple of (code, message), None if not cached.
+        """
+        row = self.connection.execute ("SELECT code, message, used FROM "
+          "results WHERE data = ? AND bundle = ?", key).fetchone ()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        today = int (time.time () // DAY)
+        if row[2] != today:
+            self.connection.execute ("UPDATE results SET used = ? WHERE "
+              "data = ? AND bundle = ?", (today,) + tuple (key))
+            self._written ()
+        if row[0] == VALID:
+            return VALID, MSG_VALID_JSON.format (dataFile)
+        return row[0], row[1]
+
+    def put (self, key, code, message):
+        """
+        Store a result, ignored unless valid or validation failed.
+        """
+        if code not in (VALID, VALIDATION_ERROR):
+            return
+        self.connection.execute ("INSERT OR REPLACE INTO results VALUES "
+          "(?, ?, ?, ?, ?)", tuple (key) + (code,
+          None if code == VALID else str (message),
+          int (time.time () // DAY)))
+        self._written ()
+
+    def stats (self):
+        """
+        Get cache statistics.
+        Returns:
+            Dictionary with entries, hits, misses and hitRate for this
+            session, and totalHits, totalMisses and totalHitRate over
+            the life of the cache.
+        """
+        entries = self.connection.execute (
+          "SELECT COUNT(*) FROM results").fetchone ()[0]
+        counters = dict (self.connection.execute (
+          "SELECT name, value FROM counters").fetchall ())
+        totalHits = counters.get ("hits", 0) + self.hits
+        totalMisses = counters.get ("misses", 0) + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": _rate (self.hits, self.misses),
+            "totalHits": totalHits,
+            "totalMisses": totalMisses,
+            "totalHitRate": _rate (totalHits, totalMisses)
+        }
+
+    def purge (self):
+        """ Remove all results and statistics. """
+        self.connection.execute ("DELETE FROM results")
+        self.connection.execute ("DELETE FROM counters")
+        self.hits = self.misses = 0
+        self.connection.commit ()
+        self.connection.execute ("VACUUM")
+
+    def compact (self, days):
+        """
+        Remove results not used for a number of days, and reclaim space.
+        Returns:
+            Number of results removed.
+        """
+        oldest = int (time.time () // DAY) - days
+        removed = self.connection.execute ("DELETE FROM results WHERE "
+          "used < ?", (oldest,)).rowcount
+        self.connection.commit ()
+        self.connection.execute ("VACUUM")
+        return removed
+
+    def close (self):
+        """ Save statistics and results, and close the database. """
+        for name, value in (("hits", self.hits), ("misses", self.misses)):
+            self.connection.execute ("INSERT OR IGNORE INTO counters "
+              "VALUES (?, 0)", (name,))
+            self.connection.execute ("UPDATE counters SET value = value + ? "
+              "WHERE name = ?", (value, name))
+        self.hits = self.misses = 0
+        self.connection.commit ()
+        self.connection.close ()
+
+    def _written (self):
+        """ Commit every COMMIT_INTERVAL writes. """
+        self.pending += 1
+        if self.pending >= COMMIT_INTERVAL:
+            self.connection.commit ()
+            self.pending = 0
+
+def hashFile (file, digest=None):
+    """
+    Hash file content in chunks, without parsing it.
+    Args:
+        file (str): File to hash.
+        digest: hashlib object to update, None for a new SHA-256.
+    Returns:
+        Hex digest.
+    Raises:
+        IOError if the file can not be read.
+    """
+    if digest is None:
+        digest = hashlib.sha256 ()
+    with open (file, "rb") as f:
+        chunk = f.read (CHUNK_SIZE)
+        while chunk:
+            digest.update (chunk)
+            chunk = f.read (CHUNK_SIZE)
+    return digest.hexdigest ()
+
+def _bundleHash (files, registry):
+    """ Hash schema files content and registry index. """
+    digest = hashlib.sha256 ()
+    for index, file in enumerate (files):
+        # separate files, so content moving between them changes the hash
+        digest.update (("\0%d\0" % index).encode ("ascii"))
+        hashFile (file, digest)
+    if registry is not None:
+        for file in sorted (registry.files):
+            digest.update (repr ((file, registry.files[file])).encode (
+              "utf8"))
+    return digest.hexdigest ()
+
+def _signature (file):
+    """ Path, modification time and size of a file. """
+    info = os.stat (file)
+    return (os.path.abspath (file), getattr (info, "st_mtime_ns",
+      info.st_mtime), info.st_size)
+
+def _rate (hits, misses):
+    """ Hit rate, 0 if no lookups. """
+    if hits + misses == 0:
+        return 0.0
+    return float (hits) / (hits + misses)
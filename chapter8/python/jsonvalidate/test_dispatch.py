@@ -0,0 +1,95 @@
+"""
+Equivalence test of DispatchValidator and Draft4Validator.
+
+Validates each valid and not valid fixture in chapter3 and chapter4
+against its schema with both validators, asserting both give the same
+is_valid result and the same errors, including the errors of each
+oneOf and anyOf alternative. A fixture is matched to its schema by name:
+nameValid2.json to name2_schema.json if present, else name_schema.json,
+and as listed in dispatchbench.FIXTURES. Schemas with an id in the same
+directory are loaded as reference files.
+
+Usage: python -m unittest jsonvalidate.test_dispatch
+"""
+import glob
+import json
+import os
+import re
+import unittest
+from jsonschema import Draft4Validator
+from jsonvalidate.validate import createValidator, VALID
+from jsonvalidate.dispatchbench import ROOT, FIXTURES, describe
+
+# fixture file name parts: schema name, kind, number
+FIXTURE_NAME = re.compile (r"^(.+?)(Valid|Invalid)(\d*)\.json$")
+
+def fixtures ():
+    """
+    Find fixture files and their schemas.
+    Returns:
+        Sorted list of (schema file, fixture file).
+    """
+    pairs = set ()
+    for chapter in ("chapter3", "chapter4"):
+        directory = os.path.join (ROOT, chapter)
+        for file in glob.glob (os.path.join (directory, "*.json")):
+            match = FIXTURE_NAME.match (os.path.basename (file))
+            if match is None:
+                continue
+            name, kind, number = match.groups ()
+            for schemaName in (name + number, name):
+                schemaFile = os.path.join (directory,
+                  schemaName + "_schema.json")
+                if os.path.isfile (schemaFile):
+                    pairs.add ((schemaFile, file))
+                    break
+    for schemaFile, patterns in FIXTURES:
+        for pattern in patterns:
+            for file in glob.glob (os.path.join (ROOT, pattern)):
+                if FIXTURE_NAME.match (os.path.basename (file)):
+                    pairs.add ((os.path.join (ROOT, schemaFile), file))
+    return sorted (pairs)
+
+def references (schemaFile):
+    """ Schema files with an id in the directory of a schema. """
+    files = []
+    pattern = os.path.join (os.path.dirname (schemaFile), "*_schema.json")
+    for file in sorted (glob.glob (pattern)):
+        with open (file) as f:
+            if file != schemaFile and "id" in json.load (f):
+                files.append (file)
+    return files
+
+class DispatchEquivalenceTest (unittest.TestCase):
+    """ DispatchValidator results match Draft4Validator for fixtures. """
+
+    def test_fixtures (self):
+        pairs = fixtures ()
+        self.assertTrue (len (pairs) > 0)
+        for schemaFile, file in pairs:
+            with self.subTest (schema=os.path.basename (schemaFile),
+              fixture=os.path.basename (file)):
+                code, dispatch, message = createValidator (schemaFile,
+                  references (schemaFile), None)
+                self.assertEqual (code, VALID, message)
+                standard = Draft4Validator (dispatch.schema,
+                  resolver=dispatch.resolver)
+                with open (file) as f:
+                    document = json.load (f)
+                self.assertEqual (dispatch.is_valid (document),
+                  standard.is_valid (document))
+                self.assertEqual (describe (dispatch.iter_errors (document)),
+                  describe (standard.iter_errors (document)))
+
+    def test_dispatch_fixtures_covered (self):
+        # every schema dispatching oneOf or anyOf has fixtures both ways
+        covered = {}
+        for schemaFile, file in fixtures ():
+            kind = FIXTURE_NAME.match (os.path.basename (file)).group (2)
+            covered.setdefault (schemaFile, set ()).add (kind)
+        for schemaFile, patterns in FIXTURES:
+            self.assertEqual (covered.get (os.path.join (ROOT, schemaFile)),
+              set (["Valid", "Invalid"]), schemaFile)
+
+if __name__ == "__main__":
+    unittest.main ()
@@ -0,0 +1,364 @@
+"""
+Change tracking for partial revalidation.
+
+ChangeTracker wraps a loaded document in dict and list subclasses that
+record the paths changed in place, so after an update only the changed
+parts are validated, against their subschemas from the validator,
+rather than the whole document.
+
+For each change, the subschema is found by following properties,
+patternProperties, additionalProperties and items from the root schema,
+and local $ref. Where a schema has keywords that depend on the values
+of its children (such as enum, uniqueItems, allOf, anyOf, oneOf or a
+reference to another document), the whole value at that schema is
+validated instead, so the result is the same as validating the whole
+document. Adding or removing a property or list element validates the
+containing object or list. Records from loadRecords are tracked as
+dicts are, in record classes with slots for the tracking.
+"""
+import re
+from jsonvalidate.records import Record, recordClass
+
+# keywords of a container schema not depending on child values, so a
+# changed child can be validated alone against its own subschema
+CHILD_SAFE = frozenset (["type", "properties", "patternProperties",
+  "additionalProperties", "required", "minProperties", "maxProperties",
+  "items", "additionalItems", "minItems", "maxItems", "title",
+  "description", "default", "$schema", "definitions", "format"])
+
+# subschema lookup results other than a schema
+_AMBIGUOUS = object ()
+
+# tracked record classes, by record class
+_trackedClasses = {}
+
+class ChangeTracker:
+    """
+    Document wrapper recording changes for revalidation.
+    Args:
+        document Document loaded from JSON.
+        validator Validator for the document, from createValidator.
+    Attributes:
+        document Tracked document, change in place as the original.
+    """
+    def __init__ (self, document, validator):
+        self.validator = validator
+        self.changes = set ()
+        self.document = _wrap (document, None, None, self.changes)
+        self.validators = {}
+
+    def changedPaths (self):
+        """ Paths changed, without paths within other changed paths. """
+        paths = sorted (self.changes, key=len)
+        result = []
+        kept = set ()
+        for path in paths:
+            if not _within (path, kept):
+                result.append (path)
+                kept.add (path)
+        return result
+
+    def revalidateChanges (self, clear=True):
+        """
+        Validate the changed parts of the document.
+        Args:
+            clear Flag, forget changes once validated.
+        Returns:
+            List of validation errors, with paths from the document root.
+        """
+        targets = {}
+        for path in self.changedPaths ():
+            located = self.locate (path)
+            if located is not None:
+                targets[located[0]] = located[1]
+
+        # validate each value once, outermost first
+        errors = []
+        done = set ()
+        for prefix in sorted (targets, key=len):
+            if _within (prefix, done):
+                continue
+            done.add (prefix)
+            value = self.document
+            for token in prefix:
+                value = value[token]
+            for error in self.subValidator (targets[prefix]).iter_errors (
+              value):
+                error.path.extendleft (reversed (prefix))
+                errors.append (error)
+
+        if clear:
+            self.changes.clear ()
+        return errors
+
+    def locate (self, path):
+        """
+        Find the value to validate for a changed path, and its schema.
+        Returns:
+            Tuple of (path of value, schema), None if not constrained.
+        """
+        schema = self.validator.schema
+        value = self.document
+        prefix = ()
+        for token in path:
+            schema = self.resolve (schema)
+            if not isinstance (schema, dict):
+                return prefix, schema
+            # schemas depending on children, or changing the resolution
+            # scope, are validated whole
+            if len (prefix) > 0 and "id" in schema:
+                return prefix, schema
+            if "$ref" in schema or not CHILD_SAFE.issuperset (schema):
+                return prefix, schema
+
+            child = _childSchema (schema, value, token)
+            if child is None:
+                return None
+            if child is _AMBIGUOUS:
+                return prefix, schema
+            try:
+                value = value[token]
+            except (KeyError, IndexError, TypeError):
+                # removed since changed, the container was recorded
+                return None
+            prefix += (token,)
+            schema = child
+        return prefix, schema
+
+    def resolve (self, schema):
+        """ Follow local $ref, leaving references to other documents. """
+        seen = 0
+        while isinstance (schema, dict) and "$ref" in schema:
+            ref = schema["$ref"]
+            if not ref.startswith ("#") or seen > 32:
+                return schema
+            schema = self.validator.resolver.resolve_fragment (
+              self.validator.schema, ref[1:])
+            seen += 1
+        return schema
+
+    def subValidator (self, schema):
+        """ Validator for a subschema, sharing the root resolver. """
+        validator = self.validators.get (id (schema))
+        if validator is None:
+            validator = self.validator.__class__ (schema,
+              resolver=self.validator.resolver)
+            self.validators[id (schema)] = validator
+        return validator
+
+def _childSchema (schema, value, token):
+    """
+    Get the subschema for a child of a value.
+    Returns:
+        Subschema, None if the child is not constrained, or _AMBIGUOUS
+        if more than one subschema applies.
+    """
+    if isinstance (value, (dict, Record)):
+        applicable = []
+        properties = schema.get ("properties", {})
+        if token in properties:
+            applicable.append (properties[token])
+        for pattern, subschema in schema.get ("patternProperties",
+          {}).items ():
+            if re.search (pattern, token):
+                applicable.append (subschema)
+        if len (applicable) == 0:
+            additional = schema.get ("additionalProperties", {})
+            if isinstance (additional, dict):
+                applicable.append (additional)
+        if len (applicable) == 0:
+            return None
+        return applicable[0] if len (applicable) == 1 else _AMBIGUOUS
+
+    if isinstance (value, list):
+        items = schema.get ("items", {})
+        if isinstance (items, dict):
+            return items
+        if token < len (items):
+            return items[token]
+        additional = schema.get ("additionalItems", {})
+        return additional if isinstance (additional, dict) else None
+    return None
+
+def _within (path, paths):
+    """ Check if a path is, or is within, one of a set of paths. """
+    for length in range (len (path) + 1):
+        if path[:length] in paths:
+            return True
+    return False
+
+def _wrap (value, parent, key, changes):
+    """ Wrap dicts, records and lists in tracked containers. """
+    if isinstance (value, dict):
+        return TrackedDict (value, parent, key, changes)
+    if isinstance (value, list):
+        return TrackedList (value, parent, key, changes)
+    if isinstance (value, Record):
+        return _trackedRecord (value, parent, key, changes)
+    return value
+
+def _trackedRecord (value, parent, key, changes):
+    """ Copy a record to a tracked record of its properties. """
+    base = recordClass (value.fields)
+    cls = _trackedClasses.get (base)
+    if cls is None:
+        cls = type ("TrackedRecord", (TrackedRecord, base),
+          { "__slots__": ("_parent", "_key", "_changes") })
+        _trackedClasses[base] = cls
+    record = cls.__new__ (cls)
+    record._parent = parent
+    record._key = key
+    record._changes = changes
+    for name in value:
+        Record.__setitem__ (record, name, _wrap (value[name], record, name,
+          changes))
+    return record
+
+class _Tracked:
+    """ Path and change recording shared by tracked containers. """
+    __slots__ = ()
+
+    def path (self):
+        """ Path from the document root, walking up the parents. """
+        path = []
+        node = self
+        while node._parent is not None:
+            path.append (node._key)
+            node = node._parent
+        return tuple (reversed (path))
+
+    def _changed (self, key=None):
+        """ Record a change to a child, or to this container if None. """
+        path = self.path ()
+        self._changes.add (path if key is None else path + (key,))
+
+class TrackedDict (_Tracked, dict):
+    """ dict recording changes to its keys. """
+    def __init__ (self, value, parent, key, changes):
+        dict.__init__ (self)
+        self._parent = parent
+        self._key = key
+        self._changes = changes
+        for name, child in value.items ():
+            dict.__setitem__ (self, name, _wrap (child, self, name, changes))
+
+    def __setitem__ (self, name, child):
+        existing = name in self
+        dict.__setitem__ (self, name, _wrap (child, self, name,
+          self._changes))
+        # a new property can change the object's validity
+        self._changed (name if existing else None)
+
+    def __delitem__ (self, name):
+        dict.__delitem__ (self, name)
+        self._changed ()
+
+    def pop (self, *args):
+        self._changed ()
+        return dict.pop (self, *args)
+
+    def popitem (self):
+        self._changed ()
+        return dict.popitem (self)
+
+    def clear (self):
+        self._changed ()
+        dict.clear (self)
+
+    def setdefault (self, name, default=None):
+        if name not in self:
+            self[name] = default
+        return dict.__getitem__ (self, name)
+
+    def update (self, *args, **kwargs):
+        for name, child in dict (*args, **kwargs).items ():
+            self[name] = child
+
+class TrackedRecord (_Tracked):
+    """ Record recording changes to its properties, mixed into a copy. """
+    __slots__ = ()
+
+    def __setitem__ (self, name, child):
+        existing = name in self
+        Record.__setitem__ (self, name, _wrap (child, self, name,
+          self._changes))
+        self._changed (name if existing else None)
+
+    def __delitem__ (self, name):
+        Record.__delitem__ (self, name)
+        self._changed ()
+
+class TrackedList (_Tracked, list):
+    """ list recording changes to its elements. """
+    def __init__ (self, value, parent, key, changes):
+        list.__init__ (self, [_wrap (child, self, index, changes)
+          for index, child in enumerate (value)])
+        self._parent = parent
+        self._key = key
+        self._changes = changes
+
+    def __setitem__ (self, index, child):
+        if isinstance (index, slice):
+            list.__setitem__ (self, index, child)
+            self._reindex ()
+            return
+        if index < 0:
+            index += len (self)
+        list.__setitem__ (self, index, _wrap (child, self, index,
+          self._changes))
+        self._changed (index)
+
+    def __delitem__ (self, index):
+        list.__delitem__ (self, index)
+        self._reindex ()
+
+    def __iadd__ (self, children):
+        self.extend (children)
+        return self
+
+    def __imul__ (self, count):
+        list.__imul__ (self, count)
+        self._reindex ()
+        return self
+
+    def append (self, child):
+        list.append (self, _wrap (child, self, len (self), self._changes))
+        self._changed ()
+
+    def extend (self, children):
+        for child in children:
+            list.append (self, _wrap (child, self, len (self), self._changes))
+        self._changed ()
+
+    def insert (self, index, child):
+        list.insert (self, index, child)
+        self._reindex ()
+
+    def pop (self, *args):
+        child = list.pop (self, *args)
+        self._reindex ()
+        return child
+
+    def remove (self, child):
+        list.remove (self, child)
+        self._reindex ()
+
+    def reverse (self):
+        list.reverse (self)
+        self._reindex ()
+
+    def sort (self, *args, **kwargs):
+        list.sort (self, *args, **kwargs)
+        self._reindex ()
+
+    def _reindex (self):
+        """ Wrap elements and set their indexes after elements moved. """
+        for index in range (len (self)):
+            child = list.__getitem__ (self, index)
+            if isinstance (child, _Tracked):
+                child._parent = self
+                child._key = index
+            else:
+                list.__setitem__ (self, index, _wrap (child, self, index,
+                  self._changes))
+        self._changed ()
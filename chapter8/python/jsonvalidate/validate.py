@@ -3,10 +3,14 @@ JSON Schema validation preparation.
  - Load data and schema content
  - resolve local file references
  - resolve database references (jsdb)
+ - resolve references from a schema registry, reading only the
+   schemas referenced
+
+jsonschema is imported when the first validator is created, so reading
+and error paths do not pay for loading it.
 """
 from safefile import readFile, SafeFileError
-from jsonschema import Draft4Validator, RefResolver
-import json
+from jsonparser import getParser
 
 # message numbers and formats
 VALID = 0
@@ -20,52 +24,15 @@ MSG_INVALID_JSON = "Invalid JSON in file: {0}. Error: {1}"
 MSG_MISSING_ID = "Missing Id in Reference Schema {0}"
 MSG_FETCH_ERROR = "Error fetching {0}: {1}"
 MSG_VALID_JSON = "JSON content in file {0} is valid"
+MSG_NOT_PER_ITEM = "Schema cannot be checked item by item: {0}"
 
-class JsdbResolver (RefResolver):
-    """
-    Extends jsonschema resolver with the following:
-    - addSchema to add statically defined schemas
-    - support for jsdb: URI for database schemas
-    """
-    def __init__ (self, baseURI, referer, jsdb):
-        """ Initialize jsdb and call superclass init """
-        super (JsdbResolver, self).__init__ (baseURI, referer)
-
-        # Store JSDB content in memory
-        self.jsdb = jsdb
-
-    def add_schema (self, uri, schema):
-        """ Add a schema to the stored list of schemas """
-        self.store[uri] = schema
-
-    def resolve_jsdb (self, uri):
-        """ Fetch a schema from the JSDB database. """
-        result = None
-        # if database available
-        if self.jsdb is not None:
-            # find schema matching id in database and add schema
-            for schema in self.jsdb:
-                if schema["id"] == uri:
-                    result = schema
-                    break
-        return result
-
-    def resolve_remote (self, uri):
-        """
-        Overrides superclass resolve_remote, processing "jsdb:" URI,
-        otherwise calls superclass to fetch the schema.
-        """
-        if uri[0:5] == "jsdb:":
-            document = self.resolve_jsdb (uri)
-
-            # duplicate caching logic from superclass
-            if self.cache_remote:
-                self.store[uri] = document
-            return document
-        else:
-            return RefResolver.resolve_remote (self, uri)
-
-def validate (dataFile, schemaFile, refFiles, jsdbFile):
+# array schema keywords that constrain each item alone, or nothing, so an
+# array can be validated in parts item by item
+ITEMS_KEYWORDS = frozenset (["$schema", "id", "title", "description",
+  "default", "definitions", "type", "items"])
+
+def validate (dataFile, schemaFile, refFiles, jsdbFile, parser=None,
+  registry=None, cache=None, compact=False):
     """
     Perform validation of JSON content with the JSON Schema.
 
@@ -74,57 +41,172 @@ def validate (dataFile, schemaFile, refFiles, jsdbFile):
       schemaFilename (str): File containing JSON Schema.
       refFiles (list of str): List of files for schemas referenced.
       jsdbFile (str): File containing JSDB schemas referenced.
+      parser (str): JSON parser name, None for fastest available.
+      registry (SchemaRegistry): Registry of referenced schemas, or None.
+      cache (ResultCache): Cache of results, or None.
+      compact (bool): Load objects of simple values as records, see
+        jsonvalidate.records, instead of with the parser.
     Returns:
       code (int): VALID or error constant.
-      data (str): data read for VALID result.
+      data (str): data read for VALID result, None if cached.
       message (str): message text.
     """
+    # return cached result if data and schemas are unchanged
+    key = None
+    if cache is not None:
+        key = cache.key (dataFile, schemaFile, refFiles, jsdbFile, registry)
+        if key is not None:
+            result = cache.get (key, dataFile)
+            if result is not None:
+                return result[0], None, result[1]
+
     # read data file, returning error if not valid
-    code, data, message = _readJsonFile (dataFile)
+    code, data, message = _readJsonFile (dataFile, parser, compact)
+    if code != VALID:
+        return code, None, MSG_READ_ERROR.format (dataFile, message)
+
+    # load schemas and create validator, returning error if not valid
+    code, validator, message = createValidator (schemaFile, refFiles,
+      jsdbFile, parser, registry)
     if code != VALID:
-        return code, None, MSG_READ_ERROR.format (jsdbFile, message)
+        return code, None, message
+
+    code, data, message = validateData (dataFile, data, validator)
+    if key is not None:
+        cache.put (key, code, message)
+    return code, data, message
 
+def createValidator (schemaFile, refFiles, jsdbFile, parser=None,
+  registry=None):
+    """
+    Load the JSON Schema and referenced schemas, and create a validator.
+    The validator can be reused to validate many data files. With a
+    registry, reference files are added to the registry and read when
+    first referenced, along with any other schema in the registry.
+
+    Args:
+      schemaFile (str): File containing JSON Schema.
+      refFiles (list of str): List of files for schemas referenced.
+      jsdbFile (str): File containing JSDB schemas referenced.
+      parser (str): JSON parser name, None for fastest available.
+      registry (SchemaRegistry): Registry of referenced schemas, or None.
+    Returns:
+      code (int): VALID or error constant.
+      validator (DispatchValidator): Draft 4 validator for VALID result.
+      message (str): message text.
+    """
     # read schema file, returning error if not valid
-    code, schema, message = _readJsonFile (schemaFile)
+    code, schema, message = _readJsonFile (schemaFile, parser)
     if code != VALID:
-        return code, None, MSG_READ_ERROR.format (jsdbFile, message)
+        return code, None, MSG_READ_ERROR.format (schemaFile, message)
 
     # load JSDB file, or set to empty if not specified
     if jsdbFile is None:
         jsdb = {}
     else:
-        code, jsdb, message = _readJsonFile (jsdbFile)
+        code, jsdb, message = _readJsonFile (jsdbFile, parser)
         if code != VALID:
             return code, None, MSG_READ_ERROR.format (jsdbFile, message)
 
-    # create custom resolver
-    resolver = JsdbResolver ("", schema, jsdb)
+    # create custom resolver, loading jsonschema on first use
+    from jsonvalidate.dispatch import DispatchValidator
+    from jsonvalidate.resolver import JsdbResolver
+    resolver = JsdbResolver ("", schema, jsdb, registry)
 
     # read reference schema files, returning error if any not valid
     if refFiles is not None:
         for refFile in refFiles:
-            code, ref, message = _readJsonFile (refFile)
+            if registry is not None:
+                # indexed by id, parsed only if changed since indexed
+                try:
+                    refId = registry.addFile (refFile)
+                except SafeFileError as e:
+                    return e.code, None, MSG_READ_ERROR.format (refFile,
+                      e.message)
+                except ValueError as e:
+                    return INVALID_JSON, None, MSG_INVALID_JSON.format (
+                      refFile, e)
+                if refId is None:
+                    return MISSING_ID, None, MSG_MISSING_ID.format (refFile)
+                continue
+
+            code, ref, message = _readJsonFile (refFile, parser)
             if code != VALID:
-                return code, None, MSG_READ_ERROR.format (jsdbFile, message)
+                return code, None, MSG_READ_ERROR.format (refFile, message)
             if "id" not in ref:
                 return MISSING_ID, None, MSG_MISSING_ID.format (refFile)
             resolver.add_schema (ref["id"], ref)
+        if registry is not None:
+            registry.saveIndex ()
 
+    # create validator with custom resolver, dispatching oneOf and anyOf
+    # by discriminator
+    return VALID, DispatchValidator (schema, resolver=resolver), None
+
+def validateData (dataFile, data, validator):
+    """
+    Validate JSON content with a validator.
+
+    Args:
+      dataFile (str): File the JSON content was read from.
+      data: JSON content to validate.
+      validator (Draft4Validator): validator from createValidator.
+    Returns:
+      code (int): VALID or error constant.
+      data (str): data read for VALID result.
+      message (str): message text.
+    """
     # run validation, returning data if successful
     try:
-        # create validator with custom resolver, call it
-        validator = Draft4Validator (schema, resolver=resolver)
         validator.validate (data)
         return VALID, data, MSG_VALID_JSON.format (dataFile)
     except Exception as e:
+        # a referenced registry schema not readable, raised by jsonschema
+        # from the resolver's error, is a file error, not a validation one
+        cause = getattr (e, "__cause__", None)
+        if isinstance (cause, SafeFileError):
+            return cause.code, None, cause.message
+
         # if validation failed, return error information
         return VALIDATION_ERROR, None, e
 
-def _readJsonFile (file):
+def itemsValidator (validator):
+    """
+    Create a validator for the items of an array schema, sharing the
+    resolver so references within the schema still resolve. Used to
+    validate parts of an array, such as shards, item by item. Schemas
+    with keywords on the whole array, such as minItems, maxItems,
+    uniqueItems or additionalItems, or with items as a list of schemas
+    by position, are not valid for this, as parts would pass that the
+    whole array does not.
+
+    Args:
+      validator (Draft4Validator): validator from createValidator.
+    Returns:
+      Validator for the "items" subschema.
+    Raises:
+      ValueError if the schema cannot be checked item by item.
+    """
+    schema = validator.schema
+    other = sorted (name for name in schema if name not in ITEMS_KEYWORDS)
+    if not isinstance (schema.get ("items", {}), dict):
+        other.append ("items")
+    types = schema.get ("type", "array")
+    if types != "array" and not (isinstance (types, list) and
+      "array" in types):
+        other.append ("type")
+    if len (other) > 0:
+        raise ValueError (MSG_NOT_PER_ITEM.format (", ".join (other)))
+    return validator.__class__ (schema.get ("items", {}),
+      resolver=validator.resolver)
+
+def _readJsonFile (file, parser=None, compact=False):
     """
     Read file and verify it contains JSON content
     Args:
         file (str): File to read
+        parser (str): JSON parser name, None for fastest available
+        compact (bool): Load objects of simple values as records
     Returns:
       code (int): VALID or error constant.
       data (str): data read for VALID result.
@@ -132,10 +214,23 @@ def _readJsonFile (file):
     """
     try:
         data = readFile (file)
-        try:
-            jsonData = json.loads (data)
-            return VALID, jsonData, None
-        except ValueError as e:
-            return INVALID_JSON, None, MSG_INVALID_JSON.format (file, e)
     except SafeFileError as e:
         return e.code, None, e.message
+
+    # select parser once data is read, so read errors do not load it
+    if compact:
+        from jsonvalidate.records import loadRecords
+    else:
+        loadRecords = getParser (parser).loads
+    try:
+        jsonData = loadRecords (data)
+        return VALID, jsonData, None
+    except ValueError as e:
+        return INVALID_JSON, None, MSG_INVALID_JSON.format (file, e)
+
+def __getattr__ (name):
+    """ Load JsdbResolver, and jsonschema, on first reference. """
+    if name == "JsdbResolver":
+        from jsonvalidate.resolver import JsdbResolver
+        return JsdbResolver
+    raise AttributeError ("module " + __name__ + " has no attribute " + name)
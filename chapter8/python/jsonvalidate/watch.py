@@ -0,0 +1,477 @@
+"""
+Watch mode, revalidating JSON files as they or their schemas change.
+
+The validator is kept in memory, along with a dependency graph from the
+data files to the schema, the reference and registry schema files it
+reaches by $ref, and the JSDB entries it reaches by jsdb: URI. When a
+file changes only the affected documents are revalidated: a changed
+data file is revalidated alone, a changed schema revalidates every data
+file, and a changed file or JSDB entry the schema does not reach is
+ignored. Changes are collected until files are quiet for the debounce
+interval, and each cycle reports its latency from the first change.
+References the schemas do not resolve are checked again when files
+are created, so documents are revalidated once the schema they need
+appears.
+
+Files are monitored with Linux inotify, or by polling modification
+times where inotify is not available. Registry directories are watched
+with all their subdirectories, including those created later.
+"""
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import time
+from jsonvalidate.validate import (createValidator, validateData,
+  _readJsonFile, VALID, MSG_READ_ERROR)
+
+# seconds without changes before a cycle starts
+DEBOUNCE = 0.2
+# seconds between scans when polling
+POLL_INTERVAL = 1.0
+
+# inotify events for files written, created, moved or deleted
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+  IN_DELETE)
+# inotify event flags, watch removed and event for a directory
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+# inotify_event header: wd, mask, cookie, name length
+EVENT = struct.Struct ("iIII")
+
+class Watcher:
+    """
+    Validate data files, then revalidate them as files change.
+    Args:
+        targets (list of str): Data files, or directories whose .json
+          files are data files.
+        schemaFile (str): File containing JSON Schema.
+        refFiles (list of str): List of files for schemas referenced.
+        jsdbFile (str): File containing JSDB schemas referenced.
+        parser (str): JSON parser name, None for fastest available.
+        registry (SchemaRegistry): Registry of referenced schemas, or None.
+        debounce (float): Seconds without changes before a cycle starts.
+        poll (bool): Poll for changes, even if inotify is available.
+    """
+    def __init__ (self, targets, schemaFile, refFiles, jsdbFile,
+      parser=None, registry=None, debounce=DEBOUNCE, poll=False):
+        self.schemaFile = os.path.abspath (schemaFile)
+        self.refFiles = [os.path.abspath (file) for file in refFiles or []]
+        self.jsdbFile = None if jsdbFile is None else os.path.abspath (
+          jsdbFile)
+        self.parser = parser
+        self.registry = registry
+        self.debounce = debounce
+        self.poll = poll
+
+        self.dataDirs = set ()
+        self.dataFiles = set ()
+        for target in targets:
+            target = os.path.abspath (target)
+            if os.path.isdir (target):
+                self.dataDirs.add (target)
+                self.dataFiles.update (_jsonFiles (target))
+            else:
+                self.dataFiles.add (target)
+
+        self.validator = None
+        self.message = None
+        # schema files reached, JSDB entries reached by id, and schema
+        # ids referenced but not found
+        self.schemaDeps = set ()
+        self.jsdbEntries = {}
+        self.unresolved = set ()
+        # last result of each data file
+        self.results = {}
+
+    def run (self):
+        """ Validate all, then revalidate on changes until interrupted. """
+        start = time.time ()
+        self.loadSchemas ()
+        self.validateFiles (self.dataFiles)
+        self.report (len (self.dataFiles), start, start)
+
+        monitor = self.createMonitor ()
+        try:
+            while True:
+                changed = monitor.wait (None)
+                first = time.time ()
+                # debounce, collecting changes until quiet
+                while True:
+                    more = monitor.wait (self.debounce)
+                    if not more:
+                        break
+                    changed |= more
+                if self.registry is not None:
+                    self.registry.refresh ()
+                count = self.cycle (changed)
+                if count is not None:
+                    self.report (count, first, self.cycleTime)
+                # directories of schemas reached may have changed
+                monitor.update (self.directories (), self.trees ())
+        finally:
+            monitor.close ()
+
+    def createMonitor (self):
+        """ Create an inotify monitor, or a poller if not available. """
+        if not self.poll:
+            try:
+                return _Inotify (self.directories (), self.trees ())
+            except (OSError, AttributeError):
+                pass
+        return _Poller (self.directories (), self.trees (), POLL_INTERVAL)
+
+    def directories (self):
+        """ Directories holding watched files, apart from trees. """
+        directories = set (self.dataDirs)
+        files = self.dataFiles | self.schemaDeps | set (self.refFiles)
+        files.add (self.schemaFile)
+        if self.jsdbFile is not None:
+            files.add (self.jsdbFile)
+        for file in files:
+            directories.add (os.path.dirname (file))
+        return directories
+
+    def trees (self):
+        """ Directories watched with all their subdirectories. """
+        if self.registry is None:
+            return set ()
+        return set (self.registry.directories)
+
+    def cycle (self, changed):
+        """
+        Revalidate the data files affected by changed files.
+        Returns:
+            Number of files revalidated, None if no file was affected.
+        """
+        self.cycleTime = time.time ()
+        affected = set ()
+        for file in changed:
+            if file in self.dataFiles or (os.path.dirname (file) in
+              self.dataDirs and file.endswith (".json")):
+                if os.path.exists (file):
+                    self.dataFiles.add (file)
+                    affected.add (file)
+                else:
+                    self.dataFiles.discard (file)
+                    self.results.pop (file, None)
+
+        if self.schemasChanged (changed):
+            self.loadSchemas ()
+            affected = set (self.dataFiles)
+
+        if len (affected) == 0:
+            return None
+        self.validateFiles (affected)
+        return len (affected)
+
+    def schemasChanged (self, changed):
+        """ Check if changed files include a schema or JSDB entry reached. """
+        for file in changed:
+            if file == self.jsdbFile:
+                # only the JSDB entries reached matter
+                if self.readEntries (self.jsdbEntries) != self.jsdbEntries:
+                    return True
+            elif file in self.schemaDeps:
+                return True
+            elif file in self.refFiles:
+                # a reference file not reached matters if its id now is
+                if self.reachable ()[0] != self.schemaDeps:
+                    return True
+        # a file created may have the id of a reference not resolved
+        if len (self.unresolved) > 0 and len (changed) > 0:
+            if self.reachable ()[0] != self.schemaDeps:
+                return True
+        # a schema could not be loaded, retry on any change
+        return self.validator is None and len (changed) > 0
+
+    def loadSchemas (self):
+        """ Create the validator and the schema dependency graph. """
+        code, self.validator, self.message = createValidator (
+          self.schemaFile, self.refFiles, self.jsdbFile, self.parser,
+          self.registry)
+        self.schemaDeps, entryIds, self.unresolved = self.reachable ()
+        self.jsdbEntries = self.readEntries (entryIds)
+
+    def reachable (self):
+        """
+        Follow $ref from the schema through reference, registry and JSDB
+        schemas.
+        Returns:
+            Tuple of (set of schema files, set of JSDB ids) reached, and
+            set of schema ids referenced but not found.
+        """
+        # schema id to file, for reference files and the registry
+        files = {}
+        if self.registry is not None:
+            for file, entry in self.registry.files.items ():
+                if entry[2] is not None:
+                    files[entry[2]] = file
+        for file in self.refFiles:
+            code, schema, message = _readJsonFile (file, self.parser)
+            if code == VALID and isinstance (schema, dict) and "id" in schema:
+                files[schema["id"].split ("#", 1)[0]] = file
+        jsdb = self.readJsdb ()
+
+        reached = set ([self.schemaFile])
+        entries = set ()
+        unresolved = set ()
+        pending = [self.schemaFile]
+        while len (pending) > 0:
+            item = pending.pop ()
+            if item.startswith ("jsdb:"):
+                schema = jsdb.get (item)
+            else:
+                code, schema, message = _readJsonFile (item, self.parser)
+            for uri in _references (schema):
+                uri = uri.split ("#", 1)[0]
+                if uri == "":
+                    continue
+                if uri.startswith ("jsdb:"):
+                    if uri not in entries:
+                        entries.add (uri)
+                        pending.append (uri)
+                elif uri not in files:
+                    unresolved.add (uri)
+                elif files[uri] not in reached:
+                    reached.add (files[uri])
+                    pending.append (files[uri])
+
+        if len (entries) > 0:
+            reached.add (self.jsdbFile)
+        return reached, entries, unresolved
+
+    def readJsdb (self):
+        """ Read JSDB schemas by id, empty if none or not readable. """
+        if self.jsdbFile is None:
+            return {}
+        code, jsdb, message = _readJsonFile (self.jsdbFile, self.parser)
+        if code != VALID or not isinstance (jsdb, list):
+            return {}
+        return dict ((schema.get ("id"), schema) for schema in jsdb
+          if isinstance (schema, dict))
+
+    def readEntries (self, ids):
+        """ Canonical text of the JSDB entries with ids. """
+        jsdb = self.readJsdb ()
+        return dict ((uri, json.dumps (jsdb.get (uri), sort_keys=True))
+          for uri in ids)
+
+    def validateFiles (self, files):
+        """ Validate data files, printing results that changed. """
+        for file in sorted (files):
+            if self.validator is None:
+                code, message = 1, self.message
+            else:
+                code, data, message = _readJsonFile (file, self.parser)
+                if code != VALID:
+                    message = MSG_READ_ERROR.format (file, message)
+                else:
+                    code, data, message = validateData (file, data,
+                      self.validator)
+            result = (code, str (message))
+            if self.results.get (file) != result:
+                self.results[file] = result
+                print ("%s: %s" % (os.path.relpath (file), "valid"
+                  if code == VALID else message))
+
+    def report (self, count, first, start):
+        """
+        Print a cycle summary, with latency from the first change and
+        time from the start of validation.
+        """
+        invalid = len ([r for r in self.results.values () if r[0] != VALID])
+        print ("Revalidated %d of %d files, %d not valid, latency %.1f ms "
+          "(validation %.1f ms)" % (count, len (self.dataFiles), invalid,
+          (time.time () - first) * 1000, (time.time () - start) * 1000))
+        sys.stdout.flush ()
+
+class _Inotify:
+    """
+    Monitor directories with Linux inotify, and trees of directories,
+    adding watches for subdirectories as they are created.
+    """
+    def __init__ (self, directories, trees):
+        self.libc = ctypes.CDLL (ctypes.util.find_library ("c"),
+          use_errno=True)
+        self.fd = self.libc.inotify_init1 (os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError (ctypes.get_errno (), "inotify_init1 failed")
+        self.watches = {}
+        self.trees = set ()
+        self.update (directories, trees)
+
+    def update (self, directories, trees):
+        """ Add watches for directories and trees not yet watched. """
+        self.trees |= set (trees)
+        watched = set (self.watches.values ())
+        for directory in set (directories) | _subdirectories (self.trees):
+            if directory not in watched:
+                self.watch (directory)
+
+    def watch (self, directory):
+        """ Add a watch for a directory. """
+        wd = self.libc.inotify_add_watch (self.fd,
+          directory.encode ("utf8"), IN_MASK)
+        if wd < 0:
+            raise OSError (ctypes.get_errno (), "inotify_add_watch "
+              "failed: " + directory)
+        self.watches[wd] = directory
+
+    def inTree (self, path):
+        """ Check if a path is within a watched tree. """
+        return any (path.startswith (tree + os.sep) for tree in self.trees)
+
+    def wait (self, timeout):
+        """
+        Wait for changes.
+        Args:
+            timeout (float): Seconds to wait, None to wait for a change.
+        Returns:
+            Set of changed paths, empty if none before the timeout.
+        """
+        changed = set ()
+        if len (select.select ([self.fd], [], [], timeout)[0]) == 0:
+            return changed
+        while True:
+            try:
+                data = os.read (self.fd, 65536)
+            except OSError:
+                break
+            offset = 0
+            while offset < len (data):
+                wd, mask, cookie, length = EVENT.unpack_from (data, offset)
+                offset += EVENT.size
+                name = data[offset:offset + length].rstrip (b"\0")
+                offset += length
+                if mask & IN_IGNORED:
+                    # directory deleted, watched again if created again
+                    self.watches.pop (wd, None)
+                    continue
+                if wd not in self.watches or not name:
+                    continue
+                path = os.path.join (self.watches[wd], name.decode ("utf8"))
+                changed.add (path)
+                if (mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and
+                    self.inTree (path)):
+                    changed |= self.watchNew (path)
+        return changed
+
+    def watchNew (self, directory):
+        """
+        Add watches for a directory created in a tree, and any within it.
+        Returns:
+            Set of .json files already in them, created before the watch.
+        """
+        files = set ()
+        for path in _subdirectories ([directory]):
+            try:
+                self.watch (path)
+            except OSError:
+                # removed again, its deletion is reported by its parent
+                continue
+            files.update (_jsonFiles (path))
+        return files
+
+    def close (self):
+        """ Close the inotify descriptor. """
+        os.close (self.fd)
+
+class _Poller:
+    """
+    Monitor directories, and trees of directories, by comparing file
+    modification times.
+    """
+    def __init__ (self, directories, trees, interval):
+        self.interval = interval
+        self.directories = set ()
+        self.trees = set ()
+        self.files = {}
+        self.update (directories, trees)
+
+    def update (self, directories, trees):
+        """ Add directories and trees not yet monitored. """
+        added = set (directories) - self.directories
+        self.directories |= added
+        newTrees = set (trees) - self.trees
+        self.trees |= newTrees
+        for directory in added | _subdirectories (newTrees):
+            self.files.update (_scan (directory))
+
+    def wait (self, timeout):
+        """
+        Wait for changes, scanning every interval.
+        Args:
+            timeout (float): Seconds to wait, None to wait for a change.
+        Returns:
+            Set of changed paths, empty if none before the timeout.
+        """
+        end = None if timeout is None else time.time () + timeout
+        while True:
+            files = {}
+            for directory in self.directories | _subdirectories (self.trees):
+                files.update (_scan (directory))
+            changed = set (file for file in set (files) | set (self.files)
+              if files.get (file) != self.files.get (file))
+            self.files = files
+            if changed or (end is not None and time.time () >= end):
+                return changed
+            delay = self.interval
+            if end is not None:
+                delay = min (delay, max (0, end - time.time ()))
+            time.sleep (delay)
+
+    def close (self):
+        """ Nothing to release. """
+        pass
+
+def _subdirectories (trees):
+    """ Directories of trees, with all their subdirectories. """
+    directories = set ()
+    for tree in trees:
+        for directory, dirs, names in os.walk (tree):
+            directories.add (directory)
+    return directories
+
+def _scan (directory):
+    """ Modification time and size of .json files in a directory. """
+    files = {}
+    for file in _jsonFiles (directory):
+        try:
+            info = os.stat (file)
+            files[file] = (getattr (info, "st_mtime_ns", info.st_mtime),
+              info.st_size)
+        except OSError:
+            pass
+    return files
+
+def _jsonFiles (directory):
+    """ Paths of .json files in a directory. """
+    try:
+        names = os.listdir (directory)
+    except OSError:
+        return []
+    return [os.path.join (directory, name) for name in names
+      if name.endswith (".json")]
+
+def _references (schema):
+    """ Generate $ref values in a schema. """
+    if isinstance (schema, dict):
+        for key, value in schema.items ():
+            if key == "$ref" and isinstance (value, type (u"")):
+                yield value
+            else:
+                for uri in _references (value):
+                    yield uri
+    elif isinstance (schema, list):
+        for value in schema:
+            for uri in _references (value):
+                yield uri
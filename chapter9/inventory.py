@@ -1,10 +1,17 @@
 """
 Inventory management simulation
+
+Count updates are appended to the safefile journal rather than
+rewriting the inventory file, which is compacted when the journal
+grows past its limit. Items are loaded as compact records rather than
+dicts, and the document is loaded into a ChangeTracker, so only the
+changed items are validated before the changes are appended.
 """
 import sys
 from safefile import safefile, SafeFileError
-from jsonvalidate import validate, VALID
-from json import dumps
+from jsonvalidate import (createValidator, validateData, ChangeTracker,
+  BatchValidator, loadRecords, toJson, VALID)
+from json import JSONEncoder
 
 # starting message
 print ("Starting processing")
@@ -25,27 +32,53 @@ elif status == safefile.SAFE_RECOVERABLE:
     safefile.safeRecover (dataFile)
     print ("Inventory file auto recovered")
 
-# load and validate file content
+# load file content with journal changes as records, and validate
 inventory = None;
-code, inventory, message = validate (dataFile, schema, None, None)
+try:
+    inventory = safefile.safeReadDocument (dataFile, load = loadRecords)
+except SafeFileError as e:
+    print ("Inventory file could not be read")
+    print ("Error: " + e.message)
+    sys.exit (1)
+code, validator, message = createValidator (schema, None, None)
+if code == VALID:
+    code, inventory, message = validateData (dataFile, inventory,
+      BatchValidator (validator))
 # if invalid, print error message
 if code != VALID:
     print ("Inventory file validation failed")
-    print ("Error: " + message)
+    print ("Error: " + str (message))
     sys.exit (1)
 
 # program content goes here ...
-# to show updates, increment item count by 1 for all items
-for item in inventory:
+# to show updates, increment item count by 1 for all items,
+# recording each change as a JSON Patch operation
+tracker = ChangeTracker (inventory, validator)
+inventory = tracker.document
+changes = []
+for index, item in enumerate (inventory):
     item['count'] = item['count'] + 1
+    changes.append ({ "op": "replace", "path": "/%d/count" % index,
+      "value": item['count'] })
+
+# validate only the changed items before recording changes
+errors = tracker.revalidateChanges ()
+if len (errors) > 0:
+    print ("Inventory changes validation failed")
+    print ("Error: /" + "/".join (str (token) for token in errors[0].path) +
+      ": " + errors[0].message)
+    sys.exit (1)
 
-# apply formatting to content before writing when
-# content is intended to be user readable/editable
-output = dumps (inventory, indent = 2, sort_keys = True);
+# apply formatting to content when compacted, as
+# content is intended to be user readable/editable,
+# encoded in chunks without building the whole text
+def serialize (content):
+    encoder = JSONEncoder (indent = 2, sort_keys = True, default = toJson);
+    return encoder.iterencode (content)
 
-# write using recoverable interface
+# append changes using recoverable interface
 try:
-    safefile.safeWriteFile (dataFile, output)
+    safefile.safeAppendJournal (dataFile, changes, serialize = serialize)
 except SafeFileError as e:
     print ("Error writing content " + e.message)
 
@@ -0,0 +1,82 @@
+"""
+Inventory management simulation with sharded storage
+
+The inventory items are split across shard files by id, on first run
+from inventory.json. Shards are recovered in parallel, validated against
+the inventory items schema, and only shards with changes are rewritten.
+"""
+import sys
+from safefile import safefile, shards, SafeFileError
+from jsonvalidate import createValidator, itemsValidator, VALID
+from json import JSONEncoder
+
+# starting message
+print ("Starting processing")
+
+# inventory files
+dataFile = "inventory.json";
+schema = "inventory_schema.json";
+
+# apply formatting to content before writing when
+# content is intended to be user readable/editable,
+# encoded in chunks without building the whole text
+def serialize (content):
+    encoder = JSONEncoder (indent = 2, sort_keys = True);
+    return encoder.iterencode (content)
+
+# create sharded layout from the inventory file if not yet sharded
+try:
+    if safefile.safeGetState (dataFile + shards.MANIFEST) == \
+      safefile.DOES_NOT_EXIST:
+        shards.createShards (dataFile, safefile.safeReadDocument (dataFile),
+          "id", serialize = serialize)
+        print ("Inventory file sharded")
+except SafeFileError as e:
+    print ("Error sharding content " + e.message)
+    sys.exit (1)
+
+# determine current state, recovering shards in parallel
+status = shards.shardsState (dataFile);
+if status == safefile.SAFE_INTERVENE:
+    print ("Inventory file requires administrator action")
+    sys.exit (1)
+elif status == safefile.DOES_NOT_EXIST:
+    print ("Inventory file missing")
+    sys.exit (1)
+elif status == safefile.SAFE_RECOVERABLE:
+    if len (shards.recoverShards (dataFile)) > 0:
+        print ("Inventory file requires administrator action")
+        sys.exit (1)
+    print ("Inventory file auto recovered")
+
+# validate each shard against the inventory items schema
+inventory = shards.ShardedArray (dataFile, serialize)
+code, validator, message = createValidator (schema, None, None)
+if code == VALID:
+    try:
+        errors = inventory.validate (itemsValidator (validator))
+        if len (errors) > 0:
+            code = 1
+            message = errors[0][0] + ": " + errors[0][1].message
+    except ValueError as e:
+        code = 1
+        message = e
+# if invalid, print error message
+if code != VALID:
+    print ("Inventory file validation failed")
+    print ("Error: " + str (message))
+    sys.exit (1)
+
+# program content goes here ...
+# to show updates, increment item count by 1 for all items
+for item in inventory.items ():
+    item['count'] = item['count'] + 1
+    inventory.changed (item)
+
+# write changed shards using recoverable interface
+try:
+    inventory.flush ()
+except SafeFileError as e:
+    print ("Error writing content " + e.message)
+
+print ("Completed processing")
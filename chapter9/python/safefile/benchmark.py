@@ -0,0 +1,149 @@
+"""
+Compression benchmark for safefile.
+
+Writes and reads a generated inventory document with safeWriteFile and
+safeReadFile for each compression and level, reporting the file size
+and times. As disk or network bandwidth is often the limit, the time to
+transfer the file at a given bandwidth is added to the measured time,
+so levels can be compared for the storage in use.
+
+With --memory, compares the peak memory used to write the document as
+one string, as JSONEncoder.iterencode chunks, and with json.dump to a
+file-like object, above the memory holding the document objects.
+
+Usage: python benchmark.py [-i items] [-b MB/s] [-r repeats] [--memory]
+"""
+from argparse import ArgumentParser
+from shutil import rmtree
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from safefile import safeWriteFile, safeReadFile, SafeFileError
+
+# compression, levels
+LEVELS = [
+    ("none", [None]),
+    ("gzip", [1, 6, 9]),
+    ("lzma", [0, 3, 6]),
+    ("zstd", [1, 3, 9, 19])
+]
+
+def inventory (items):
+    """ Inventory like document with a number of items. """
+    return [{ "id": "%09d" % (index * 7919 % 1000000007),
+      "count": index % 500, "location": "warehouse %d" % (index % 17),
+      "description": "Item %d in stock" % index } for index in range (items)]
+
+def document (items):
+    """ Inventory like document text with a number of items. """
+    return json.dumps (inventory (items), indent=2, sort_keys=True)
+
+# ways to write a document, as data for safeWriteFile
+WRITERS = [
+    ("string", lambda content: json.dumps (content, indent=2,
+      sort_keys=True)),
+    ("iterencode", lambda content: json.JSONEncoder (indent=2,
+      sort_keys=True).iterencode (content)),
+    ("json.dump", lambda content: lambda f: json.dump (content, f,
+      indent=2, sort_keys=True))
+]
+
+def memory (items, directory):
+    """ Report peak memory and time of each way to write a document. """
+    content = inventory (items)
+    file = os.path.join (directory, "inventory.json")
+    print ("%-12s %12s %10s %10s" % ("writer", "peak MB", "write ms",
+      "size MB"))
+    for name, writer in WRITERS:
+        # timed without tracing, which slows allocation
+        start = time.time ()
+        safeWriteFile (file, writer (content))
+        elapsed = time.time () - start
+        os.unlink (file + ".sum")
+
+        tracemalloc.start ()
+        safeWriteFile (file, writer (content))
+        peak = tracemalloc.get_traced_memory ()[1]
+        tracemalloc.stop ()
+        print ("%-12s %12.1f %10.1f %10.1f" % (name, peak / 1048576.0,
+          elapsed * 1000, os.path.getsize (file) / 1048576.0))
+        for entry in os.listdir (directory):
+            os.unlink (os.path.join (directory, entry))
+
+def measure (file, data, compression, level, repeats):
+    """
+    Time writes and reads of a file.
+    Returns:
+        Tuple of (size, write seconds, read seconds), None if the
+        compression is not available.
+    """
+    writes = []
+    reads = []
+    for repeat in range (repeats):
+        # without the checksum, unchanged data is written again
+        if os.path.exists (file + ".sum"):
+            os.unlink (file + ".sum")
+        start = time.time ()
+        try:
+            safeWriteFile (file, data, compression, level)
+        except SafeFileError:
+            return None
+        writes.append (time.time () - start)
+        start = time.time ()
+        if safeReadFile (file) != data:
+            raise ValueError ("data read does not match " + compression)
+        reads.append (time.time () - start)
+    return os.path.getsize (file), min (writes), min (reads)
+
+def main ():
+    """ Run benchmark for each compression and level. """
+    parser = ArgumentParser (prog="benchmark")
+    parser.add_argument ("-i", "--items", type=int, default=200000,
+      help="Number of inventory items")
+    parser.add_argument ("-b", "--bandwidth", type=float, default=100.0,
+      help="Storage bandwidth in MB/s added as transfer time")
+    parser.add_argument ("-r", "--repeats", type=int, default=3,
+      help="Runs per level, fastest reported")
+    parser.add_argument ("--memory", action="store_true",
+      help="Compare peak memory of string and streamed writes")
+    args = parser.parse_args ()
+
+    if args.memory:
+        directory = tempfile.mkdtemp ()
+        try:
+            memory (args.items, directory)
+        finally:
+            rmtree (directory)
+        return
+
+    data = document (args.items)
+    bandwidth = args.bandwidth * 1024 * 1024
+    directory = tempfile.mkdtemp ()
+    print ("Document %.1f MB, bandwidth %.0f MB/s" % (len (data) /
+      1048576.0, args.bandwidth))
+    print ("%-6s %5s %10s %7s %9s %9s %10s %10s" % ("format", "level",
+      "size KB", "ratio", "write ms", "read ms", "write I/O", "read I/O"))
+    try:
+        for compression, levels in LEVELS:
+            for level in levels:
+                file = os.path.join (directory, "inventory.json")
+                result = measure (file, data, compression, level,
+                  args.repeats)
+                for name in os.listdir (directory):
+                    os.unlink (os.path.join (directory, name))
+                if result is None:
+                    print ("%-6s not available" % compression)
+                    break
+                size, write, read = result
+                transfer = size / bandwidth
+                print ("%-6s %5s %10.0f %7.2f %9.1f %9.1f %10.1f %10.1f" % (
+                  compression, "-" if level is None else level, size / 1024.0,
+                  float (len (data)) / size, write * 1000, read * 1000,
+                  (write + transfer) * 1000, (read + transfer) * 1000))
+    finally:
+        rmtree (directory)
+
+if __name__ == "__main__":
+    main ()
@@ -7,9 +7,55 @@ safeGetState - Get the recovery state for a file
 safeRecover - Initiate recovery for a file
 safeReadFile - Read with recovery support
 safeWriteFile - Write with recovery support
+safeReadDocument - Read JSON with recovery and journal support
+safeAppendJournal - Append a change record to the journal
+safeCompact - Fold the journal into the file
+safeVerify - Check file integrity against its checksum, without parsing
+
+Journal mode: instead of rewriting a JSON document for each change,
+changes are appended as JSON Patch operations to a journal file (.wal)
+and replayed when the document is read. The journal's first line holds
+a hash, modification time and size of the file it applies to, so a
+journal left behind once the file has been rewritten is detected as
+stale, and a record cut short by a crash is detected as torn; both are
+recoverable. The file is hashed only if its time or size changed. A
+record is appended only if its operations apply to the document, and
+is applied all or nothing; a record that does not apply on replay,
+with those after it, is moved to a rejected file (.wal.rej), which
+needs administrator action, cleared by safeRecover. The journal is
+folded into the file by compaction, using the same rotation as
+safeWriteFile, when it grows past a size limit.
+
+Compression: files compressed with gzip, lzma (xz) or zstd are read
+transparently, detected by their magic bytes, and written compressed
+when the file name ends with .gz, .xz, .lzma or .zst. safeWriteFile
+keeps the compression of the file it replaces, so the rotated .rdy,
+.bak and .bk2 files match. Data is compressed and decompressed in
+chunks, so compressed content is never held as well as the data. The
+data is decoded as UTF-8 as a whole, not incrementally: reading, and
+json.load in safeReadDocument, briefly hold the data bytes and the
+text together, about twice the text, before the document is built.
+zstd requires the zstandard package.
+
+Checksums: safeWriteFile records the size, modification time and
+checksum of the file written, and of its uncompressed data, in a
+sidecar file (.sum), with the compression and level used. The sidecar
+of a new file is recorded for the .rdy file (.rdy.sum) and takes the
+place of the file's when the .rdy file does, so a crash never leaves a
+sidecar describing another file. safeVerify checks a file against it
+in one pass over the file, without parsing, and safeWriteFile skips
+writing data identical to the unchanged current file, written with the
+same compression and level. The checksum is xxh64 if the
+xxhash package is installed, else CRC32.
 """
-from os import unlink, rename
-from os.path import exists, isfile, isdir
+from copy import deepcopy
+from os import unlink, rename, fsync, stat
+from os.path import exists, isfile, isdir, getsize
+import hashlib
+import io
+import json
+import mmap
+import zlib
 
 # error and message constants
 NO_ERROR = 0
@@ -18,6 +64,9 @@ DOES_NOT_EXIST = 101
 IS_NOT_A_FILE = 102
 READ_ERROR = 103
 WRITE_ERROR = 104
+JOURNAL_ERROR = 105
+CHECKSUM_ERROR = 106
+NO_CHECKSUM = 107
 SAFE_NORMAL = 0
 SAFE_RECOVERABLE = 110
 SAFE_INTERVENE = 111
@@ -27,6 +76,26 @@ MSG_IS_NOT_A_FILE = "File {0} is not a file"
 MSG_DOES_NOT_EXIST = "File {0} does not exist"
 MSG_READ_ERROR = "Error reading file {0}: {1}"
 MSG_WRITE_ERROR = "Error writing file {0}: {1}"
+MSG_JOURNAL_ERROR = "Error in journal {0}: {1}"
+MSG_INTERVENE = "File {0} requires administrator action"
+MSG_COMPRESSION = "Compression {0} is not available: {1}"
+MSG_CHECKSUM_ERROR = "File {0} does not match its checksum"
+MSG_NO_CHECKSUM = "File {0} has no checksum"
+MSG_REJECTED = "Journal records for {0} do not apply, moved to {1}: {2}"
+
+# compression formats, magic bytes, and file name extensions
+COMPRESSIONS = ("none", "gzip", "lzma", "zstd")
+MAGIC = (
+    (b"\x1f\x8b", "gzip"),
+    (b"\xfd7zXZ\x00", "lzma"),
+    (b"\x28\xb5\x2f\xfd", "zstd")
+)
+EXTENSIONS = { ".gz": "gzip", ".xz": "lzma", ".lzma": "lzma", ".zst": "zstd" }
+# characters or bytes processed per chunk when streaming
+CHUNK_SIZE = 1024 * 1024
+
+# journal size in bytes that triggers compaction
+JOURNAL_LIMIT = 1024 * 1024
 
 class SafeFileError (Exception):
     """
@@ -42,7 +111,7 @@ class SafeFileError (Exception):
 
 def readFile (file):
     """
-    Read file.
+    Read file, decompressing if compressed.
     Args:
       file (str): Path / file name of file to read.
     Returns:
@@ -60,20 +129,34 @@ def readFile (file):
     if not info["isFile"]:
         raise SafeFileError (IS_NOT_A_FILE, MSG_IS_NOT_A_FILE.format (file))
 
-    # read data file
+    # read data file, decompressing in chunks, then decoding as UTF-8
     try:
-        data = open (file).read ()
-        return data
-    except IOError as e:
+        raw = io.open (file, "rb")
+        try:
+            return _openRead (raw, _detectCompression (raw)).read ()
+        finally:
+            raw.close ()
+    except (IOError, OSError, EOFError, ValueError) as e:
         raise SafeFileError (READ_ERROR,
-            MSG_READ_ERROR.format (file, e.strerror))
+            MSG_READ_ERROR.format (file, getattr (e, "strerror", None) or e))
 
-def writeFile (file, data):
+def writeFile (file, data, compression=None, level=None):
     """
-    Write file.
+    Write file, compressing if requested or if the file name has a
+    compression extension. Data can be streamed from an iterable or a
+    function, so the whole document text is never held in memory.
     Args:
         file (str): Path / file name to write.
-        data (str): Data to write.
+        data: Data to write, str or bytes, an iterable of str or bytes
+          chunks (such as JSONEncoder.iterencode), or a function called
+          with a file-like object to write to (such as json.dump).
+          Text is written as UTF-8.
+        compression (str): One of COMPRESSIONS, None for the extension.
+        level (int): Compression level, None for the default.
+    Returns:
+        Dict with checksum algorithm, size and checksum of the file,
+        dataSize and dataChecksum of the data before compression, and
+        the compression and level used.
     Raises:
         SafeFileError
     """
@@ -84,14 +167,40 @@ def writeFile (file, data):
     if info["exists"] and not info["isFile"]:
         raise SafeFileError (IS_NOT_A_FILE, MSG_IS_NOT_A_FILE.format (file))
 
-    # read data file
+    if compression is None:
+        compression = _extensionCompression (file)
+
+    # write data file, encoding and compressing in chunks, with checksums
+    # of the file and, if compressed, of the data
     try:
-        file = open (file, "w")
-        file.write (data)
-        file.close ()
-    except IOError as e:
+        output = open (file, "wb")
+        try:
+            fileSum = _Checksum ()
+            dataSum = fileSum
+            stream = output
+            if compression != "none":
+                dataSum = _Checksum (fileSum.algorithm)
+                stream = _openWrite (_ChecksumWriter (output, fileSum),
+                  compression, level)
+            try:
+                _writeData (_DataWriter (stream, dataSum), data)
+            finally:
+                if stream is not output:
+                    stream.close ()
+        finally:
+            output.close ()
+    except (IOError, OSError) as e:
         raise SafeFileError (WRITE_ERROR,
-            MSG_WRITE_ERROR.format (file, e.strerror))
+            MSG_WRITE_ERROR.format (file, getattr (e, "strerror", None) or e))
+    return {
+        "algorithm": fileSum.algorithm,
+        "size": fileSum.size,
+        "checksum": fileSum.hexdigest (),
+        "dataSize": dataSum.size,
+        "dataChecksum": dataSum.hexdigest (),
+        "compression": compression,
+        "level": level
+    }
 
 def safeGetState (file):
     """
@@ -153,14 +262,21 @@ def safeReadFile (file):
     if state["status"] == SAFE_RECOVERABLE:
         _performRecovery (state, True)
 
-    readFile (file)
+    # replay journal records, if any
+    if exists (file + ".wal"):
+        return json.dumps (safeReadDocument (file))
+    return readFile (file)
 
-def safeWriteFile (file, data):
+def safeWriteFile (file, data, compression=None, level=None):
     """
     Write data to a file, applying recovery enabling processing.
     Args:
         file File to write to.
-        data Data to write.
+        data Data to write, str or bytes, an iterable of chunks, or a
+          function writing to a file-like object, see writeFile.
+        compression One of COMPRESSIONS, None for the extension of the
+          file name, else the compression of the file replaced.
+        level Compression level, None for the default.
     Raises:
         SafeFileError
     """
@@ -174,29 +290,247 @@ def safeWriteFile (file, data):
     # get current file system state, and auto-recover if necessary
     state = _getState (file)
 
+    if compression is None:
+        compression = _fileCompression (file)
+
+    # skip writing data identical to the unchanged current file, written
+    # the same way, checked before writing for text, after writing the
+    # ephemeral file for streams
+    recorded = None
+    if state["status"] == SAFE_NORMAL and not state["journal"]["exists"]:
+        recorded = _unchangedChecksum (file)
+    if recorded is not None and isinstance (data, (type (u""), bytes)) and \
+      _sameData (_dataChecksum (data, recorded["algorithm"], compression,
+      level), recorded):
+        return
+
     # store data in well defined ephemeral file to allow manual recovery.
     # If file already exists, remove it (failed prior recovery).
     if state["ephemeral"]["exists"]:
         unlink (state["ephemeral"]["name"])
 
-    writeFile (state["ephemeral"]["name"], data)
+    try:
+        checksum = writeFile (state["ephemeral"]["name"], data, compression,
+          level)
+    except Exception:
+        # data not complete, such as a serialization error, so the current
+        # file stays in place without intervention
+        if exists (state["ephemeral"]["name"]):
+            unlink (state["ephemeral"]["name"])
+        raise
     state["ephemeral"]["exists"] = True
+    if recorded is not None and _sameData (checksum, recorded):
+        unlink (state["ephemeral"]["name"])
+        return
 
     # if ready state file already exists, recover prior state
     if state["ready"]["exists"]:
         _performRecovery (state, False)
 
+    # record checksum for the ready file before it exists, recovery then
+    # moves it to the file along with the ready file
+    _writeChecksum (state["ready"]["name"], state["ephemeral"]["name"],
+      checksum)
     rename (state["ephemeral"]["name"], state["ready"]["name"])
 
     # refresh state and process recovery to set file system state
     state = _getState (file)
     _performRecovery (state, True)
 
-def _getState (file):
+    # file replaced, so any journal is stale
+    if exists (file + ".wal"):
+        unlink (file + ".wal")
+
+def safeReadDocument (file, loads=None, load=None):
+    """
+    Read a JSON document, applying recovery processing if necessary,
+    and replaying the journal.
+    Args:
+        file File to read.
+        loads Function to parse the document text, such as orjson.loads,
+          None to parse with load.
+        load Function to parse the document from a text stream, such as
+          json.load, None for json.load. The stream decompresses in
+          chunks, but json.load reads the whole text, holding the data
+          bytes and the text together while it is decoded.
+    Returns:
+        Document read from file, with journal changes applied.
+    Raises:
+        SafeFileError
+    """
+    if file is None:
+        raise SafeFileError (INVALID_NAME, MSG_INVALID_NAME)
+
+    # journal checked below, reading the file once
+    state = _getState (file, False)
+    if state["status"] == SAFE_RECOVERABLE:
+        _performRecovery (state, True)
+    elif state["status"] == SAFE_INTERVENE:
+        raise SafeFileError (SAFE_INTERVENE, MSG_INTERVENE.format (file))
+    elif state["status"] != SAFE_NORMAL:
+        readFile (file)
+
+    # parse from the file as read, hashing its content to match the journal
+    if load is None:
+        load = json.load
+    try:
+        raw = io.open (file, "rb")
+        try:
+            reader = _HashReader (raw)
+            stream = _openRead (reader, _detectCompression (raw))
+            if loads is not None:
+                document = loads (stream.read ())
+            else:
+                document = load (stream)
+            while reader.read (CHUNK_SIZE):
+                pass
+        finally:
+            raw.close ()
+    except (IOError, OSError, EOFError) as e:
+        raise SafeFileError (READ_ERROR,
+            MSG_READ_ERROR.format (file, getattr (e, "strerror", None) or e))
+    except ValueError as e:
+        raise SafeFileError (READ_ERROR, MSG_READ_ERROR.format (file, e))
+
+    journal = _getJournal (file, reader.hash.hexdigest ())
+    if journal["corrupt"]:
+        raise SafeFileError (SAFE_INTERVENE, MSG_INTERVENE.format (file))
+    if journal["stale"] or journal["torn"]:
+        _recoverJournal (state)
+    for position, record in enumerate (journal["records"]):
+        try:
+            document = _applyPatch (file + ".wal", document, record)
+        except SafeFileError as e:
+            # set aside for the administrator, so later reads do not fail
+            _rejectJournal (file, position)
+            raise SafeFileError (SAFE_INTERVENE, MSG_REJECTED.format (file,
+              file + ".wal.rej", e.message))
+    return document
+
+def safeAppendJournal (file, operations, limit=JOURNAL_LIMIT,
+  serialize=None, document=None):
+    """
+    Append a change record to the journal of a JSON document, synced to
+    disk before returning. The operations are checked against the
+    document first, and the record is not appended if they do not all
+    apply. The file is not rewritten, unless the journal grows past the
+    limit and is compacted.
+    Args:
+        file File the changes apply to.
+        operations List of JSON Patch operations (add, remove, replace,
+          move, copy, test), applied together on read.
+        limit Journal size that triggers compaction, None for never.
+        serialize Function to convert the document to data for
+          safeWriteFile on compaction, such as text or chunks, None for
+          json.dumps.
+        document Document the operations apply to, as read with
+          safeReadDocument and changed by the records appended since,
+          None to read it. Left unchanged.
+    Raises:
+        SafeFileError, JOURNAL_ERROR if the operations do not apply.
+    """
+    if file is None:
+        raise SafeFileError (INVALID_NAME, MSG_INVALID_NAME)
+
+    journalFile = file + ".wal"
+    if document is None:
+        document = safeReadDocument (file)
+    _applyPatch (journalFile, document, operations, False)
+
+    lines = []
+    if exists (journalFile) and not _endsWithNewline (journalFile):
+        # last record torn by a crash, remove it before appending
+        _recoverJournal (_getState (file))
+    if not exists (journalFile) or getsize (journalFile) == 0:
+        # start journal, recording the file it applies to
+        state = _getState (file)
+        if state["status"] == SAFE_RECOVERABLE:
+            _performRecovery (state, True)
+        elif state["status"] == SAFE_INTERVENE:
+            raise SafeFileError (SAFE_INTERVENE, MSG_INTERVENE.format (file))
+        elif state["status"] != SAFE_NORMAL:
+            readFile (file)
+        header = { "base": _hash (_readBytes (file)),
+          "modified": _modified (file) }
+        lines.append (json.dumps (header))
+    lines.append (json.dumps (operations))
+
+    try:
+        journal = open (journalFile, "ab")
+        try:
+            journal.write (("\n".join (lines) + "\n").encode ("utf8"))
+            journal.flush ()
+            fsync (journal.fileno ())
+        finally:
+            journal.close ()
+    except (IOError, OSError) as e:
+        raise SafeFileError (WRITE_ERROR,
+            MSG_WRITE_ERROR.format (journalFile, e.strerror))
+
+    if limit is not None and getsize (journalFile) > limit:
+        safeCompact (file, serialize)
+
+def safeCompact (file, serialize=None):
+    """
+    Fold the journal into the file, writing with safeWriteFile rotation.
+    Until the new file is in place, the journal still applies to the old
+    file; once it is, the journal is stale and removed.
+    Args:
+        file File to compact.
+        serialize Function to convert the document to data for
+          safeWriteFile, such as text or chunks, None for json.dumps.
+    Raises:
+        SafeFileError
+    """
+    if not exists (file + ".wal"):
+        return
+    document = safeReadDocument (file)
+    if serialize is None:
+        serialize = json.dumps
+    safeWriteFile (file, serialize (document))
+
+def safeVerify (file):
+    """
+    Check a file against the checksum recorded when it was written,
+    reading it in one pass without parsing.
+    Args:
+        file File to verify.
+    Returns:
+        NO_ERROR if the file matches, CHECKSUM_ERROR if not, NO_CHECKSUM
+        if no checksum was recorded, or the recovery state if not
+        SAFE_NORMAL.
+    """
+    status = safeGetState (file)
+    if status != SAFE_NORMAL:
+        return status
+
+    recorded = _readChecksum (file)
+    if recorded is None:
+        return NO_CHECKSUM
+    try:
+        with open (file, "rb") as f:
+            f.seek (0, 2)
+            if f.tell () != recorded["size"]:
+                return CHECKSUM_ERROR
+            checksum = _Checksum (recorded["algorithm"])
+            if recorded["size"] > 0:
+                view = mmap.mmap (f.fileno (), 0, access=mmap.ACCESS_READ)
+                try:
+                    checksum.update (view)
+                finally:
+                    view.close ()
+    except (IOError, OSError, ValueError):
+        return CHECKSUM_ERROR
+    if checksum.hexdigest () != recorded["checksum"]:
+        return CHECKSUM_ERROR
+    return NO_ERROR
+
+def _getState (file, checkJournal=True):
     """
     Get file state.
     Args:
         file File to get state for.
+        checkJournal Flag, check journal is current and complete.
     Returns:
         State object containing list of recovery files and overall status.
     """
@@ -206,13 +540,21 @@ def _getState (file):
     state["base"] = _getFileInfo (file)
     state["backup"] = _getFileInfo (file + ".bak")
     state["tertiary"] = _getFileInfo (file + ".bk2")
+    state["journal"] = _getFileInfo (file + ".wal")
+    state["rejected"] = _getFileInfo (file + ".wal.rej")
 
-    if state["ephemeral"]["exists"]:
+    if state["ephemeral"]["exists"] or state["rejected"]["exists"]:
         state["status"] = SAFE_INTERVENE
     elif state["ready"]["exists"] or state["tertiary"]["exists"]:
         state["status"] = SAFE_RECOVERABLE
     elif state["base"]["exists"]:
         state["status"] = SAFE_NORMAL
+        if checkJournal and state["journal"]["exists"]:
+            journal = _getJournal (file)
+            if journal["corrupt"]:
+                state["status"] = SAFE_INTERVENE
+            elif journal["stale"] or journal["torn"]:
+                state["status"] = SAFE_RECOVERABLE
     else:
         if state["backup"]["exists"]:
             state["status"] = SAFE_RECOVERABLE
@@ -243,9 +585,12 @@ def _performRecovery (state, removeEphemeral):
         state State object with recovery file information.
         removeEphemeral Flag, remove ephemeral if found or not
     """
-    # if ephemeral flag true, and ephemeral file exists, remove it
+    # if ephemeral flag true, and ephemeral file exists, remove it, and
+    # likewise rejected journal records
     if removeEphemeral and state["ephemeral"]["exists"]:
         unlink (state["ephemeral"]["name"])
+    if removeEphemeral and state["rejected"]["exists"]:
+        unlink (state["rejected"]["name"])
 
     # if only backups exist, restore from backup
     baseAvailable = state["base"]["exists"] or state["ready"]["exists"]
@@ -258,6 +603,11 @@ def _performRecovery (state, removeEphemeral):
                 rename (state["tertiary"]["name"], state["base"]["name"])
         elif state["backup"]["exists"]:
             rename (state["backup"]["name"], state["base"]["name"])
+        # checksums are for lost files, not the backup restored
+        for sidecar in (state["base"]["name"], state["ready"]["name"]):
+            if exists (sidecar + ".sum"):
+                unlink (sidecar + ".sum")
+        _recoverJournal (state)
         return
 
     # if tertiary state file exists, remove it
@@ -268,6 +618,18 @@ def _performRecovery (state, removeEphemeral):
     if state["ready"]["exists"]:
         removeTertiary = False
 
+        # checksum of the ready file becomes the file's first, as while
+        # the ready file exists safeVerify does not check it. If already
+        # moved by a recovery cut short, it records the ready file.
+        if exists (state["ready"]["name"] + ".sum"):
+            rename (state["ready"]["name"] + ".sum",
+              state["base"]["name"] + ".sum")
+        else:
+            recorded = _readChecksum (state["base"]["name"])
+            if recorded is not None and recorded.get ("modified") != \
+              _modified (state["ready"]["name"]):
+                unlink (state["base"]["name"] + ".sum")
+
         # if base and backup exist, rename to tertiary temporarily
         if state["base"]["exists"] and state["backup"]["exists"]:
             rename (state["backup"]["name"], state["tertiary"]["name"])
@@ -283,3 +645,504 @@ def _performRecovery (state, removeEphemeral):
         # if temporary tertiary created, remove it
         if removeTertiary:
             unlink (state["tertiary"]["name"])
+
+    _recoverJournal (state)
+
+def _recoverJournal (state):
+    """
+    Remove a stale journal, or truncate a torn last record.
+    Args:
+        state State object with recovery file information.
+    """
+    journalFile = state["journal"]["name"]
+    baseFile = state["base"]["name"]
+    if not exists (journalFile) or not exists (baseFile):
+        return
+
+    journal = _getJournal (baseFile)
+    if journal["stale"]:
+        unlink (journalFile)
+    elif journal["torn"]:
+        with open (journalFile, "r+b") as f:
+            f.truncate (journal["size"])
+            f.flush ()
+            fsync (f.fileno ())
+
+def _getJournal (file, baseHash=None):
+    """
+    Read the journal for a file. The journal matches the file if its
+    modification time and size are as recorded, else if its hash is.
+    Args:
+        file File the journal applies to.
+        baseHash Hash of the content of the file, None to read the file
+          if needed.
+    Returns:
+        Dict with records (list of operation lists), size of the
+        complete records, and flags stale (journal for other content),
+        torn (last record incomplete) and corrupt (not readable).
+    """
+    journal = { "records": [], "size": 0, "stale": False, "torn": False,
+      "corrupt": False }
+    try:
+        data = _readBytes (file + ".wal")
+    except SafeFileError:
+        return journal
+
+    lines = data.split (b"\n")
+    # text after the last newline is a record cut short
+    if lines[-1] != b"":
+        journal["torn"] = True
+    lines = lines[:-1]
+    if len (lines) == 0:
+        # only a torn header, nothing was recorded
+        journal["stale"] = journal["torn"]
+        return journal
+
+    try:
+        header = json.loads (lines[0].decode ("utf8"))
+        records = [json.loads (line.decode ("utf8")) for line in lines[1:]]
+    except ValueError:
+        journal["corrupt"] = True
+        return journal
+
+    if not isinstance (header, dict):
+        journal["stale"] = True
+        return journal
+    if header.get ("modified") is None or \
+      header["modified"] != _modified (file):
+        if baseHash is None:
+            baseHash = _hash (_readBytes (file))
+        if header.get ("base") != baseHash:
+            journal["stale"] = True
+            return journal
+    journal["records"] = records
+    journal["size"] = sum (len (line) + 1 for line in lines)
+    return journal
+
+def _applyPatch (journalFile, document, operations, keep=True):
+    """
+    Apply JSON Patch operations to a document, all or none: if one
+    fails, the changes of those before it are undone.
+    Args:
+        journalFile Journal file name, for error messages.
+        document Document to change.
+        operations List of operations.
+        keep Flag, keep the changes, else only check they apply.
+    Returns:
+        Changed document.
+    Raises:
+        SafeFileError
+    """
+    original = document
+    undo = []
+    try:
+        for operation in operations:
+            op = operation["op"]
+            if op in ("move", "copy"):
+                value = _getPointer (document, operation["from"])
+                if op == "move":
+                    document = _removePointer (document, operation["from"],
+                      undo)
+                document = _addPointer (document, operation["path"],
+                  deepcopy (value), undo)
+            elif op == "add":
+                document = _addPointer (document, operation["path"],
+                  operation["value"], undo)
+            elif op == "remove":
+                document = _removePointer (document, operation["path"], undo)
+            elif op == "replace":
+                document = _removePointer (document, operation["path"], undo)
+                document = _addPointer (document, operation["path"],
+                  operation["value"], undo)
+            elif op == "test":
+                if _getPointer (document, operation["path"]) != \
+                  operation["value"]:
+                    raise ValueError ("test failed at " + operation["path"])
+            else:
+                raise ValueError ("unknown operation " + str (op))
+    except (KeyError, IndexError, TypeError, ValueError) as e:
+        _undo (undo)
+        raise SafeFileError (JOURNAL_ERROR,
+            MSG_JOURNAL_ERROR.format (journalFile, repr (e)))
+    if not keep:
+        _undo (undo)
+        return original
+    return document
+
+def _undo (undo):
+    """ Undo changes in reverse order, from a list of functions. """
+    for change in reversed (undo):
+        change ()
+
+def _splitPointer (pointer):
+    """ Split a JSON Pointer into reference tokens. """
+    if pointer == "":
+        return []
+    if pointer[0] != "/":
+        raise ValueError ("pointer not valid " + pointer)
+    return [token.replace ("~1", "/").replace ("~0", "~")
+      for token in pointer[1:].split ("/")]
+
+def _getPointer (document, pointer):
+    """ Get the value at a JSON Pointer. """
+    return _getTokens (document, _splitPointer (pointer))
+
+def _getTokens (document, tokens):
+    """ Get the value at a list of reference tokens. """
+    for token in tokens:
+        document = document[int (token) if isinstance (document, list)
+          else token]
+    return document
+
+def _addPointer (document, pointer, value, undo):
+    """
+    Add a value at a JSON Pointer, returning the document, and adding a
+    function reverting the change to the undo list.
+    """
+    tokens = _splitPointer (pointer)
+    if len (tokens) == 0:
+        return value
+    parent = _getTokens (document, tokens[:-1])
+    if isinstance (parent, list):
+        if tokens[-1] == "-":
+            index = len (parent)
+        else:
+            index = int (tokens[-1])
+            if index < 0 or index > len (parent):
+                raise IndexError ("index out of range " + pointer)
+        parent.insert (index, value)
+        undo.append (lambda: parent.pop (index))
+    else:
+        name = tokens[-1]
+        if name in parent:
+            old = parent[name]
+            parent[name] = value
+            undo.append (lambda: parent.__setitem__ (name, old))
+        else:
+            try:
+                parent[name] = value
+            except KeyError:
+                # a mapping taking only its own names, such as a record,
+                # is replaced by a dict with the new name
+                replaced = dict (parent)
+                replaced[name] = value
+                if len (tokens) == 1:
+                    return replaced
+                holder = _getTokens (document, tokens[:-2])
+                key = tokens[-2]
+                if isinstance (holder, list):
+                    key = int (key)
+                holder[key] = replaced
+                undo.append (lambda: holder.__setitem__ (key, parent))
+                return document
+            undo.append (lambda: parent.__delitem__ (name))
+    return document
+
+def _removePointer (document, pointer, undo):
+    """
+    Remove the value at a JSON Pointer, returning the document, and
+    adding a function reverting the change to the undo list.
+    """
+    tokens = _splitPointer (pointer)
+    if len (tokens) == 0:
+        return None
+    parent = _getTokens (document, tokens[:-1])
+    if isinstance (parent, list):
+        index = int (tokens[-1])
+        if index < 0:
+            raise IndexError ("index out of range " + pointer)
+        old = parent.pop (index)
+        undo.append (lambda: parent.insert (index, old))
+    else:
+        name = tokens[-1]
+        old = parent[name]
+        del parent[name]
+        undo.append (lambda: parent.__setitem__ (name, old))
+    return document
+
+def _rejectJournal (file, position):
+    """
+    Move the journal record at a position, and those after it, to the
+    rejected file, synced before the journal is truncated.
+    Args:
+        file File the journal applies to.
+        position Position of the first record moved, after the header.
+    """
+    journalFile = file + ".wal"
+    lines = _readBytes (journalFile).split (b"\n")[:-1]
+    size = sum (len (line) + 1 for line in lines[:position + 1])
+    try:
+        with open (file + ".wal.rej", "ab") as f:
+            f.write (b"".join (line + b"\n" for line in lines[position + 1:]))
+            f.flush ()
+            fsync (f.fileno ())
+        with open (journalFile, "r+b") as f:
+            f.truncate (size)
+            f.flush ()
+            fsync (f.fileno ())
+    except (IOError, OSError) as e:
+        raise SafeFileError (WRITE_ERROR,
+            MSG_WRITE_ERROR.format (journalFile, e.strerror))
+
+def _detectCompression (raw):
+    """ Compression of an open binary file from its magic bytes. """
+    start = raw.read (6)
+    raw.seek (0)
+    for magic, compression in MAGIC:
+        if start.startswith (magic):
+            return compression
+    return "none"
+
+def _extensionCompression (file):
+    """ Compression for a file name extension, none if not compressed. """
+    for extension, compression in EXTENSIONS.items ():
+        if file.endswith (extension):
+            return compression
+    return "none"
+
+def _fileCompression (file):
+    """
+    Compression for a file being replaced, from the name extension,
+    else the magic bytes of the existing file.
+    """
+    compression = _extensionCompression (file)
+    if compression == "none" and isfile (file):
+        with open (file, "rb") as raw:
+            compression = _detectCompression (raw)
+    return compression
+
+def _openRead (raw, compression):
+    """ UTF-8 text stream reading an open binary file, decompressing. """
+    if compression == "none":
+        return io.TextIOWrapper (io.BufferedReader (raw), encoding="utf8")
+    if compression == "gzip":
+        import gzip
+        stream = gzip.GzipFile (fileobj=raw, mode="rb")
+    elif compression == "lzma":
+        import lzma
+        stream = lzma.LZMAFile (raw, "rb")
+    else:
+        stream = _zstandard ().ZstdDecompressor ().stream_reader (raw,
+          closefd=True)
+    return io.TextIOWrapper (io.BufferedReader (stream), encoding="utf8")
+
+def _openWrite (raw, compression, level):
+    """ Binary stream compressing to an open binary file. """
+    if compression == "gzip":
+        import gzip
+        # no name or time in the header, so output depends on data only
+        return gzip.GzipFile (filename="", mode="wb", fileobj=raw,
+          compresslevel=6 if level is None else level, mtime=0)
+    elif compression == "lzma":
+        import lzma
+        return lzma.LZMAFile (raw, "wb", preset=level)
+    elif compression == "zstd":
+        compressor = _zstandard (WRITE_ERROR).ZstdCompressor (
+          level=3 if level is None else level)
+        return compressor.stream_writer (raw, closefd=False)
+    raise SafeFileError (WRITE_ERROR, MSG_COMPRESSION.format (
+      compression, "unknown"))
+
+def _zstandard (code=READ_ERROR):
+    """ Import zstandard, optional as only needed for zstd files. """
+    try:
+        import zstandard
+        return zstandard
+    except ImportError as e:
+        raise SafeFileError (code, MSG_COMPRESSION.format ("zstd", str (e)))
+
+class _Checksum:
+    """
+    Running checksum and size of bytes.
+    Args:
+        algorithm xxh64 or crc32, None for xxh64 if xxhash is installed.
+    """
+    def __init__ (self, algorithm=None):
+        xxhash = _xxhash ()
+        if algorithm is None:
+            algorithm = "crc32" if xxhash is None else "xxh64"
+        if algorithm == "xxh64" and xxhash is None:
+            raise ValueError ("xxhash is not installed")
+        self.algorithm = algorithm
+        self.size = 0
+        self.crc = 0
+        self.digest = xxhash.xxh64 () if algorithm == "xxh64" else None
+
+    def update (self, data):
+        """ Add bytes to the checksum. """
+        self.size += len (data)
+        if self.digest is None:
+            self.crc = zlib.crc32 (data, self.crc)
+        else:
+            self.digest.update (data)
+
+    def hexdigest (self):
+        """ Checksum as hexadecimal text. """
+        if self.digest is None:
+            return "%08x" % (self.crc & 0xffffffff)
+        return self.digest.hexdigest ()
+
+class _ChecksumWriter (io.RawIOBase):
+    """ Writer passing bytes to a file, adding them to a checksum. """
+    def __init__ (self, raw, checksum):
+        self.raw = raw
+        self.checksum = checksum
+
+    def writable (self):
+        return True
+
+    def write (self, data):
+        self.checksum.update (data)
+        self.raw.write (data)
+        return len (data)
+
+class _HashReader (io.RawIOBase):
+    """ Reader passing bytes from a file, adding them to a hash. """
+    def __init__ (self, raw):
+        self.raw = raw
+        self.hash = hashlib.sha1 ()
+
+    def readable (self):
+        return True
+
+    def readinto (self, buffer):
+        data = self.raw.read (len (buffer))
+        buffer[:len (data)] = data
+        self.hash.update (data)
+        return len (data)
+
+def _xxhash ():
+    """ Import xxhash, None if not installed. """
+    try:
+        import xxhash
+        return xxhash
+    except ImportError:
+        return None
+
+def _writeChecksum (file, written, checksum):
+    """
+    Write the checksum sidecar for a file.
+    Args:
+        file File the checksum is for.
+        written File written, to be renamed to file.
+        checksum Checksum from writeFile.
+    """
+    info = dict (checksum)
+    info["modified"] = _modified (written)
+    temporary = file + ".sum.tmp"
+    with open (temporary, "w") as f:
+        f.write (json.dumps (info))
+    rename (temporary, file + ".sum")
+
+def _readChecksum (file):
+    """ Read the checksum sidecar for a file, None if none or not valid. """
+    try:
+        with open (file + ".sum") as f:
+            info = json.loads (f.read ())
+        _Checksum (info["algorithm"])
+        return info
+    except (IOError, ValueError, KeyError, TypeError):
+        return None
+
+def _unchangedChecksum (file):
+    """
+    Get the recorded checksum of a file, None if none or the file
+    changed since written.
+    """
+    recorded = _readChecksum (file)
+    if recorded is None or _modified (file) != recorded.get ("modified"):
+        return None
+    return recorded
+
+def _dataChecksum (data, algorithm, compression, level):
+    """ Checksum of str or bytes data, as written by writeFile. """
+    checksum = _Checksum (algorithm)
+    _writeData (_DataWriter (None, checksum), data)
+    return { "dataSize": checksum.size, "dataChecksum": checksum.hexdigest (),
+      "compression": compression, "level": level }
+
+def _sameData (checksum, recorded):
+    """ Check if data checksums, compression and level match. """
+    return all (checksum[key] == recorded.get (key) for key in
+      ("dataSize", "dataChecksum", "compression", "level"))
+
+def _writeData (writer, data):
+    """ Write str, bytes, chunks or by function to a data writer. """
+    if isinstance (data, (type (u""), bytes)):
+        for start in range (0, len (data), CHUNK_SIZE):
+            writer.write (data[start:start + CHUNK_SIZE])
+    elif callable (data):
+        data (writer)
+    else:
+        for chunk in data:
+            writer.write (chunk)
+    writer.flush ()
+
+class _DataWriter:
+    """
+    File-like object for data, buffering small text writes into chunks
+    encoded as UTF-8, with a checksum of the bytes written.
+    Args:
+        stream Binary stream to write to, None to only checksum.
+        checksum Checksum of data written.
+    """
+    def __init__ (self, stream, checksum):
+        self.stream = stream
+        self.checksum = checksum
+        self.pending = []
+        self.size = 0
+
+    def write (self, data):
+        """ Write text or bytes. """
+        if isinstance (data, bytes):
+            self.flush ()
+            self._output (data)
+        else:
+            self.pending.append (data)
+            self.size += len (data)
+            if self.size >= CHUNK_SIZE:
+                self.flush ()
+        return len (data)
+
+    def flush (self):
+        """ Encode and write buffered text. """
+        if len (self.pending) > 0:
+            chunk = "".join (self.pending).encode ("utf8")
+            self.pending = []
+            self.size = 0
+            self._output (chunk)
+
+    def _output (self, chunk):
+        self.checksum.update (chunk)
+        if self.stream is not None:
+            self.stream.write (chunk)
+
+def _modified (file):
+    """ Modification time and size of a file, None if missing. """
+    try:
+        info = stat (file)
+    except OSError:
+        return None
+    return [getattr (info, "st_mtime_ns", info.st_mtime), info.st_size]
+
+def _endsWithNewline (file):
+    """ Check if a file is empty or its last byte is a newline. """
+    with open (file, "rb") as f:
+        f.seek (0, 2)
+        if f.tell () == 0:
+            return True
+        f.seek (-1, 2)
+        return f.read (1) == b"\n"
+
+def _readBytes (file):
+    """ Read file content as bytes. """
+    try:
+        with open (file, "rb") as f:
+            return f.read ()
+    except IOError as e:
+        raise SafeFileError (READ_ERROR,
+            MSG_READ_ERROR.format (file, e.strerror))
+
+def _hash (data):
+    """ Hash of file content, to match a journal to its file. """
+    return hashlib.sha1 (data).hexdigest ()
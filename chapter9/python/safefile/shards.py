@@ -0,0 +1,264 @@
+"""
+Sharded storage for large JSON arrays of objects.
+
+The items of an array are split across shard files by the hash of a
+key property, each shard a JSON array managed with safefile rotation,
+and a manifest lists the shards. Shards are read when first needed,
+and only changed shards are rewritten. The order of items across
+shards is not kept.
+
+createShards - Split items into a new sharded layout
+ShardedArray - Read and update items in a sharded layout
+shardsState - Get the combined recovery state of the shards
+recoverShards - Recover shards in parallel
+"""
+from multiprocessing.pool import ThreadPool
+from os.path import basename, dirname, join
+import json
+import zlib
+from safefile import (readFile, safeGetState, safeRecover,
+  safeReadDocument, safeWriteFile, SafeFileError, SAFE_NORMAL,
+  SAFE_RECOVERABLE, SAFE_INTERVENE, DOES_NOT_EXIST, IS_NOT_A_FILE,
+  READ_ERROR, MSG_READ_ERROR)
+
+# manifest file suffix, and default number of shards
+MANIFEST = ".manifest"
+SHARD_COUNT = 16
+MANIFEST_VERSION = 1
+
+def createShards (file, items, key, count=SHARD_COUNT, serialize=None):
+    """
+    Write items as a sharded layout, replacing any existing layout with
+    the same shard count.
+    Args:
+        file Array file name, the manifest is file + MANIFEST.
+        items Iterable of objects.
+        key Property identifying an item, used to assign shards.
+        count Number of shards.
+        serialize Function to convert a shard to text, None for
+          json.dumps.
+    Raises:
+        SafeFileError
+    """
+    shards = [[] for index in range (count)]
+    for item in items:
+        shards[_shardIndex (item[key], count)].append (item)
+
+    if serialize is None:
+        serialize = json.dumps
+    names = [basename (file) + ".%04d" % index for index in range (count)]
+    for name, shard in zip (names, shards):
+        safeWriteFile (join (dirname (file), name), serialize (shard))
+
+    # manifest last, so a partly written layout is not used
+    manifest = { "version": MANIFEST_VERSION, "key": key, "shards": names }
+    safeWriteFile (file + MANIFEST, json.dumps (manifest, indent=2))
+
+class ShardedArray:
+    """
+    Items of a sharded layout, read per shard when first needed.
+    Args:
+        file Array file name, the manifest is file + MANIFEST.
+        serialize Function to convert a shard to text when written,
+          None for json.dumps.
+    Raises:
+        SafeFileError
+    """
+    def __init__ (self, file, serialize=None):
+        self.file = file
+        self.serialize = json.dumps if serialize is None else serialize
+        manifest = safeReadDocument (file + MANIFEST)
+        if manifest.get ("version") != MANIFEST_VERSION:
+            raise SafeFileError (READ_ERROR, MSG_READ_ERROR.format (
+              file + MANIFEST, "unsupported manifest version"))
+        self.key = manifest["key"]
+        self.files = [join (dirname (file), name)
+          for name in manifest["shards"]]
+        # loaded shards, their key to position index, and changed shards
+        self.shards = {}
+        self.indexes = {}
+        self.dirty = set ()
+
+    def __len__ (self):
+        """ Number of items, reading all shards. """
+        return sum (len (self.shard (index))
+          for index in range (len (self.files)))
+
+    def shard (self, index):
+        """ Get the items of a shard, reading it if not loaded. """
+        shard = self.shards.get (index)
+        if shard is None:
+            shard = safeReadDocument (self.files[index])
+            self.shards[index] = shard
+        return shard
+
+    def items (self):
+        """
+        Generate all items, one shard at a time. Shards not already
+        loaded are released after use, so memory holds one shard.
+        """
+        for index in range (len (self.files)):
+            loaded = index in self.shards
+            for item in self.shard (index):
+                yield item
+            if not loaded and index not in self.dirty:
+                self.release (index)
+
+    def get (self, value):
+        """ Get the item with a key value, None if not found. """
+        index = _shardIndex (value, len (self.files))
+        position = self.index (index).get (value)
+        if position is None:
+            return None
+        return self.shard (index)[position]
+
+    def put (self, item):
+        """ Add an item, or replace the item with the same key value. """
+        value = item[self.key]
+        index = _shardIndex (value, len (self.files))
+        positions = self.index (index)
+        shard = self.shard (index)
+        if value in positions:
+            shard[positions[value]] = item
+        else:
+            positions[value] = len (shard)
+            shard.append (item)
+        self.dirty.add (index)
+
+    def remove (self, value):
+        """ Remove the item with a key value, returning False if none. """
+        index = _shardIndex (value, len (self.files))
+        position = self.index (index).get (value)
+        if position is None:
+            return False
+        del self.shard (index)[position]
+        self.indexes.pop (index, None)
+        self.dirty.add (index)
+        return True
+
+    def changed (self, item):
+        """ Mark the shard holding an item, changed in place, as dirty. """
+        self.dirty.add (_shardIndex (item[self.key], len (self.files)))
+
+    def index (self, index):
+        """ Get the key value to position index of a shard. """
+        positions = self.indexes.get (index)
+        if positions is None:
+            positions = dict ((item[self.key], position)
+              for position, item in enumerate (self.shard (index)))
+            self.indexes[index] = positions
+        return positions
+
+    def release (self, index):
+        """ Release a loaded shard, which is read again when needed. """
+        self.shards.pop (index, None)
+        self.indexes.pop (index, None)
+
+    def validate (self, validator, shards=None):
+        """
+        Validate items per shard.
+        Args:
+            validator Validator for the array items schema, such as
+              jsonvalidate.itemsValidator.
+            shards Shard indexes to validate, None for all.
+        Returns:
+            List of (shard file, error) for items not valid.
+        """
+        errors = []
+        if shards is None:
+            shards = range (len (self.files))
+        for index in shards:
+            loaded = index in self.shards
+            for item in self.shard (index):
+                for error in validator.iter_errors (item):
+                    errors.append ((self.files[index], error))
+            if not loaded and index not in self.dirty:
+                self.release (index)
+        return errors
+
+    def flush (self):
+        """
+        Write changed shards with safefile rotation.
+        Returns:
+            Number of shards written.
+        Raises:
+            SafeFileError
+        """
+        written = 0
+        for index in sorted (self.dirty):
+            safeWriteFile (self.files[index], self.serialize (
+              self.shards[index]))
+            written += 1
+        self.dirty = set ()
+        return written
+
+def shardsState (file):
+    """
+    Get the recovery state of a sharded layout, the most severe state of
+    the manifest and its shards.
+    Args:
+        file Array file name.
+    Returns:
+        State, can be an error or recovery state.
+    """
+    states = [safeGetState (shard) for shard in _layoutFiles (file)]
+    for state in (SAFE_INTERVENE, IS_NOT_A_FILE, DOES_NOT_EXIST,
+      SAFE_RECOVERABLE):
+        if state in states:
+            return state
+    return SAFE_NORMAL
+
+def recoverShards (file, jobs=None):
+    """
+    Recover the manifest, then the recoverable shards in parallel.
+    Args:
+        file Array file name.
+        jobs Number of threads, None for the number of processors.
+    Returns:
+        List of shard files that require administrator action.
+    Raises:
+        SafeFileError
+    """
+    manifest = file + MANIFEST
+    if safeGetState (manifest) == SAFE_RECOVERABLE:
+        safeRecover (manifest)
+    files = _layoutFiles (file)[1:]
+
+    # recovery is renames and small reads, so threads overlap the waits
+    pool = ThreadPool (jobs)
+    try:
+        states = pool.map (_recoverShard, files)
+    finally:
+        pool.close ()
+        pool.join ()
+    return [shard for shard, state in zip (files, states)
+      if state == SAFE_INTERVENE]
+
+def _recoverShard (file):
+    """ Recover a shard if recoverable, returning its prior state. """
+    state = safeGetState (file)
+    if state == SAFE_RECOVERABLE:
+        safeRecover (file)
+    return state
+
+def _layoutFiles (file):
+    """ Manifest and shard file names of a sharded layout. """
+    files = [file + MANIFEST]
+    # read without recovery, shard names do not change
+    try:
+        manifest = json.loads (readFile (file + MANIFEST))
+    except (SafeFileError, ValueError):
+        return files
+    return files + [join (dirname (file), name)
+      for name in manifest["shards"]]
+
+def _shardIndex (value, count):
+    """
+    Shard for a key value, stable across runs and platforms. Equal JSON
+    numbers, such as 1 and 1.0, are in the same shard, as they are the
+    same key in the shard index.
+    """
+    if isinstance (value, float) and value.is_integer ():
+        value = int (value)
+    return (zlib.crc32 (json.dumps (value).encode ("utf8")) &
+      0xffffffff) % count